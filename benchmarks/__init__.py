@@ -0,0 +1,3 @@
+"""
+Benchmarks for the conversion functions (run with python -m benchmarks.<name>)
+"""
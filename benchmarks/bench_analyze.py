@@ -0,0 +1,60 @@
+"""
+analyze_image micro-benchmark: color counting and the whole analysis at 1, 12 and 50 MP
+
+    python -m benchmarks.bench_analyze --megapixels 1 12 50
+
+The multi-pass column is the previous analyze_image, which checked alpha,
+grayscale and variance on the full image and only counted colors on a
+sample; its results are asserted equal to the single-pass analysis.
+"""
+import argparse
+
+import numpy as np
+
+from utils.image_analyzer import analyze_image, count_colors
+from utils.pipeline import sample_image
+from .common import flat_logo, timed
+
+
+def sorted_row_count(pixels):
+    """Previous implementation: lexicographic np.unique over RGB rows"""
+    return len(np.unique(pixels.reshape(-1, pixels.shape[2]), axis=0))
+
+
+def multi_pass_analysis(image):
+    """Previous analyze_image checks: full-resolution passes per property"""
+    has_transparency = image.shape[2] in (2, 4) and bool(np.any(image[:, :, -1] < 255))
+    r, g, b = image[:, :, 0], image[:, :, 1], image[:, :, 2]
+    is_grayscale = np.array_equal(r, g) and np.array_equal(g, b)
+    sample = sample_image(image)[:, :, :3]
+    return has_transparency, is_grayscale, count_colors(sample), np.var(sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 12, 50])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'MP':>4} {'image':>6} {'np.unique':>10} {'count_colors':>13} {'multi-pass':>11} {'analyze_image':>14}")
+    for megapixels in args.megapixels:
+        width = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+        height = int(megapixels * 1e6 / width)
+        logo = flat_logo(width, height, n_colors=12)
+        noise = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        for name, image in (('logo', logo), ('photo', noise)):
+            sample = sample_image(image)
+            t_unique, _ = timed(sorted_row_count, sample, repeat=args.repeat)
+            t_count, _ = timed(count_colors, sample, repeat=args.repeat)
+            t_multi, expected = timed(multi_pass_analysis, image, repeat=args.repeat)
+            t_analyze, analysis = timed(analyze_image, image, repeat=args.repeat)
+            assert (analysis['has_transparency'], analysis['is_grayscale'],
+                    analysis['num_colors']) == expected[:3]
+            print(f"{megapixels:>4g} {name:>6} {t_unique * 1000:>8.1f}ms {t_count * 1000:>11.1f}ms "
+                  f"{t_multi * 1000:>9.1f}ms {t_analyze * 1000:>12.1f}ms")
+        del logo, noise
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Batch scaling: process-pool vs thread-pool backend of process_batch
+
+    python -m benchmarks.bench_batch --images 16 --max-workers 8
+"""
+import argparse
+import os
+
+from utils.batch_processor import process_batch, convert_image
+from .common import flat_logo, speckled, timed
+
+
+def make_corpus(count, size):
+    """Alternate speck-heavy scans and flat logos"""
+    corpus = []
+    for i in range(count):
+        if i % 2:
+            image = speckled(size, size * 3 // 4, density=0.004, seed=i)
+        else:
+            image = flat_logo(size, size * 3 // 4, n_colors=8, seed=i)
+        corpus.append((f"image_{i:03d}.png", image))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=16)
+    parser.add_argument('--size', type=int, default=1600, help='Image width in pixels')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.images, args.size)
+    print(f"{len(corpus)} images of {args.size}px, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'thread':>9} {'process':>9} {'img/s thread':>13} {'img/s process':>14}")
+
+    worker_counts = sorted({1, 2, 4, 8, args.max_workers} & set(range(1, args.max_workers + 1)))
+    for workers in worker_counts:
+        t_thread, _ = timed(
+            process_batch, corpus, convert_image,
+            max_workers=workers, backend='thread', method='trace', repeat=args.repeat
+        )
+        t_process, _ = timed(
+            process_batch, corpus, convert_image,
+            max_workers=workers, backend='process', method='trace', repeat=args.repeat
+        )
+        print(f"{workers:>7} {t_thread:>8.2f}s {t_process:>8.2f}s "
+              f"{len(corpus) / t_thread:>13.1f} {len(corpus) / t_process:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Polylines (Douglas-Peucker) vs. fitted cubic Béziers (curves=True)
+
+    python -m benchmarks.bench_curves --megapixels 1 4
+
+Every image is traced as polylines over a range of simplify values and with
+curves over a range of tolerances. Fidelity is measured without an SVG
+renderer: the plain SVG is rasterized with cv2.fillPoly (even-odd, curves
+flattened into 16 segments) at 4x supersampling and averaged down, which
+gives anti-aliased edges like a browser's, and compared with the source image
+as the mean absolute error over the pixels within 2 px of an edge. Contours
+run through the centers of the boundary pixels, half a pixel inside the
+shape; every ring is also outlined 1 px wide in its fill, so that this inset
+(the same for both outputs) does not dominate the error.
+
+The summary matches every curve setting with the smallest polyline trace
+that is at least as faithful and reports how much smaller the curves are.
+"""
+import argparse
+import re
+
+import cv2
+import numpy as np
+
+from utils.svg_converter import png_to_svg_trace
+from .common import flat_logo, line_art, mono_logo, size_for_megapixels, text_page, timed
+
+SUPERSAMPLE = 4
+CURVE_SEGMENTS = 16
+
+BACKGROUND = re.compile(r'<rect [^>]*fill="#([0-9a-f]{6})"')
+PATH_ELEMENT = re.compile(r'<path d="([^"]*)" fill="#([0-9a-f]{6})"')
+
+POLYLINE_SIMPLIFY = (0.5, 1, 1.5, 2, 3)
+CURVE_TOLERANCE = (1, 2, 3)
+
+_T = np.linspace(0, 1, CURVE_SEGMENTS + 1)[1:, None]
+_BERNSTEIN = np.hstack(((1 - _T) ** 3, 3 * _T * (1 - _T) ** 2, 3 * _T ** 2 * (1 - _T), _T ** 3))
+
+
+def flatten(path_data):
+    """Polygon rings of plain path data (M/L/C/Z, absolute)"""
+    rings, ring, command, numbers = [], [], None, []
+    for token in path_data.split():
+        if token in ('M', 'L', 'C', 'Z'):
+            command = token
+            if token == 'Z':
+                rings.append(np.array(ring))
+                ring = []
+            continue
+        numbers.append(float(token))
+        if command in ('M', 'L') and len(numbers) == 2:
+            ring.append(numbers)
+            numbers = []
+        elif command == 'C' and len(numbers) == 6:
+            controls = np.array([ring[-1]] + [numbers[i:i + 2] for i in (0, 2, 4)])
+            ring.extend((_BERNSTEIN @ controls).tolist())
+            numbers = []
+    return rings
+
+
+def render(svg, width, height):
+    """RGB rasterization of a plain traced SVG on white, with anti-aliased edges"""
+    canvas = np.full((height * SUPERSAMPLE, width * SUPERSAMPLE, 3), 255, dtype=np.uint8)
+    background = BACKGROUND.search(svg)
+    if background:
+        canvas[:] = _rgb(background.group(1))
+    for path_data, color in PATH_ELEMENT.findall(svg):
+        fill = _rgb(color)
+        rings = [np.rint((ring + 0.5) * SUPERSAMPLE - 0.5).astype(np.int32) for ring in flatten(path_data)]
+        cv2.fillPoly(canvas, rings, fill)
+        cv2.polylines(canvas, rings, True, fill, SUPERSAMPLE)
+    return cv2.resize(canvas, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def _rgb(hex_color):
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def edge_error(rendered, image, edges):
+    """Mean absolute error (0-255) over the edge band"""
+    difference = cv2.absdiff(rendered, image).mean(axis=2)
+    return float(difference[edges].mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'image':<9} {'output':<13} {'points':>8} {'bytes':>9} {'compact':>9} "
+          f"{'trace':>9} {'edge error':>11}")
+    summary = []
+    for megapixels in args.megapixels:
+        width, height = size_for_megapixels(megapixels)
+        for name, image, options in (
+            ('logo', mono_logo(width, height), {'invert': True, 'holes': True}),
+            ('logo_8c', flat_logo(width, height), {'mode': 'quantize', 'n_colors': 8}),
+            ('line_art', line_art(width, height), {'invert': True, 'holes': True}),
+            ('text', text_page(width, height), {'invert': True, 'holes': True}),
+        ):
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            edges = cv2.dilate(cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, None), np.ones((3, 3), np.uint8)) > 16
+            edges = cv2.dilate(edges.view(np.uint8), np.ones((3, 3), np.uint8)) > 0
+
+            results = []
+            settings = [('polyline', s, {'simplify': s}) for s in POLYLINE_SIMPLIFY]
+            settings += [('curves', t, {'simplify': t, 'curves': True}) for t in CURVE_TOLERANCE]
+            for kind, value, extra in settings:
+                trace_seconds, (svg, _) = timed(png_to_svg_trace, image, tile_size=0, repeat=args.repeat,
+                                                **options, **extra)
+                compact, _ = png_to_svg_trace(image, tile_size=0, compact=True, **options, **extra)
+                error = edge_error(render(svg, width, height), image, edges)
+                points = len(re.findall(r'-?\d+ -?\d+', svg)) - 1
+                results.append((kind, value, len(svg), len(compact), error))
+                print(f"{megapixels:>4g} {name:<9} {kind + ' ' + format(value, 'g'):<13} {points:>8} "
+                      f"{len(svg) / 1024:>6.0f} KB {len(compact) / 1024:>6.0f} KB "
+                      f"{trace_seconds * 1000:>6.0f} ms {error:>11.2f}")
+
+            for kind, value, size, compact_size, error in results:
+                if kind != 'curves':
+                    continue
+                matches = [r for r in results if r[0] == 'polyline' and r[4] <= error]
+                if matches:
+                    best = min(matches, key=lambda r: r[2])
+                    summary.append(f"{megapixels:>4g} {name:<9} curves {value:g} (error {error:.2f}): "
+                                   f"{best[2] / size:.1f}x smaller than polyline {best[1]:g} "
+                                   f"(error {best[4]:.2f}), {best[3] / compact_size:.1f}x compact")
+                else:
+                    summary.append(f"{megapixels:>4g} {name:<9} curves {value:g} (error {error:.2f}): "
+                                   f"more faithful than every polyline trace")
+    print()
+    print('\n'.join(summary))
+
+
+if __name__ == '__main__':
+    main()
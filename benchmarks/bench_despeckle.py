@@ -0,0 +1,72 @@
+"""
+Speck removal before tracing and bulk contour culling
+
+    python -m benchmarks.bench_despeckle --megapixels 1 4
+
+For every image and despeckle area the report shows the contours found, the
+paths emitted, SVG bytes and trace time. The culling rows compare the
+per-contour filter the CLI used to run (len, then cv2.contourArea, one
+contour at a time) with utils.speck_filter.cull_contours on the raw contours
+of the same mask.
+"""
+import argparse
+
+import cv2
+
+from utils.speck_filter import cull_contours
+from utils.svg_converter import png_to_svg_trace
+from .common import dusty, flat_logo, size_for_megapixels, speckled, text_page, timed
+
+DESPECKLE = (0, 4, 16, 64)
+
+# CLI filter: more than 3 points, more than 50 px enclosed
+CULL_MIN_POINTS = 3
+CULL_MIN_AREA = 50
+
+
+def cull_loop(contours, min_points, min_area):
+    """Per-contour filter as a Python loop"""
+    return [i for i, contour in enumerate(contours)
+            if len(contour) > min_points and cv2.contourArea(contour) > min_area]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'image':<10} {'despeckle':>9} {'contours':>9} {'paths':>7} {'bytes':>9} {'trace':>9}")
+    culling = []
+    for megapixels in args.megapixels:
+        width, height = size_for_megapixels(megapixels)
+        for name, image, options in (
+            ('specks', speckled(width, height), {}),
+            ('text+dust', dusty(text_page(width, height)), {'invert': True, 'holes': True}),
+            ('logo_8c', flat_logo(width, height), {'mode': 'quantize', 'n_colors': 8}),
+        ):
+            for despeckle in DESPECKLE:
+                trace_seconds, (svg, contours) = timed(png_to_svg_trace, image, tile_size=0, repeat=args.repeat,
+                                                       despeckle=despeckle, **options)
+                print(f"{megapixels:>4g} {name:<10} {despeckle:>9} {contours:>9} {svg.count('<path'):>7} "
+                      f"{len(svg) / 1024:>6.0f} KB {trace_seconds * 1000:>6.0f} ms")
+
+            if options.get('mode') == 'quantize':
+                continue
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            kind = cv2.THRESH_BINARY_INV if options.get('invert') else cv2.THRESH_BINARY
+            _, binary = cv2.threshold(gray, 128, 255, kind)
+            contours, _ = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+            loop_seconds, expected = timed(cull_loop, contours, CULL_MIN_POINTS, CULL_MIN_AREA,
+                                           repeat=args.repeat)
+            bulk_seconds, kept = timed(cull_contours, contours, CULL_MIN_POINTS, CULL_MIN_AREA,
+                                       repeat=args.repeat)
+            assert kept.tolist() == expected
+            culling.append(f"{megapixels:>4g} {name:<10} {len(contours):>9} contours, {len(kept):>7} kept: "
+                           f"loop {loop_seconds * 1000:>6.1f} ms, bulk {bulk_seconds * 1000:>6.1f} ms")
+    print()
+    print('\n'.join(culling))
+
+
+if __name__ == '__main__':
+    main()
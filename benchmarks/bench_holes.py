@@ -0,0 +1,98 @@
+"""
+Hole handling: outer contours only, nested contours painted on top, and
+compound evenodd paths (holes=True)
+
+    python -m benchmarks.bench_holes --megapixels 1 4
+
+For every style the report shows <path> elements, SVG bytes, trace time, a
+render proxy and fidelity. No SVG renderer is required: rendering is
+approximated by rasterizing every <path> in document order with
+cv2.fillPoly (even-odd, like fill-rule="evenodd"). Overdraw is the painted
+area of all paths divided by the image area. Fidelity is the share of pixels
+whose rendered ink/paper state matches the thresholded image.
+"""
+import argparse
+import re
+from functools import partial
+
+import cv2
+import numpy as np
+
+from utils.pipeline import ConversionPipeline
+from utils.svg_writer import join_svg
+from .common import line_art, noisy_scan, size_for_megapixels, text_page, timed
+
+PATH_ELEMENT = re.compile(r'<path d="([^"]*)" fill="#([0-9a-f]{6})"')
+NUMBER = re.compile(r'-?\d+')
+
+CLI_STYLE = {'retrieval': 'tree', 'min_points': 3, 'min_area': 50, 'min_approx_points': 2,
+             'sample_gray': True, 'background': 'white', 'path_attrs': ''}
+
+# (label, pipeline style, holes)
+STYLES = (
+    ('external', {}, False),
+    ('external+holes', {}, True),
+    ('cli tree', CLI_STYLE, False),
+    ('cli holes', CLI_STYLE, True),
+)
+
+
+def parse_paths(svg):
+    """[(rings, gray value)] for every <path>, rings as int32 (N, 2) arrays"""
+    paths = []
+    for data, color in PATH_ELEMENT.findall(svg):
+        rings = [np.array(NUMBER.findall(ring), dtype=np.int32).reshape(-1, 2)
+                 for ring in data.split('M')[1:]]
+        paths.append((rings, int(color[:2], 16)))
+    return paths
+
+
+def render(paths, width, height, background):
+    """Paint all paths in order like a renderer would; returns the canvas"""
+    canvas = np.full((height, width), background, dtype=np.uint8)
+    for rings, value in paths:
+        cv2.fillPoly(canvas, rings, value)
+    return canvas
+
+
+def painted_area(paths):
+    """Pixels painted by all paths together (outline minus holes per path)"""
+    total = 0.0
+    for rings, _ in paths:
+        areas = [cv2.contourArea(ring) for ring in rings]
+        total += areas[0] - sum(areas[1:])
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'image':<9} {'style':<15} {'paths':>7} {'bytes':>9} {'trace':>9} "
+          f"{'render':>9} {'overdraw':>9} {'fidelity':>9}")
+    for megapixels in args.megapixels:
+        width, height = size_for_megapixels(megapixels)
+        for name, image in (
+            ('text', text_page(width, height)),
+            ('scan', noisy_scan(width, height)),
+            ('line_art', line_art(width, height)),
+        ):
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            ink = gray < 128
+            for label, style, holes in STYLES:
+                pipeline = ConversionPipeline(**style)
+                # Dark ink on light paper: the ink is the foreground
+                trace = partial(pipeline.trace, image, invert=True, tile_size=0, holes=holes)
+                trace_seconds, result = timed(lambda: join_svg(trace().chunks), repeat=args.repeat)
+                paths = parse_paths(result)
+                render_seconds, canvas = timed(render, paths, width, height, 255, repeat=args.repeat)
+                fidelity = np.mean((canvas < 128) == ink)
+                print(f"{megapixels:>4g} {name:<9} {label:<15} {len(paths):>7} {len(result) / 1024:>6.0f} KB "
+                      f"{trace_seconds * 1000:>6.0f} ms {render_seconds * 1000:>6.1f} ms "
+                      f"{painted_area(paths) / (width * height):>8.2f}x {fidelity:>9.2%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Multi-color tracing: one quantized trace vs. N separate threshold runs
+
+    python -m benchmarks.bench_quantize --colors 4 8 16 --size 2000
+"""
+import argparse
+
+import numpy as np
+
+from utils.svg_converter import png_to_svg_trace
+from .common import flat_logo, timed
+
+
+def threshold_runs(image_array, n_colors, simplify):
+    """What users do today: one threshold trace per expected color level"""
+    return [
+        png_to_svg_trace(image_array, threshold=int(t), simplify=simplify)
+        for t in np.linspace(0, 255, n_colors + 1)[1:-1]
+    ] or [png_to_svg_trace(image_array, simplify=simplify)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--colors', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--size', type=int, default=2000, help='Longest edge in pixels')
+    parser.add_argument('--simplify', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'colors':>6} {'N x threshold':>14} {'quantize':>10} {'speedup':>8} {'paths':>6}")
+    for n_colors in args.colors:
+        image = flat_logo(args.size, args.size * 3 // 4, n_colors)
+        t_threshold, _ = timed(threshold_runs, image, n_colors, args.simplify, repeat=args.repeat)
+        t_quantize, (svg, _) = timed(
+            png_to_svg_trace, image, simplify=args.simplify,
+            mode='quantize', n_colors=n_colors, repeat=args.repeat
+        )
+        print(f"{n_colors:>6} {t_threshold:>13.3f}s {t_quantize:>9.3f}s "
+              f"{t_threshold / t_quantize:>7.1f}x {svg.count('<path'):>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Plain vs. compact SVG output: bytes, gzip bytes and parse-time proxies
+
+    python -m benchmarks.bench_svg_output --megapixels 1 4
+
+Browser parse cost is approximated by two timings: building the XML tree
+(ElementTree, scales with elements and attribute bytes) and tokenizing all
+path data (regex over every "d" attribute, scales with commands and numbers).
+"""
+import argparse
+import re
+import xml.etree.ElementTree as ET
+import zlib
+
+from utils.svg_converter import png_to_svg_trace
+from utils.svg_writer import GZIP_WBITS
+from .common import flat_logo, line_art, noisy_scan, photo, size_for_megapixels, speckled, timed
+
+PATH_TOKEN = re.compile(r'[MLZmlz]|-?\d+')
+
+
+def gzip_size(svg):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, GZIP_WBITS)
+    return len(compressor.compress(svg.encode()) + compressor.flush())
+
+
+def tokenize_paths(root):
+    """Number of path data tokens in a parsed document"""
+    return sum(len(PATH_TOKEN.findall(el.get('d'))) for el in root.iter() if el.get('d') is not None)
+
+
+def measure(svg, repeat):
+    """(bytes, gzip bytes, elements, xml parse seconds, path tokenize seconds)"""
+    xml_seconds, root = timed(ET.fromstring, svg, repeat=repeat)
+    token_seconds, _ = timed(tokenize_paths, root, repeat=repeat)
+    return len(svg), gzip_size(svg), sum(1 for _ in root.iter()), xml_seconds, token_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'image':<9} {'mode':<9} {'format':<8} {'bytes':>10} {'gzip':>9} "
+          f"{'elements':>9} {'xml parse':>10} {'tokenize':>9}")
+    for megapixels in args.megapixels:
+        width, height = size_for_megapixels(megapixels)
+        for name, image in (
+            ('logo', flat_logo(width, height)),
+            ('line_art', line_art(width, height)),
+            ('scan', noisy_scan(width, height)),
+            ('photo', photo(width, height)),
+            ('specks', speckled(width, height, density=0.004)),
+        ):
+            for mode in ('threshold', 'quantize'):
+                baseline = None
+                for compact in (False, True):
+                    svg, _ = png_to_svg_trace(image, mode=mode, compact=compact)
+                    size, gz, elements, xml_seconds, token_seconds = measure(svg, args.repeat)
+                    ratio = f" ({size / baseline:.0%})" if baseline else ''
+                    baseline = baseline or size
+                    print(f"{megapixels:>4g} {name:<9} {mode:<9} {'compact' if compact else 'plain':<8} "
+                          f"{size / 1024:>7.0f} KB {gz / 1024:>6.0f} KB {elements:>9} "
+                          f"{xml_seconds * 1000:>7.1f} ms {token_seconds * 1000:>6.1f} ms{ratio}")
+
+
+if __name__ == '__main__':
+    main()
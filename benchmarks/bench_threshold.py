@@ -0,0 +1,92 @@
+"""
+Fixed vs. automatic thresholds (otsu, triangle, adaptive)
+
+    python -m benchmarks.bench_threshold --megapixels 1 4
+
+Every image is traced evenly lit and under uneven light (a shadow towards one
+corner), with a sweep of fixed thresholds and with the automatic methods. The
+report shows the threshold used, paths, trace time and fidelity: the traced
+shapes are filled into a mask (even-odd, as they render) and compared with
+the ink of the evenly lit original as intersection over union, so a
+threshold that loses strokes in the shadow or turns the shadow into ink
+scores low either way. The last rows time the sampled histogram the global
+methods work on against cv2's Otsu on every pixel.
+"""
+import argparse
+
+import cv2
+import numpy as np
+
+from utils.auto_threshold import select_threshold
+from utils.pipeline import image_histogram
+from utils.svg_converter import png_to_svg_trace
+from .bench_curves import PATH_ELEMENT, flatten
+from .common import line_art, size_for_megapixels, text_page, timed, unevenly_lit
+
+FIXED = (64, 96, 128, 160, 192)
+METHODS = ('otsu', 'triangle', 'adaptive')
+
+# Ink of the evenly lit originals (dark strokes on light paper)
+INK_LEVEL = 128
+
+
+def painted_mask(svg, width, height):
+    """Pixels covered by the traced paths"""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for path_data, _ in PATH_ELEMENT.findall(svg):
+        shape = np.zeros_like(mask)
+        cv2.fillPoly(shape, [np.rint(ring).astype(np.int32) for ring in flatten(path_data)], 255)
+        mask |= shape
+    return mask > 0
+
+
+def intersection_over_union(painted, ink):
+    union = np.count_nonzero(painted | ink)
+    return np.count_nonzero(painted & ink) / union if union else 1.0
+
+
+def full_otsu(image):
+    """Otsu's threshold of every pixel (cv2)"""
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'image':<15} {'threshold':<10} {'chosen':>6} {'paths':>7} {'trace':>9} {'IoU':>7}")
+    histograms = []
+    for megapixels in args.megapixels:
+        width, height = size_for_megapixels(megapixels)
+        for name, original in (('text', text_page(width, height)), ('line_art', line_art(width, height))):
+            ink = cv2.cvtColor(original, cv2.COLOR_RGB2GRAY) < INK_LEVEL
+            for lighting, image in (('', original), (' shadow', unevenly_lit(original))):
+                histogram = image_histogram(image)
+                for threshold in FIXED + METHODS:
+                    # Fixed thresholds trace the dark ink; the methods pick
+                    # the polarity themselves (the smaller class)
+                    invert = not isinstance(threshold, str)
+                    trace_seconds, (svg, _) = timed(png_to_svg_trace, image, threshold=threshold, invert=invert,
+                                                    holes=True, tile_size=0, repeat=args.repeat)
+                    chosen = threshold
+                    if threshold in ('otsu', 'triangle'):
+                        chosen = select_threshold(threshold, histogram)
+                    elif threshold == 'adaptive':
+                        chosen = 'local'
+                    fidelity = intersection_over_union(painted_mask(svg, width, height), ink)
+                    print(f"{megapixels:>4g} {name + lighting:<15} {threshold!s:<10} {chosen!s:>6} "
+                          f"{svg.count('<path'):>7} {trace_seconds * 1000:>6.0f} ms {fidelity:>7.1%}")
+
+            sample_seconds, _ = timed(image_histogram, original, repeat=args.repeat)
+            full_seconds, _ = timed(full_otsu, original, repeat=args.repeat)
+            histograms.append(f"{megapixels:>4g} {name:<15} sampled histogram {sample_seconds * 1000:>6.1f} ms, "
+                              f"cv2 Otsu on every pixel {full_seconds * 1000:>6.1f} ms")
+    print()
+    print('\n'.join(histograms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Tiled vs whole-image threshold tracing: time, peak NumPy memory, identical output
+
+    python -m benchmarks.bench_tiled --megapixels 12 50 --tile-size 2048
+"""
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from utils.svg_converter import png_to_svg_trace
+from .common import flat_logo, speckled, timed
+
+
+def traced_peak(func, *args, **kwargs):
+    """Peak memory of NumPy/OpenCV output allocations during one call"""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[12, 50])
+    parser.add_argument('--tile-size', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'image':>6} {'whole':>9} {'tiled':>9} {'whole peak':>11} {'tiled peak':>11} same")
+    for megapixels in args.megapixels:
+        width = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+        height = int(megapixels * 1e6 / width)
+        for name, image in (
+            ('logo', flat_logo(width, height, n_colors=6)),
+            ('scan', speckled(width, height, density=0.002)),
+        ):
+            t_whole, whole = timed(png_to_svg_trace, image, repeat=args.repeat, tile_size=0)
+            t_tiled, tiled = timed(png_to_svg_trace, image, repeat=args.repeat, tile_size=args.tile_size)
+            peak_whole = traced_peak(png_to_svg_trace, image, tile_size=0)
+            peak_tiled = traced_peak(png_to_svg_trace, image, tile_size=args.tile_size)
+            print(f"{megapixels:>4g} {name:>6} {t_whole:>8.2f}s {t_tiled:>8.2f}s "
+                  f"{peak_whole / 2**20:>9.0f}MB {peak_tiled / 2**20:>9.0f}MB {whole == tiled}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Shared helpers for benchmarks: deterministic synthetic images and timing
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+def flat_logo(width, height, n_colors=8, seed=0, antialias=True):
+    """Logo-like RGB image made of n_colors flat filled shapes"""
+    rng = np.random.default_rng(seed)
+    palette = rng.integers(0, 256, (n_colors, 3), dtype=np.uint8)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = palette[0]
+    scale = min(width, height)
+    line_type = cv2.LINE_AA if antialias else cv2.LINE_8
+    for i in range(1, n_colors):
+        color = tuple(int(c) for c in palette[i])
+        for _ in range(3):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            radius = int(rng.integers(scale // 20, scale // 5))
+            if rng.random() < 0.5:
+                cv2.circle(image, center, radius, color, -1, line_type)
+            else:
+                cv2.rectangle(image, center, (center[0] + radius, center[1] + radius // 2), color, -1, line_type)
+    return image
+
+
+def mono_logo(width, height, n_shapes=12, seed=0):
+    """Black anti-aliased logo shapes (discs, rings, rounded bars) on white"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    scale = min(width, height)
+    for _ in range(n_shapes):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(scale // 25, scale // 6))
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cv2.circle(image, center, radius, (0, 0, 0), -1, cv2.LINE_AA)
+        elif kind == 1:
+            cv2.circle(image, center, radius, (0, 0, 0), max(2, radius // 4), cv2.LINE_AA)
+        else:
+            end = (center[0] + radius * 2, center[1] + int(rng.integers(-radius, radius)))
+            cv2.line(image, center, end, (0, 0, 0), max(3, radius // 3), cv2.LINE_AA)
+    return image
+
+
+def speckled(width, height, density=0.01, seed=0):
+    """Bright random specks on a mid-gray background (many small contours)"""
+    rng = np.random.default_rng(seed)
+    specks = (rng.random((height, width)) < density).astype(np.uint8)
+    specks = cv2.dilate(specks, np.ones((3, 3), np.uint8))
+    colors = rng.integers(200, 256, (height, width, 3), dtype=np.uint8)
+    return np.where(specks[..., None] > 0, colors, 128).astype(np.uint8)
+
+
+def line_art(width, height, n_strokes=60, seed=0):
+    """Black anti-aliased strokes and outlines on white (drawings, icons)"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    scale = min(width, height)
+    for _ in range(n_strokes):
+        thickness = int(rng.integers(1, max(2, scale // 200) + 2))
+        points = rng.integers(0, (width, height), (int(rng.integers(2, 6)), 2)).astype(np.int32)
+        if rng.random() < 0.3:
+            radius = int(rng.integers(scale // 40, scale // 6))
+            cv2.circle(image, tuple(int(c) for c in points[0]), radius, (0, 0, 0), thickness, cv2.LINE_AA)
+        else:
+            cv2.polylines(image, [points], False, (0, 0, 0), thickness, cv2.LINE_AA)
+    return image
+
+
+def noisy_scan(width, height, seed=0):
+    """Scanned page: dark text-like blocks on gray paper with sensor noise"""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 225, dtype=np.int16)
+    line_height = max(8, height // 60)
+    for top in range(line_height * 2, height - line_height * 2, line_height * 2):
+        x = width // 12
+        while x < width - width // 12:
+            word = int(rng.integers(line_height, line_height * 6))
+            page[top:top + line_height, x:x + word] = 40
+            x += word + line_height
+    page += rng.normal(0, 14, page.shape).astype(np.int16)
+    gray = cv2.GaussianBlur(np.clip(page, 0, 255).astype(np.uint8), (3, 3), 0)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+
+def text_page(width, height, seed=0):
+    """Scanned text: real glyphs (many with counters, e.g. O, B, a, e) on paper with noise"""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 230, dtype=np.uint8)
+    alphabet = 'ABDOPQRabdegopq0689 ' + 'CEFHIKLMNSTUVWXYZcfhiklmnrstuvwxyz '
+    line_height = max(12, height // 50)
+    font_scale = line_height / 30
+    thickness = max(1, line_height // 10)
+    for baseline in range(line_height * 2, height - line_height, int(line_height * 1.6)):
+        chars = rng.integers(0, len(alphabet), max(1, width // line_height))
+        text = ''.join(alphabet[i] for i in chars)
+        cv2.putText(page, text, (width // 20, baseline), cv2.FONT_HERSHEY_DUPLEX, font_scale, 30, thickness,
+                    cv2.LINE_AA)
+    noisy = page.astype(np.int16) + rng.normal(0, 8, page.shape).astype(np.int16)
+    return cv2.cvtColor(np.clip(noisy, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2RGB)
+
+
+def dusty(image, density=0.002, seed=0):
+    """Copy of a dark-on-light image with dust: dark dots on the paper, light pinholes in the ink"""
+    rng = np.random.default_rng(seed)
+    height, width = image.shape[:2]
+    dusted = image.copy()
+    gray = image.mean(axis=2) if image.ndim == 3 else image
+    count = int(width * height * density)
+    ys, xs = rng.integers(0, height, count), rng.integers(0, width, count)
+    sizes = rng.integers(1, 4, count)
+    for x, y, size in zip(xs.tolist(), ys.tolist(), sizes.tolist()):
+        value = 255 if gray[y, x] < 128 else 20
+        dusted[y:y + size, x:x + size] = value
+    return dusted
+
+
+def unevenly_lit(image, darkest=0.45):
+    """Copy of an image under uneven light: a shadow falling off from bright top left to dim bottom right"""
+    height, width = image.shape[:2]
+    ys, xs = np.ogrid[0:1:height * 1j, 0:1:width * 1j]
+    light = 1 - (1 - darkest) * np.clip((xs + ys) / 2, 0, 1) ** 1.5
+    if image.ndim == 3:
+        light = light[..., None]
+    return np.clip(image * light, 0, 255).astype(np.uint8)
+
+
+def photo(width, height, seed=0):
+    """Photo-like image: smooth low-frequency color field plus fine grain"""
+    rng = np.random.default_rng(seed)
+    field = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    image = cv2.resize(field, (width, height), interpolation=cv2.INTER_CUBIC).astype(np.int16)
+    image += rng.normal(0, 6, (height, width, 1)).astype(np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def sparse(width, height, n_shapes=40, seed=0):
+    """Huge, almost empty canvas with a few small dark shapes"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    radius = max(4, min(width, height) // 200)
+    for _ in range(n_shapes):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = tuple(int(c) for c in rng.integers(0, 100, 3))
+        cv2.circle(image, center, radius, color, -1, cv2.LINE_AA)
+    return image
+
+
+def size_for_megapixels(megapixels, aspect=4 / 3):
+    """(width, height) with about megapixels * 1e6 pixels"""
+    width = int(np.sqrt(megapixels * 1e6 * aspect))
+    return width, int(megapixels * 1e6 / width)
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """
+    Run func repeatedly and return (best_seconds, last_result)
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
@@ -0,0 +1,510 @@
+"""
+Reproducible benchmark suite: every public conversion function and the CLI
+on a deterministic synthetic corpus, with JSON results and regression checks
+
+    python -m benchmarks.suite run --preset standard --out results.json
+    python -m benchmarks.suite compare baseline.json results.json --tolerance 0.1
+
+Every (task, image) case runs in a fresh process, so peak RSS is the peak of
+that case alone (the CLI tasks report the peak of the CLI child process).
+The corpus is regenerated from fixed seeds in each process; nothing is
+downloaded or read from disk.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak RSS is not reported
+    resource = None
+
+from . import common
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(REPO_ROOT, 'png2svg_cli.py')
+
+KINDS = {
+    'logo': common.flat_logo,
+    'line_art': common.line_art,
+    'scan': common.noisy_scan,
+    'photo': common.photo,
+    'sparse': common.sparse,
+    'specks': common.speckled,
+}
+
+# (image kind, megapixels) pairs per preset; the huge sparse image stands in
+# for scans of mostly blank pages
+PRESETS = {
+    'quick': [(kind, 0.25) for kind in KINDS],
+    'standard': [(kind, mp) for mp in (1, 8) for kind in KINDS if kind != 'sparse']
+                + [('sparse', 1), ('sparse', 32)],
+    'full': [(kind, mp) for mp in (1, 8, 24) for kind in KINDS if kind != 'sparse']
+            + [('sparse', 1), ('sparse', 100)],
+}
+
+# Images converted per batch task (each a different seed at 1/BATCH_IMAGES
+# of the case size)
+BATCH_IMAGES = 8
+
+# Differences below these are noise, whatever the relative change
+MIN_SECONDS_DELTA = 0.005
+MIN_RSS_DELTA_MB = 8
+
+
+def make_image(kind, megapixels, seed=0):
+    """Deterministic corpus image of the given kind and size"""
+    width, height = common.size_for_megapixels(megapixels)
+    return KINDS[kind](width, height, seed=seed)
+
+
+def _encode(image, format, **params):
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def _contours(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    _, binary = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+
+def _cli(*args):
+    subprocess.run([sys.executable, CLI_PATH, *args], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=REPO_ROOT)
+
+
+# Each task takes (image, kind, megapixels, workdir), prepares its inputs
+# untimed and returns a zero-argument callable. For tasks in _SVG_TASKS the
+# callable's result (SVG text, output path or batch results) gives svg_bytes.
+
+def _task_analyze(image, kind, megapixels, workdir):
+    from utils.image_analyzer import analyze_image
+    return lambda: analyze_image(image)
+
+
+def _task_count_colors(image, kind, megapixels, workdir):
+    from utils.image_analyzer import count_colors
+    return lambda: count_colors(image)
+
+
+def _task_quantize(image, kind, megapixels, workdir):
+    from utils.quantize import quantize_image
+    return lambda: quantize_image(image, n_colors=8)
+
+
+def _task_trace(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=0)
+
+
+def _task_trace_tiled(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=1024)
+
+
+def _task_trace_compact(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=0, compact=True)
+
+
+def _task_trace_holes(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=0, holes=True)
+
+
+def _task_trace_curves(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=0, curves=True)
+
+
+def _task_trace_despeckle(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=0, despeckle=16)
+
+
+def _task_trace_auto_threshold(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=0, threshold='otsu')
+
+
+def _task_trace_adaptive(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, tile_size=0, threshold='adaptive')
+
+
+def _task_trace_quantize(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_trace
+    return lambda: png_to_svg_trace(image, mode='quantize', n_colors=8)
+
+
+def _task_retrace_simplify(image, kind, megapixels, workdir):
+    # A simplify slider change: contours and colors come from the trace memo
+    from utils.svg_converter import png_to_svg_trace
+    from utils.trace_memo import configure_trace_memo
+    configure_trace_memo()
+    png_to_svg_trace(image, simplify=2, tile_size=0)
+    return lambda: png_to_svg_trace(image, simplify=3, tile_size=0)
+
+
+def _task_retrace_threshold(image, kind, megapixels, workdir):
+    # A threshold slider change: a new threshold on every call, gray plane memoized
+    from utils.svg_converter import png_to_svg_trace
+    from utils.trace_memo import configure_trace_memo
+    configure_trace_memo()
+    png_to_svg_trace(image, tile_size=0)
+    thresholds = iter(range(129, 256))
+    return lambda: png_to_svg_trace(image, threshold=next(thresholds), tile_size=0)
+
+
+def _task_trace_tiled_raw(image, kind, megapixels, workdir):
+    from utils.tiled_trace import trace_tiled
+    return lambda: trace_tiled(image, tile_size=1024)
+
+
+def _task_sample_colors(image, kind, megapixels, workdir):
+    from utils.color_sampling import sample_contour_colors
+    contours = _contours(image)
+    return lambda: sample_contour_colors(image, contours)
+
+
+def _task_svg_writer(image, kind, megapixels, workdir):
+    from utils.svg_writer import iter_path_data, iter_svg, join_svg
+    contours = _contours(image)
+    height, width = image.shape[:2]
+    return lambda: join_svg(iter_svg(width, height, ((d, '#000000') for d in iter_path_data(contours))))
+
+
+def _task_embed_array(image, kind, megapixels, workdir):
+    from utils.svg_converter import png_to_svg_embed
+    return lambda: png_to_svg_embed(image)
+
+
+def _task_embed_file(image, kind, megapixels, workdir):
+    from utils.svg_converter import file_to_svg_embed
+    data = _encode(image, 'JPEG', quality=90)
+    return lambda: file_to_svg_embed(data)
+
+
+def _task_load_png(image, kind, megapixels, workdir):
+    from utils.image_io import load_image
+    path = os.path.join(workdir, 'input.png')
+    Image.fromarray(image).save(path)
+    return lambda: load_image(path)
+
+
+def _task_load_bmp(image, kind, megapixels, workdir):
+    from utils.image_io import load_image
+    path = os.path.join(workdir, 'input.bmp')
+    Image.fromarray(image).save(path)
+    # Sample pixels across the whole image so the mapped pages are really read
+    return lambda: int(load_image(path)[::64, ::64].sum())
+
+
+def _batch_corpus(kind, megapixels):
+    return [(f"{kind}_{i}.png", make_image(kind, megapixels / BATCH_IMAGES, seed=i))
+            for i in range(BATCH_IMAGES)]
+
+
+def _task_batch(image, kind, megapixels, workdir):
+    from utils.batch_processor import convert_image, process_batch
+    corpus = _batch_corpus(kind, megapixels)
+    return lambda: process_batch(corpus, convert_image, max_workers=os.cpu_count() or 1,
+                                 backend='process', method='trace')
+
+
+def _task_zip(image, kind, megapixels, workdir):
+    from utils.batch_processor import convert_image, create_zip_archive, process_batch
+    results = process_batch(_batch_corpus(kind, megapixels), convert_image,
+                            backend='thread', method='trace')
+    return lambda: create_zip_archive(results)
+
+
+def _task_cli_trace(image, kind, megapixels, workdir):
+    source = os.path.join(workdir, 'input.png')
+    output = os.path.join(workdir, 'output.svg')
+    Image.fromarray(image).save(source)
+    return lambda: _cli(source, output) or output
+
+
+def _task_cli_embed(image, kind, megapixels, workdir):
+    source = os.path.join(workdir, 'input.jpg')
+    output = os.path.join(workdir, 'output.svg')
+    Image.fromarray(image).save(source, quality=90)
+    return lambda: _cli(source, output, '-m', 'embed') or output
+
+
+def _task_cli_batch(image, kind, megapixels, workdir):
+    input_dir = os.path.join(workdir, 'in')
+    os.makedirs(input_dir)
+    for name, batch_image in _batch_corpus(kind, megapixels):
+        Image.fromarray(batch_image).save(os.path.join(input_dir, name))
+    output_dir = os.path.join(workdir, 'out')
+    # --force: every repeat converts again instead of skipping done jobs
+    return lambda: _cli('batch', input_dir, '-o', output_dir, '--force')
+
+
+# name: (setup, images per call, kinds or None for all)
+TASKS = {
+    'analyze_image': (_task_analyze, 1, None),
+    'count_colors': (_task_count_colors, 1, None),
+    'quantize_image': (_task_quantize, 1, ('logo', 'photo', 'line_art')),
+    'trace': (_task_trace, 1, None),
+    'trace_tiled': (_task_trace_tiled, 1, None),
+    'trace_compact': (_task_trace_compact, 1, None),
+    'trace_holes': (_task_trace_holes, 1, None),
+    'trace_curves': (_task_trace_curves, 1, ('logo', 'line_art')),
+    'trace_despeckle': (_task_trace_despeckle, 1, ('scan', 'specks')),
+    'trace_auto_threshold': (_task_trace_auto_threshold, 1, ('scan', 'line_art')),
+    'trace_adaptive': (_task_trace_adaptive, 1, ('scan', 'line_art')),
+    'trace_quantize': (_task_trace_quantize, 1, ('logo', 'photo', 'line_art')),
+    'retrace_simplify': (_task_retrace_simplify, 1, None),
+    'retrace_threshold': (_task_retrace_threshold, 1, None),
+    'trace_tiled_raw': (_task_trace_tiled_raw, 1, ('sparse', 'specks')),
+    'sample_contour_colors': (_task_sample_colors, 1, None),
+    'svg_writer': (_task_svg_writer, 1, None),
+    'png_to_svg_embed': (_task_embed_array, 1, None),
+    'file_to_svg_embed': (_task_embed_file, 1, ('photo', 'logo')),
+    'load_image_png': (_task_load_png, 1, None),
+    'load_image_bmp': (_task_load_bmp, 1, ('photo', 'sparse')),
+    'process_batch': (_task_batch, BATCH_IMAGES, ('logo', 'scan', 'specks')),
+    'create_zip_archive': (_task_zip, BATCH_IMAGES, ('logo', 'specks')),
+    'cli_trace': (_task_cli_trace, 1, None),
+    'cli_embed': (_task_cli_embed, 1, ('photo', 'logo')),
+    'cli_batch': (_task_cli_batch, BATCH_IMAGES, ('logo', 'scan')),
+}
+
+
+def plan(preset, tasks=None):
+    """List of (task, kind, megapixels) cases of a preset"""
+    cases = []
+    for kind, megapixels in PRESETS[preset]:
+        for task, (_, _, kinds) in TASKS.items():
+            if (tasks is None or task in tasks) and (kinds is None or kind in kinds):
+                cases.append((task, kind, megapixels))
+    return cases
+
+
+def _peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _output_size(result):
+    if isinstance(result, tuple) and result and isinstance(result[0], str):
+        result = result[0]  # png_to_svg_trace: (svg_content, num_contours)
+    if isinstance(result, (str, bytes)):
+        if isinstance(result, str) and os.path.isfile(result):
+            return os.path.getsize(result)
+        return len(result)
+    if isinstance(result, list) and result and isinstance(result[0], tuple):
+        return sum(len(svg) for _, svg, success, _ in result if success)
+    return None
+
+
+def run_case(task, kind, megapixels, repeat):
+    """
+    Run one benchmark case (in a fresh worker process)
+
+    Returns:
+        dict: Result record (see README, Benchmarks)
+    """
+    setup, images, _ = TASKS[task]
+    image = make_image(kind, megapixels)
+    with tempfile.TemporaryDirectory() as workdir:
+        func = setup(image, kind, megapixels, workdir)
+        seconds, result = common.timed(func, repeat=repeat)
+        svg_bytes = _output_size(result)
+    return {
+        'task': task,
+        'kind': kind,
+        'megapixels': megapixels,
+        'seconds': seconds,
+        'mp_per_s': megapixels / seconds if seconds > 0 else None,
+        'images_per_s': images / seconds if seconds > 0 else None,
+        'peak_rss_mb': _peak_rss_mb(children=task.startswith('cli_')),
+        'svg_bytes': svg_bytes if task in _SVG_TASKS else None,
+    }
+
+
+_SVG_TASKS = {
+    'trace', 'trace_tiled', 'trace_compact', 'trace_holes', 'trace_curves', 'trace_despeckle', 'trace_quantize',
+    'retrace_simplify', 'retrace_threshold', 'svg_writer', 'png_to_svg_embed',
+    'file_to_svg_embed', 'process_batch', 'cli_trace', 'cli_embed',
+}
+
+
+def _meta(preset, repeat):
+    return {
+        'preset': preset,
+        'repeat': repeat,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'pillow': PIL.__version__,
+    }
+
+
+def run(preset='quick', tasks=None, repeat=3, out=None, verbose=True):
+    """
+    Run all cases of a preset and optionally write the results as JSON
+
+    Returns:
+        dict: {'meta': {...}, 'results': [record, ...]}
+    """
+    results = []
+    # One fresh spawned process per case: no shared caches, buffers or RSS
+    context = get_context('spawn')
+    if verbose:
+        print(f"{'task':<22} {'image':<9} {'MP':>6} {'time':>10} {'MP/s':>8} "
+              f"{'img/s':>7} {'RSS':>8} {'SVG':>10}")
+    for task, kind, megapixels in plan(preset, tasks):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                record = executor.submit(run_case, task, kind, megapixels, repeat).result()
+            except Exception as e:
+                record = {'task': task, 'kind': kind, 'megapixels': megapixels, 'error': str(e)}
+        results.append(record)
+        if verbose:
+            print(format_record(record), flush=True)
+
+    report = {'meta': _meta(preset, repeat), 'results': results}
+    if out:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def format_record(record):
+    """One table row of a result record"""
+    head = f"{record['task']:<22} {record['kind']:<9} {record['megapixels']:>6g}"
+    if 'error' in record:
+        return f"{head} ERROR {record['error']}"
+    rss = f"{record['peak_rss_mb']:.0f} MB" if record['peak_rss_mb'] is not None else '-'
+    svg = f"{record['svg_bytes'] / 1024:.0f} KB" if record['svg_bytes'] is not None else '-'
+    return (f"{head} {record['seconds'] * 1000:>7.1f} ms {record['mp_per_s']:>8.1f} "
+            f"{record['images_per_s']:>7.2f} {rss:>8} {svg:>10}")
+
+
+def compare(old, new, tolerance=0.1):
+    """
+    Compare two run() reports
+
+    A case regresses when its time or peak RSS grows by more than tolerance
+    (relative) and by more than MIN_SECONDS_DELTA / MIN_RSS_DELTA_MB. SVG
+    size changes are reported separately: they mean the output changed.
+
+    Returns:
+        tuple: (regressions, improvements, output_changes, missing) lists of
+            human-readable lines
+    """
+    def key(record):
+        return record['task'], record['kind'], record['megapixels']
+
+    old_records = {key(r): r for r in old['results'] if 'error' not in r}
+    regressions, improvements, output_changes, missing = [], [], [], []
+    for record in new['results']:
+        name = '{} {} {:g} MP'.format(*key(record))
+        before = old_records.pop(key(record), None)
+        if 'error' in record:
+            regressions.append(f"{name}: failed ({record['error']})")
+            continue
+        if before is None:
+            continue
+
+        ratio = record['seconds'] / before['seconds'] if before['seconds'] > 0 else 1.0
+        delta = record['seconds'] - before['seconds']
+        line = f"{name}: {before['seconds'] * 1000:.1f} -> {record['seconds'] * 1000:.1f} ms ({ratio:.2f}x)"
+        if ratio > 1 + tolerance and delta > MIN_SECONDS_DELTA:
+            regressions.append(line)
+        elif ratio < 1 - tolerance and -delta > MIN_SECONDS_DELTA:
+            improvements.append(line)
+
+        if record['peak_rss_mb'] is not None and before['peak_rss_mb'] is not None:
+            delta = record['peak_rss_mb'] - before['peak_rss_mb']
+            if (record['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance)
+                    and delta > MIN_RSS_DELTA_MB):
+                regressions.append(f"{name}: peak RSS {before['peak_rss_mb']:.0f} -> "
+                                   f"{record['peak_rss_mb']:.0f} MB")
+
+        if None not in (record['svg_bytes'], before['svg_bytes']) and record['svg_bytes'] != before['svg_bytes']:
+            output_changes.append(f"{name}: SVG {before['svg_bytes']} -> {record['svg_bytes']} bytes")
+
+    missing = ['{} {} {:g} MP'.format(*k) for k in old_records]
+    return regressions, improvements, output_changes, missing
+
+
+def _compare_main(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    for field in ('platform', 'cpu_count', 'python'):
+        if old['meta'].get(field) != new['meta'].get(field):
+            print(f"warning: {field} differs ({old['meta'].get(field)} vs {new['meta'].get(field)})")
+
+    regressions, improvements, output_changes, missing = compare(old, new, args.tolerance)
+    for title, lines in (
+        ('Regressions', regressions),
+        ('Improvements', improvements),
+        ('Output changes', output_changes),
+    ):
+        if lines:
+            print(f"{title} ({len(lines)}):")
+            for line in lines:
+                print(f"  {line}")
+    if missing:
+        print(f"{len(missing)} baseline cases not in the new run")
+    if not regressions:
+        print(f"No regressions (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the suite')
+    run_parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    run_parser.add_argument('--tasks', nargs='+', choices=sorted(TASKS),
+                            help='Only these tasks (default: all)')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the best counts')
+    run_parser.add_argument('--out', help='Write results to this JSON file')
+
+    compare_parser = subparsers.add_parser('compare', help='Flag regressions between two runs')
+    compare_parser.add_argument('old', help='Baseline results JSON')
+    compare_parser.add_argument('new', help='New results JSON')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1,
+                                help='Allowed relative slowdown / RSS growth (default: 0.1)')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        sys.exit(_compare_main(args))
+    run(args.preset, args.tasks, args.repeat, args.out)
+
+
+if __name__ == '__main__':
+    main()
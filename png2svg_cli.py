@@ -4,140 +4,633 @@ PNG to SVG Converter - Command Line Version
 Convert images to SVG format from the command line
 """
 import argparse
-import cv2
+import asyncio
+import json
+import os
+import sys
+import time
+from functools import partial
 import numpy as np
-from PIL import Image
-import base64
+from PIL import Image, UnidentifiedImageError
 import io
 
-def trace_to_svg(image_path, output_path, threshold=128, simplify=2, invert_auto=True):
-    """Convert image to SVG using contour tracing"""
-    # Load image
-    img = Image.open(image_path)
-    img_rgb = img.convert('RGB')
-    image_array = np.array(img_rgb)
+from utils.auto_threshold import THRESHOLD_METHODS, parse_threshold
+from utils.batch_processor import iter_batch
+from utils.conversion_cache import ConversionCache, configure_cache
+from utils.conversion_service import (
+    DEFAULT_JOB_TIMEOUT, DEFAULT_MAX_UPLOAD_BYTES, DEFAULT_QUEUE_SIZE, MAX_FINISHED_RESULT_BYTES, serve
+)
+from utils.image_io import load_image
+from utils.job_manifest import JobManifest, discover_inputs, file_digest, params_digest, unique_outputs
+from utils.pipeline import ConversionPipeline
+from utils.profiling import Profiler, profile_count, profile_stage
+from utils.svg_converter import EMBED_REENCODE_FORMATS, iter_svg_embed_file, png_to_svg_embed
+from utils.svg_writer import iter_svgz, join_svg, write_svg
+from utils.zip_stream import DEFAULT_COMPRESSLEVEL, ZipStreamWriter
+
+def _is_svgz(output_path):
+    return output_path.lower().endswith('.svgz')
+
+
+def _write_output(chunks, output_path):
+    """Stream SVG chunks to output_path, gzip-compressed for .svgz; returns the file size"""
+    if _is_svgz(output_path):
+        with open(output_path, 'wb') as f:
+            return write_svg(iter_svgz(chunks), f)
+    with open(output_path, 'w') as f:
+        return write_svg(chunks, f)
+
+
+def _load_cached(cache, key, output_path):
+    """Write a cached (svg, path_count or embed info) entry to output_path; None on a miss"""
+    found, entry = cache.get(key)
+    if not found:
+        return None
+    _write_output([entry[0]], output_path)
+    return entry
+
+
+def _tee(chunks, copies):
+    """Pass chunks through while appending them to copies (to cache what was streamed)"""
+    for chunk in chunks:
+        copies.append(chunk)
+        yield chunk
+
+
+def _store_cached(cache, key, copies, extra):
+    """Cache the SVG whose chunks _tee collected while it was streamed to disk"""
+    cache.put(key, (join_svg(copies), extra))
+
+
+# Tracing style of the CLI: nested contours (RETR_TREE) painted in order on
+# white, small specks dropped by area
+CLI_TRACE_STYLE = {
+    'retrieval': 'tree',
+    'min_points': 3,
+    'min_area': 50,
+    'min_approx_points': 2,
+    'sample_gray': True,
+    'background': 'white',
+    'path_attrs': '',
+}
+
+_pipeline = None
+
+def _get_pipeline():
+    """The CLI's conversion pipeline (one per process, buffers reused across files)"""
+    global _pipeline
+    if _pipeline is None:
+        # Raw BMP/PGM/PPM/.npy files are memory-mapped, not read
+        _pipeline = ConversionPipeline(decoder=partial(load_image, mode='RGB'), **CLI_TRACE_STYLE)
+    return _pipeline
+
+def trace_to_svg(image_path, output_path, threshold=128, simplify=2, invert_auto=True, cache=None,
+                 timings=None, profile=None, compact=False, holes=False, curves=False, despeckle=0,
+                 despeckle_kernel=0, info=None):
+    """
+    Convert image to SVG using contour tracing
     
-    # Convert to grayscale
-    gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+    Returns (path_count, file_size); seconds per pipeline stage are stored
+    in the optional timings dict (left empty on a cache hit), stage timings,
+    peak allocation and counts in the optional Profiler. compact writes the
+    smaller SVG variant; an output path ending in .svgz is gzip-compressed.
+    holes traces every outer contour with its holes as one evenodd path
+    instead of painting nested contours on top of each other. curves fits
+    the outlines with cubic Béziers instead of polylines. despeckle erases
+    specks and fills pinholes smaller than that many pixels before tracing,
+    after an open and close with a despeckle_kernel pixel square if set.
+    threshold may also be 'otsu', 'triangle' or 'adaptive'; the value an
+    automatic global threshold chose is stored in the optional info dict
+    under 'threshold'.
+    """
+    if cache is not None:
+        # Keyed on the file content, so a hit does not even decode the image
+        options = {'threshold': threshold, 'simplify': simplify, 'invert_auto': invert_auto}
+        if compact:
+            options['compact'] = True
+        if holes:
+            options['holes'] = True
+        if curves:
+            options['curves'] = True
+        if despeckle:
+            options['despeckle'] = despeckle
+        if despeckle_kernel > 1:
+            options['despeckle_kernel'] = despeckle_kernel
+        key = cache.make_key('png2svg_cli.trace_to_svg', np.memmap(image_path, dtype=np.uint8, mode='r'),
+                             kwargs=options)
+        entry = _load_cached(cache, key, output_path)
+        if entry is not None:
+            if isinstance(entry[1], tuple):
+                # Automatic threshold: (path_count, chosen threshold)
+                path_count, chosen = entry[1]
+                if info is not None:
+                    info['threshold'] = chosen
+                return path_count, os.path.getsize(output_path)
+            return entry[1], os.path.getsize(output_path)
     
-    # Auto-detect if image should be inverted
-    if invert_auto:
-        mean_val = gray.mean()
-        invert = mean_val < 127
-    else:
-        invert = False
+    result = _get_pipeline().trace(
+        image_path,
+        threshold=threshold,
+        simplify=simplify,
+        auto_invert=invert_auto,
+        tile_size=0,
+        profile=profile,
+        compact=compact,
+        holes=holes,
+        curves=curves,
+        despeckle=despeckle,
+        despeckle_kernel=despeckle_kernel
+    )
     
-    # Apply threshold
-    if invert:
-        _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
-    else:
-        _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+    # Stream SVG to disk, keeping the chunks for the cache
+    chunks = result.chunks
+    if cache is not None:
+        copies = []
+        chunks = _tee(chunks, copies)
+    size = _write_output(chunks, output_path)
     
-    # Find contours
-    contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if cache is not None:
+        extra = result.num_paths
+        if isinstance(threshold, str):
+            extra = (result.num_paths, result.threshold)
+        _store_cached(cache, key, copies, extra)
+    if timings is not None:
+        timings.update(result.timings)
+    if info is not None and isinstance(threshold, str):
+        info['threshold'] = result.threshold
     
-    # Get image dimensions
-    height, width = gray.shape
+    return result.num_paths, size
+
+def embed_to_svg(image_path, output_path, cache=None, profile=None, **embed_options):
+    """
+    Embed image as base64 in SVG
     
-    # Build SVG
-    svg = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
-  <rect width="100%" height="100%" fill="white"/>
-'''
+    PNG, JPEG and WebP files are embedded byte for byte (no decode, no
+    re-encode); embed_options (reencode, quality, png_level) force a
+    re-encode. Returns (file_size, info) with the embedded MIME type and
+    payload size; an output path ending in .svgz is gzip-compressed.
+    """
+    with open(image_path, 'rb') as f:
+        file_bytes = f.read()
     
-    path_count = 0
+    if cache is not None:
+        key = cache.make_key('png2svg_cli.embed_to_svg', np.frombuffer(file_bytes, dtype=np.uint8),
+                             kwargs=embed_options)
+        entry = _load_cached(cache, key, output_path)
+        if entry is not None:
+            return os.path.getsize(output_path), entry[1]
     
-    # Process contours
-    for i, contour in enumerate(contours):
-        area = cv2.contourArea(contour)
-        if len(contour) > 3 and area > 50:
-            # Simplify contour
-            epsilon = simplify
-            approx = cv2.approxPolyDP(contour, epsilon, True)
-            
-            if len(approx) > 2:
-                # Get average color
-                mask = np.zeros(gray.shape, dtype=np.uint8)
-                cv2.drawContours(mask, [contour], -1, 255, -1)
-                mean_color = cv2.mean(image_array, mask=mask)[:3]
-                
-                # Build path
-                path_data = f"M {approx[0][0][0]} {approx[0][0][1]}"
-                for point in approx[1:]:
-                    path_data += f" L {point[0][0]} {point[0][1]}"
-                path_data += " Z"
-                
-                # Color
-                r, g, b = int(mean_color[0]), int(mean_color[1]), int(mean_color[2])
-                color_hex = f'#{r:02x}{g:02x}{b:02x}'
-                
-                svg += f'  <path d="{path_data}" fill="{color_hex}"/>\n'
-                path_count += 1
-    
-    svg += '</svg>'
-    
-    # Save
-    with open(output_path, 'w') as f:
-        f.write(svg)
+    try:
+        chunks, info = iter_svg_embed_file(file_bytes, profile, **embed_options)
+    except UnidentifiedImageError:
+        # Raw pixel arrays (.npy) have no encoded form: embed them as PNG
+        buffered = io.BytesIO()
+        Image.fromarray(load_image(image_path)).save(buffered, format="PNG")
+        chunks, info = iter_svg_embed_file(buffered.getvalue(), profile, **embed_options)
+    
+    # Stream base64 chunks to disk, keeping them for the cache
+    if cache is not None:
+        copies = []
+        chunks = _tee(chunks, copies)
+    with profile_stage(profile, 'embed.emit'):
+        size = _write_output(chunks, output_path)
+        profile_count(profile, 'bytes', size)
     
-    return path_count, len(svg)
+    if cache is not None:
+        _store_cached(cache, key, copies, info)
+    
+    return size, info
 
-def embed_to_svg(image_path, output_path):
-    """Embed image as base64 in SVG"""
-    # Load image
-    img = Image.open(image_path)
-    img_rgb = img.convert('RGB')
+def reencode_cost(image_path):
+    """
+    Size and time of the former embed path (decode to RGB, re-encode as PNG)
     
-    # Convert to base64
-    buffered = io.BytesIO()
-    img_rgb.save(buffered, format="PNG")
-    img_base64 = base64.b64encode(buffered.getvalue()).decode()
+    Baseline for --report. Returns (svg_size, seconds).
+    """
+    start = time.perf_counter()
+    img_rgb = Image.fromarray(load_image(image_path, mode='RGB')).convert('RGB')
+    size = len(png_to_svg_embed(np.asarray(img_rgb)))
+    return size, time.perf_counter() - start
+
+def _threshold_arg(value):
+    """argparse type of --threshold"""
+    try:
+        return parse_threshold(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+def _embed_options(args):
+    """embed_to_svg keyword arguments from parsed command line options"""
+    if not args.reencode:
+        return {}
+    return {'reencode': args.reencode, 'quality': args.quality, 'png_level': args.png_level}
+
+def _add_embed_arguments(parser):
+    parser.add_argument('--reencode', choices=sorted(EMBED_REENCODE_FORMATS),
+                       help='Embed: re-encode instead of embedding PNG/JPEG/WebP files unchanged')
+    parser.add_argument('--quality', type=int, default=90,
+                       help='Embed: JPEG/WebP quality when re-encoding (1-100, default: 90)')
+    parser.add_argument('--png-level', type=int, default=6,
+                       help='Embed: PNG compression level when re-encoding (0-9, default: 6)')
+    parser.add_argument('--report', action='store_true',
+                       help='Embed: report bytes and time saved compared to a PNG re-encode')
+
+def convert_job(job):
+    """
+    Convert one batch job in a worker process and return its manifest record
     
-    width, height = img.size
+    Skips the conversion if the input's content hash matches job['known_hash']
+    (file touched but unchanged since the last successful run).
+    """
+    start = time.perf_counter()
+    params = job['params']
+    cache = ConversionCache(max_bytes=0, disk_dir=job['cache_dir']) if job['cache_dir'] else None
+    record = {key: job[key] for key in ('input', 'output', 'size', 'mtime_ns', 'params', 'params_hash')}
     
-    svg = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
-  <image width="{width}" height="{height}" xlink:href="data:image/png;base64,{img_base64}"/>
-</svg>'''
+    try:
+        record['hash'] = file_digest(job['input'])
+        if record['hash'] == job['known_hash']:
+            record['status'] = 'unchanged'
+        else:
+            os.makedirs(os.path.dirname(job['output']) or '.', exist_ok=True)
+            if params['method'] == 'trace':
+                timings, info = {}, {}
+                record['paths'], _ = trace_to_svg(
+                    job['input'],
+                    job['output'],
+                    threshold=params['threshold'],
+                    simplify=params['simplify'],
+                    invert_auto=params['invert_auto'],
+                    cache=cache,
+                    timings=timings,
+                    compact=params.get('compact', False),
+                    holes=params.get('holes', False),
+                    curves=params.get('curves', False),
+                    despeckle=params.get('despeckle', 0),
+                    despeckle_kernel=params.get('despeckle_kernel', 0),
+                    info=info
+                )
+                if info.get('threshold') is not None:
+                    record['threshold'] = info['threshold']
+                if timings:
+                    record['stage_seconds'] = {stage: round(t, 4) for stage, t in timings.items()}
+            else:
+                embed_start = time.perf_counter()
+                _, info = embed_to_svg(job['input'], job['output'], cache=cache, **params.get('embed', {}))
+                record['embed_mime'] = info['mime']
+                if job['report']:
+                    embed_seconds = time.perf_counter() - embed_start
+                    legacy_size, legacy_seconds = reencode_cost(job['input'])
+                    record['saved_bytes'] = legacy_size - os.path.getsize(job['output'])
+                    record['saved_ms'] = round((legacy_seconds - embed_seconds) * 1000, 1)
+            record['output_bytes'] = os.path.getsize(job['output'])
+            record['status'] = 'ok'
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
     
-    # Save
-    with open(output_path, 'w') as f:
-        f.write(svg)
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def _iter_batch_jobs(inputs, output_dir, manifest, params, force, cache_dir, stats, report=False,
+                     extension='.svg', on_skip=None):
+    """
+    Build jobs for every input that is not already current in the manifest
+    
+    on_skip(record) is called with the manifest record of every skipped input.
+    """
+    params_hash = params_digest(params)
+    for input_path, relative_path in inputs:
+        key = os.path.abspath(input_path)
+        output_path = os.path.join(output_dir, os.path.splitext(relative_path)[0] + extension)
+        stat = os.stat(input_path)
+        record = manifest.lookup(key)
+        
+        reusable = (
+            not force
+            and record is not None
+            and record.get('status') == 'ok'
+            and record.get('params_hash') == params_hash
+            and record.get('output') == output_path
+            and os.path.exists(output_path)
+        )
+        if reusable and manifest.is_current(record, stat.st_size, stat.st_mtime_ns, params_hash):
+            stats['skipped'] += 1
+            if on_skip is not None:
+                on_skip(record)
+            continue
+        
+        yield input_path, {
+            'input': key,
+            'output': output_path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'params': params,
+            'params_hash': params_hash,
+            'known_hash': record['hash'] if reusable else None,
+            'cache_dir': cache_dir,
+            'report': report,
+        }
+
+
+def batch_main(argv):
+    """Entry point for `png2svg_cli.py batch ...`"""
+    parser = argparse.ArgumentParser(
+        prog='png2svg_cli.py batch',
+        description='Convert directories, glob patterns or file lists to SVG in parallel'
+    )
+    parser.add_argument('sources', nargs='*', help='Input directories, glob patterns or files')
+    parser.add_argument('-o', '--output-dir', required=True,
+                       help='Output directory (input tree is mirrored)')
+    parser.add_argument('--file-list',
+                       help='Text file with one input path per line ("-" for stdin)')
+    parser.add_argument('-m', '--method', choices=['trace', 'embed'], default='trace',
+                       help='Conversion method (default: trace)')
+    parser.add_argument('-t', '--threshold', type=_threshold_arg, default=128,
+                       help=f'Threshold for tracing: 0-255 or {"/".join(THRESHOLD_METHODS)} '
+                            '(chosen per image; adaptive for unevenly lit scans) (default: 128)')
+    parser.add_argument('-s', '--simplify', type=int, default=2,
+                       help='Simplification level (default: 2)')
+    parser.add_argument('--no-auto-invert', action='store_true',
+                       help='Disable automatic inversion detection')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                       help='Parallel worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=4,
+                       help='Files handed to a worker at once (default: 4)')
+    parser.add_argument('--manifest',
+                       help='JSON Lines manifest (default: OUTPUT_DIR/manifest.jsonl)')
+    parser.add_argument('--force', action='store_true',
+                       help='Reconvert everything, ignoring the manifest')
+    parser.add_argument('--cache-dir',
+                       help='Content-addressed result cache shared by all workers and runs')
+    parser.add_argument('--compact', action='store_true',
+                       help='Trace: smaller SVG (relative path commands, one element per color)')
+    parser.add_argument('--holes', action='store_true',
+                       help='Trace: one path per shape with its holes (fill-rule evenodd)')
+    parser.add_argument('--curves', action='store_true',
+                       help='Trace: smooth cubic Bézier outlines instead of polylines')
+    parser.add_argument('--despeckle', type=int, default=0, metavar='PIXELS',
+                       help='Trace: erase specks and fill pinholes smaller than this (default: 0, off)')
+    parser.add_argument('--despeckle-kernel', type=int, default=0, metavar='PIXELS',
+                       help='Trace: open and close the mask with a square this wide first (default: 0, off)')
+    parser.add_argument('--svgz', action='store_true',
+                       help='Write gzip-compressed .svgz files')
+    parser.add_argument('--zip',
+                       help='Also pack all outputs into this ZIP archive, written while converting')
+    parser.add_argument('--zip-level', type=int, default=DEFAULT_COMPRESSLEVEL, choices=range(10),
+                       metavar='0-9',
+                       help=f'ZIP deflate level, 0 = store (default: {DEFAULT_COMPRESSLEVEL})')
+    _add_embed_arguments(parser)
+    
+    args = parser.parse_args(argv)
     
-    return len(svg)
+    sources = list(args.sources)
+    if args.file_list:
+        list_file = sys.stdin if args.file_list == '-' else open(args.file_list, encoding='utf-8')
+        with list_file:
+            sources.extend(line.strip() for line in list_file if line.strip())
+    if not sources:
+        parser.error('no inputs given')
+    # Before anything runs: two inputs writing one output would overwrite
+    # each other and both be recorded as converted
+    try:
+        inputs = unique_outputs(discover_inputs(sources))
+    except (ValueError, FileNotFoundError) as e:
+        parser.error(str(e))
+    
+    params = {
+        'method': args.method,
+        'threshold': args.threshold,
+        'simplify': args.simplify,
+        'invert_auto': not args.no_auto_invert,
+    }
+    # Only present when set, so existing manifests stay current
+    if args.method == 'embed' and args.reencode:
+        params['embed'] = _embed_options(args)
+    if args.method == 'trace' and args.compact:
+        params['compact'] = True
+    if args.method == 'trace' and args.holes:
+        params['holes'] = True
+    if args.method == 'trace' and args.curves:
+        params['curves'] = True
+    if args.method == 'trace' and args.despeckle:
+        params['despeckle'] = args.despeckle
+    if args.method == 'trace' and args.despeckle_kernel > 1:
+        params['despeckle_kernel'] = args.despeckle_kernel
+    manifest = JobManifest(args.manifest or os.path.join(args.output_dir, 'manifest.jsonl'))
+    stats = {'converted': 0, 'skipped': 0, 'failed': 0, 'saved_bytes': 0, 'saved_ms': 0.0}
+    start = time.perf_counter()
+    
+    archive_file = archive = None
+    if args.zip:
+        os.makedirs(os.path.dirname(os.path.abspath(args.zip)), exist_ok=True)
+        archive_file = open(args.zip, 'wb')
+        archive = ZipStreamWriter(archive_file, args.zip_level)
+    
+    def archive_output(record):
+        # Read back from disk block by block, so no SVG is kept in memory
+        if archive is not None:
+            archive.add_file(record['output'], os.path.relpath(record['output'], args.output_dir))
+    
+    jobs = _iter_batch_jobs(
+        inputs, args.output_dir, manifest, params, args.force, args.cache_dir, stats,
+        report=args.report, extension='.svgz' if args.svgz else '.svg', on_skip=archive_output
+    )
+    try:
+        for input_path, record, success, error in iter_batch(
+            jobs,
+            convert_job,
+            max_workers=args.workers,
+            backend='process',
+            chunksize=args.chunksize
+        ):
+            if not success:
+                record = {'input': os.path.abspath(input_path), 'status': 'error', 'error': error}
+            
+            if record['status'] == 'unchanged':
+                # Content identical to the last successful run: keep its results
+                previous = manifest.lookup(record['input'])
+                record = {**previous, 'size': record['size'], 'mtime_ns': record['mtime_ns']}
+                stats['skipped'] += 1
+                archive_output(record)
+            elif record['status'] == 'ok':
+                stats['converted'] += 1
+                archive_output(record)
+                if 'saved_bytes' in record:
+                    stats['saved_bytes'] += record.pop('saved_bytes')
+                    stats['saved_ms'] += record.pop('saved_ms')
+            else:
+                stats['failed'] += 1
+                print(f"✗ {input_path}: {record['error']}", file=sys.stderr)
+            
+            manifest.append(record)
+            done = stats['converted'] + stats['failed']
+            if done and done % 100 == 0:
+                print(f"... {done} converted/failed, {stats['skipped']} skipped")
+    finally:
+        manifest.close()
+        if archive is not None:
+            archive.close()
+            archive_file.close()
+    
+    manifest.compact()
+    elapsed = time.perf_counter() - start
+    print(f"Converted {stats['converted']}, skipped {stats['skipped']}, "
+          f"failed {stats['failed']} in {elapsed:.1f}s")
+    if args.report and args.method == 'embed':
+        print(f"Embed vs. PNG re-encode: saved {stats['saved_bytes'] / 1024:.1f} KB "
+              f"and {stats['saved_ms'] / 1000:.2f}s")
+    print(f"Manifest: {manifest.path}")
+    if archive is not None:
+        print(f"Archive: {args.zip} ({archive.entries} files)")
+    return 1 if stats['failed'] else 0
+
+
+def serve_main(argv):
+    """Entry point for `png2svg_cli.py serve ...`"""
+    parser = argparse.ArgumentParser(
+        prog='png2svg_cli.py serve',
+        description='Local HTTP conversion service with a bounded job queue'
+    )
+    parser.add_argument('--host', default='127.0.0.1',
+                       help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765,
+                       help='TCP port (default: 8765)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                       help='Worker processes (default: CPU count)')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                       help=f'Jobs waiting for a worker before requests get 429 (default: {DEFAULT_QUEUE_SIZE})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_JOB_TIMEOUT,
+                       help=f'Maximum seconds per job (default: {DEFAULT_JOB_TIMEOUT:g})')
+    parser.add_argument('--max-upload-mb', type=float, default=DEFAULT_MAX_UPLOAD_BYTES / 1024 / 1024,
+                       help='Largest accepted upload in MB (default: %(default)g)')
+    parser.add_argument('--max-result-mb', type=float, default=MAX_FINISHED_RESULT_BYTES / 1024 / 1024,
+                       help='SVGs kept by finished jobs in MB; older ones are served from the cache '
+                            'or get 410 (default: %(default)g)')
+    parser.add_argument('--cache-dir',
+                       help='Persistent result cache directory')
+    args = parser.parse_args(argv)
+    
+    cache = configure_cache(disk_dir=args.cache_dir) if args.cache_dir else None
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers (Ctrl-C to stop)")
+    try:
+        asyncio.run(serve(
+            args.host, args.port,
+            max_upload_bytes=int(args.max_upload_mb * 1024 * 1024),
+            max_workers=args.workers,
+            queue_size=args.queue_size,
+            job_timeout=args.timeout,
+            cache=cache,
+            max_result_bytes=int(args.max_result_mb * 1024 * 1024),
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
 
 def main():
-    parser = argparse.ArgumentParser(description='Convert PNG/images to SVG')
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        sys.exit(serve_main(sys.argv[2:]))
+    
+    parser = argparse.ArgumentParser(
+        description='Convert PNG/images to SVG',
+        epilog='Batch mode: %(prog)s batch --help, HTTP service: %(prog)s serve --help'
+    )
     parser.add_argument('input', help='Input image file')
     parser.add_argument('output', help='Output SVG file')
     parser.add_argument('-m', '--method', choices=['trace', 'embed'], default='trace',
                        help='Conversion method (default: trace)')
-    parser.add_argument('-t', '--threshold', type=int, default=128,
-                       help='Threshold for tracing (0-255, default: 128)')
+    parser.add_argument('-t', '--threshold', type=_threshold_arg, default=128,
+                       help=f'Threshold for tracing: 0-255 or {"/".join(THRESHOLD_METHODS)} '
+                            '(chosen per image; adaptive for unevenly lit scans) (default: 128)')
     parser.add_argument('-s', '--simplify', type=int, default=2,
                        help='Simplification level (default: 2)')
     parser.add_argument('--no-auto-invert', action='store_true',
                        help='Disable automatic inversion detection')
+    parser.add_argument('--cache-dir',
+                       help='Reuse results for identical images and parameters from this directory')
+    parser.add_argument('--compact', action='store_true',
+                       help='Trace: smaller SVG (relative path commands, one element per color); '
+                            'an output file ending in .svgz is gzip-compressed either way')
+    parser.add_argument('--holes', action='store_true',
+                       help='Trace: one path per shape with its holes (fill-rule evenodd) instead of '
+                            'nested shapes painted on top of each other')
+    parser.add_argument('--curves', action='store_true',
+                       help='Trace: fit the outlines with cubic Béziers within the simplify tolerance; '
+                            'far fewer points on smooth shapes, slower to trace')
+    parser.add_argument('--despeckle', type=int, default=0, metavar='PIXELS',
+                       help='Trace: erase specks (dust, scanner noise) and fill pinholes smaller than '
+                            'this many pixels before tracing (default: 0, off)')
+    parser.add_argument('--despeckle-kernel', type=int, default=0, metavar='PIXELS',
+                       help='Trace: open and close the mask with a square kernel this many pixels wide '
+                            'before tracing; also erases hairlines thinner than it (default: 0, off)')
+    parser.add_argument('--timings', action='store_true',
+                       help='Print the time spent in each pipeline stage')
+    parser.add_argument('--profile', nargs='?', const='table', choices=['table', 'json'],
+                       help='Profile every stage (time, counts) and print a table or JSON')
+    parser.add_argument('--profile-memory', action='store_true',
+                       help='With --profile: also measure peak allocation per stage '
+                            '(tracemalloc, slows tracing down)')
+    _add_embed_arguments(parser)
     
     args = parser.parse_args()
+    cache = ConversionCache(disk_dir=args.cache_dir) if args.cache_dir else None
+    profile = Profiler(trace_memory=args.profile_memory) if args.profile else None
     
     print(f"Converting {args.input} to {args.output}")
     print(f"Method: {args.method}")
     
     if args.method == 'trace':
         print(f"Threshold: {args.threshold}, Simplify: {args.simplify}")
+        timings, info = {}, {}
         path_count, size = trace_to_svg(
             args.input, 
             args.output,
             threshold=args.threshold,
             simplify=args.simplify,
-            invert_auto=not args.no_auto_invert
+            invert_auto=not args.no_auto_invert,
+            cache=cache,
+            timings=timings,
+            profile=profile,
+            compact=args.compact,
+            holes=args.holes,
+            curves=args.curves,
+            despeckle=args.despeckle,
+            despeckle_kernel=args.despeckle_kernel,
+            info=info
         )
+        if info.get('threshold') is not None:
+            print(f"Chosen threshold: {info['threshold']}")
         print(f"Created {path_count} paths")
         print(f"SVG size: {size / 1024:.2f} KB")
+        if args.timings:
+            if timings:
+                for stage, seconds in timings.items():
+                    print(f"  {stage:<10}{seconds * 1000:>9.1f} ms")
+            else:
+                print("  (served from cache)")
     else:
-        size = embed_to_svg(args.input, args.output)
+        start = time.perf_counter()
+        size, info = embed_to_svg(args.input, args.output, cache=cache, profile=profile,
+                                  **_embed_options(args))
+        seconds = time.perf_counter() - start
+        print(f"Embedded {info['mime']} ({'unchanged' if info['passed_through'] else 're-encoded'})")
         print(f"SVG size: {size / 1024:.2f} KB")
+        if args.report:
+            legacy_size, legacy_seconds = reencode_cost(args.input)
+            print(f"Saved vs. PNG re-encode: {(legacy_size - size) / 1024:.2f} KB, "
+                  f"{(legacy_seconds - seconds) * 1000:.0f} ms")
+    
+    if profile is not None:
+        if args.profile == 'json':
+            print(json.dumps(profile.as_dict(), indent=2))
+        elif profile.stages:
+            print(profile.format_table())
+        else:
+            print("Profile: result served from cache, nothing converted")
     
     print(f"✓ Saved to {args.output}")
 
@@ -3,15 +3,41 @@ Enhanced Image to SVG Converter with Batch Processing
 Supports: PNG, JPG, JPEG, WebP, BMP with transparency handling
 """
 import streamlit as st
-import numpy as np
-from PIL import Image
 import io
+import os
+import tempfile
 from pathlib import Path
 
 # Import utility modules
-from utils.svg_converter import png_to_svg_trace, png_to_svg_embed
-from utils.image_analyzer import analyze_image, recommend_method
-from utils.batch_processor import process_batch, create_zip_archive
+from utils.image_analyzer import recommend_method, COLOR_COUNT_LIMIT
+from utils.batch_processor import create_executor, process_batch, convert_file
+from utils.profiling import Profiler
+from utils.trace_memo import configure_trace_memo, get_trace_memo
+from utils.zip_stream import ZipStreamWriter
+from utils.conversion_cache import (
+    get_cache, cached_decode, cached_analyze, cached_trace, cached_trace_info, cached_embed_file
+)
+
+# Preview traces a copy with at most this longest edge
+PREVIEW_MAX_EDGE = 1024
+
+# Larger SVGs are not put into the page (the browser would stall on them)
+PREVIEW_MAX_SVG_BYTES = 2 * 1024 * 1024
+
+# The SVG code view shows at most this many characters
+PREVIEW_MAX_CODE_CHARS = 100000
+
+# Batch mode keeps at most this many SVGs for the result grid; all
+# other results are only in the ZIP
+BATCH_PREVIEW_COUNT = 12
+
+# Threshold modes of the sidebar: label -> automatic method (None: slider value)
+THRESHOLD_MODES = {
+    "Fest": None,
+    "Automatisch (Otsu)": 'otsu',
+    "Automatisch (Dreieck)": 'triangle',
+    "Adaptiv (ungleichmäßige Beleuchtung)": 'adaptive',
+}
 
 
 def main():
@@ -22,6 +48,10 @@ def main():
         initial_sidebar_state="expanded"
     )
     
+    # Slider changes re-trace from the intermediate products of the last run
+    if get_trace_memo() is None:
+        configure_trace_memo()
+    
     st.title("Bild zu SVG Konverter")
     st.markdown("Wandle Bilder aller Art in SVG-Vektorgrafiken um")
     
@@ -55,16 +85,109 @@ def main():
     st.sidebar.markdown("---")
     st.sidebar.subheader("Vektorisierungs-Parameter")
     
+    threshold_method = THRESHOLD_MODES[st.sidebar.selectbox(
+        "Schwellenwert-Modus",
+        list(THRESHOLD_MODES),
+        help="Otsu und Dreieck wählen den Schwellenwert aus dem Histogramm des Bildes "
+             "(Otsu: zwei klare Töne, Dreieck: heller Grund mit feinen Strichen); "
+             "Adaptiv vergleicht jedes Pixel mit seiner Umgebung, für Scans mit Schatten "
+             "oder ungleichmäßiger Beleuchtung"
+    )]
     threshold = st.sidebar.slider(
         "Schwellenwert",
         0, 255, 128,
-        help="Schwarz-Weiß Trennung (niedrigere Werte = mehr Schwarz)"
+        help="Schwarz-Weiß Trennung (niedrigere Werte = mehr Schwarz)",
+        disabled=threshold_method is not None
     )
     simplify = st.sidebar.slider(
         "Vereinfachung",
         1, 10, 2,
         help="Höhere Werte = weniger Details, kleinere Datei"
     )
+    despeckle = st.sidebar.slider(
+        "Flecken entfernen (Pixel)",
+        0, 200, 0,
+        help="Staub, Scanner-Rauschen und kleine Löcher unter dieser Fläche werden vor dem "
+             "Vektorisieren entfernt (0 = aus)"
+    )
+    despeckle_kernel = st.sidebar.slider(
+        "Glätten (Kernel, Pixel)",
+        0, 9, 0,
+        help="Öffnet und schließt die Maske mit einem Quadrat dieser Breite: entfernt auch feine "
+             "Linien, die dünner sind, und verbindet nahe Formen (0 = aus)"
+    )
+    multi_color = st.sidebar.checkbox(
+        "Mehrfarbig (Farbreduktion)",
+        value=False,
+        help="Reduziert das Bild auf wenige Farben und vektorisiert jede Farbebene einzeln"
+    )
+    n_colors = st.sidebar.slider(
+        "Anzahl Farben",
+        2, 16, 8,
+        help="Anzahl der Farbebenen im mehrfarbigen Modus",
+        disabled=not multi_color
+    )
+    holes = st.sidebar.checkbox(
+        "Löcher erhalten",
+        value=False,
+        help="Innenräume von Formen (z. B. in O, B, A) bleiben frei: eine Form und ihre Löcher "
+             "werden ein gemeinsamer Pfad (fill-rule evenodd)",
+        disabled=multi_color
+    )
+    curves = st.sidebar.checkbox(
+        "Kurven glätten (Bézier)",
+        value=False,
+        help="Umrisse werden als Bézierkurven statt als Polygone angenähert: glattere Formen und "
+             "deutlich weniger Punkte bei runden Logos, etwas langsamer"
+    )
+    compact = st.sidebar.checkbox(
+        "Kompakte SVG-Ausgabe",
+        value=False,
+        help="Relative Pfadbefehle und ein Element pro Farbe: deutlich kleinere Dateien, gleiche Darstellung"
+    )
+    preview = st.sidebar.checkbox(
+        "Schnelle Vorschau",
+        value=True,
+        help=f"Vektorisiert für die Anzeige eine verkleinerte Kopie (längste Kante {PREVIEW_MAX_EDGE} px); "
+             "die volle Auflösung wird erst für den Download berechnet"
+    )
+    trace_options = {
+        'threshold': threshold_method or threshold,
+        'simplify': simplify,
+        'mode': 'quantize' if multi_color else 'threshold',
+        'n_colors': n_colors,
+        'compact': compact,
+    }
+    if holes and not multi_color:
+        # Only set when used, so existing cache entries stay valid
+        trace_options['holes'] = True
+    if curves:
+        trace_options['curves'] = True
+    if despeckle:
+        trace_options['despeckle'] = despeckle
+    if despeckle_kernel > 1:
+        trace_options['despeckle_kernel'] = despeckle_kernel
+    
+    # Embedding options
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Einbettungs-Parameter")
+    
+    embed_format = st.sidebar.selectbox(
+        "Format",
+        ["Original (ohne Neukodierung)", "PNG", "JPEG", "WebP"],
+        help="PNG-, JPEG- und WebP-Dateien werden unverändert eingebettet; "
+             "eine Neukodierung kann die Datei verkleinern, kostet aber Zeit"
+    )
+    embed_quality = st.sidebar.slider(
+        "Qualität",
+        1, 100, 90,
+        help="Qualität bei Neukodierung als JPEG oder WebP",
+        disabled=embed_format not in ("JPEG", "WebP")
+    )
+    if embed_format.startswith("Original"):
+        embed_options = {}
+    else:
+        embed_options = {'reencode': embed_format.lower(), 'quality': embed_quality}
     
     # Alpha channel handling
     st.sidebar.markdown("---")
@@ -83,6 +206,13 @@ def main():
     else:
         background_color = "#FFFFFF"
     
+    profile_memory = st.sidebar.checkbox(
+        "Speicherbedarf pro Stufe messen",
+        value=False,
+        help="Ergänzt die Laufzeit-Übersicht um den Spitzen-Speicherbedarf (verlangsamt die Konvertierung)"
+    )
+    profile = Profiler(trace_memory=profile_memory)
+    
     # File upload
     max_files = 20 if batch_mode else 1
     
@@ -113,9 +243,10 @@ def main():
                 uploaded_files,
                 conversion_method,
                 use_auto_recommend,
-                threshold,
-                simplify,
-                background_color
+                trace_options,
+                background_color,
+                embed_options,
+                profile
             )
         else:
             # Single file mode
@@ -123,32 +254,75 @@ def main():
                 uploaded_files[0],
                 conversion_method,
                 use_auto_recommend,
-                threshold,
-                simplify,
-                background_color
+                trace_options,
+                background_color,
+                embed_options,
+                profile,
+                preview
             )
     
     else:
         # Show info when no file uploaded
         show_info_section()
+    
+    show_cache_stats()
+
+
+def show_cache_stats():
+    """Show conversion cache counters in the sidebar"""
+    stats = get_cache().stats()
+    with st.sidebar.expander("Cache", expanded=False):
+        st.write(f"**Treffer:** {stats['hits']} | **Fehlversuche:** {stats['misses']} "
+                 f"({stats['hit_rate']:.0%})")
+        st.write(f"**Einträge:** {stats['entries']} | "
+                 f"**Speicher:** {stats['memory_bytes'] / 1024 / 1024:.1f} / "
+                 f"{stats['memory_max_bytes'] / 1024 / 1024:.0f} MB")
+        memo_stats = get_trace_memo().stats()
+        st.write(f"**Zwischenergebnisse:** {memo_stats['entries']} "
+                 f"({memo_stats['memory_bytes'] / 1024 / 1024:.1f} MB, {memo_stats['hits']} Treffer)")
+
+
+def show_profile(profile):
+    """Show the per-stage timing breakdown of this run"""
+    with st.expander("Laufzeiten pro Stufe", expanded=False):
+        if not profile.stages:
+            st.caption("Alle Ergebnisse aus dem Cache, nichts neu berechnet")
+            return
+        rows = []
+        for stage, record in profile.as_dict().items():
+            row = {'Stufe': stage, 'Zeit (ms)': round(record['seconds'] * 1000, 1)}
+            if record['peak_bytes'] is not None:
+                row['Spitze (KB)'] = round(record['peak_bytes'] / 1024)
+            row['Zähler'] = ', '.join(f"{key}={value}" for key, value in record['counts'].items())
+            rows.append(row)
+        st.table(rows)
+        if 'batch' in profile.stages:
+            st.caption("Im Batch-Modus laufen die Stufen in Worker-Prozessen; gemessen wird der Gesamtlauf.")
 
 
 def process_single_mode(
     uploaded_file,
     conversion_method,
     use_auto_recommend,
-    threshold,
-    simplify,
-    background_color
+    trace_options,
+    background_color,
+    embed_options,
+    profile,
+    preview=True
 ):
-    """Process and display a single image"""
+    """
+    Process and display a single image
     
-    # Load image
-    image = Image.open(uploaded_file)
-    image_array = np.array(image)
+    With preview, the displayed SVG is traced from a downscaled copy (same
+    size and coordinates as the full trace); the full-resolution SVG is only
+    computed when requested for download.
+    """
+    
+    # Load image (reruns with the same upload reuse the decoded array)
+    image_array = cached_decode(uploaded_file.getvalue())
     
     # Analyze image
-    analysis = analyze_image(image_array)
+    analysis = cached_analyze(image_array, profile=profile)
     
     # Get recommendation if auto mode
     if use_auto_recommend:
@@ -163,16 +337,21 @@ def process_single_mode(
     
     with col1:
         st.subheader("Original")
-        st.image(image, width='stretch')
+        st.image(uploaded_file.getvalue(), width='stretch')
         
         # Show image info
         with st.expander("Bild-Analyse", expanded=False):
             st.write(f"**Größe:** {analysis['width']} × {analysis['height']} px")
-            st.write(f"**Farben:** ~{analysis['num_colors']}")
+            if analysis['num_colors'] > COLOR_COUNT_LIMIT:
+                st.write(f"**Farben:** >{COLOR_COUNT_LIMIT}")
+            else:
+                st.write(f"**Farben:** ~{analysis['num_colors']}")
             st.write(f"**Komplexität:** {analysis['complexity']}")
             st.write(f"**Graustufen:** {'Ja' if analysis['is_grayscale'] else 'Nein'}")
             st.write(f"**Transparenz:** {'Ja' if analysis['has_transparency'] else 'Nein'}")
             st.write(f"**Foto-Typ:** {'Ja' if analysis['is_photo'] else 'Nein'}")
+            st.write(f"**Schwellenwert (Otsu / Dreieck):** {analysis['thresholds']['otsu']} / "
+                     f"{analysis['thresholds']['triangle']}")
     
     with col2:
         st.subheader("SVG Vorschau")
@@ -183,68 +362,106 @@ def process_single_mode(
             st.info(f"{confidence_emoji} **Empfehlung:** {'Vektorisierung' if actual_method == 'trace' else 'Einbettung'} "
                    f"(Konfidenz: {recommendation['confidence']:.0%})\n\n{recommendation['reason']}")
         
+        trace_background = background_color if analysis['has_transparency'] else None
+        is_preview = (
+            actual_method == 'trace' and preview
+            and max(image_array.shape[:2]) > PREVIEW_MAX_EDGE
+        )
+        
         # Convert based on method
         with st.spinner("Konvertiere..."):
             if actual_method == 'trace':
-                svg_content, num_contours = png_to_svg_trace(
+                svg_content, num_contours, trace_info = cached_trace_info(
                     image_array,
-                    threshold=threshold,
-                    simplify=simplify,
-                    background_color=background_color if analysis['has_transparency'] else None
+                    background_color=trace_background,
+                    profile=profile,
+                    max_edge=PREVIEW_MAX_EDGE if is_preview else None,
+                    **trace_options
                 )
-                st.caption(f"Gefundene Konturen: {num_contours}")
+                caption = f"Gefundene Konturen: {num_contours}"
+                if isinstance(trace_options['threshold'], str) and trace_info['threshold'] is not None:
+                    # The value the automatic threshold chose for this image
+                    caption += f" | Schwellenwert: {trace_info['threshold']}"
+                if is_preview:
+                    caption = f"Vorschau (längste Kante {PREVIEW_MAX_EDGE} px) | " + caption
+                st.caption(caption)
             else:
-                svg_content = png_to_svg_embed(image_array)
-                st.caption("Bild eingebettet als Base64")
+                # Embed the uploaded file itself instead of re-encoding the pixels
+                svg_content = cached_embed_file(uploaded_file.getvalue(), profile=profile, **embed_options)
+                st.caption("Bild eingebettet als Base64"
+                          + (" (neu kodiert)" if embed_options else " (Originaldatei, ohne Neukodierung)"))
         
-        # Display SVG
-        st.markdown(svg_content, unsafe_allow_html=True)
+        # Display SVG (SVG output is ASCII, so characters are bytes)
+        svg_size = len(svg_content)
+        if svg_size <= PREVIEW_MAX_SVG_BYTES:
+            st.markdown(svg_content, unsafe_allow_html=True)
+        else:
+            st.warning(f"SVG mit {svg_size / 1024 / 1024:.1f} MB ist zu groß für die Anzeige im Browser")
         
         # File size info
-        svg_size = len(svg_content.encode('utf-8'))
         original_size = len(uploaded_file.getvalue())
-        st.caption(f"SVG: {svg_size / 1024:.1f} KB | Original: {original_size / 1024:.1f} KB | "
-                  f"{'Kleiner' if svg_size < original_size else 'Größer'}")
-    
-    # Download button
-    st.download_button(
-        label="SVG herunterladen",
-        data=svg_content,
-        file_name=Path(uploaded_file.name).stem + '.svg',
-        mime="image/svg+xml",
-        width='stretch'
-    )
+        if is_preview:
+            st.caption(f"Vorschau-SVG: {svg_size / 1024:.1f} KB | Original: {original_size / 1024:.1f} KB")
+        else:
+            st.caption(f"SVG: {svg_size / 1024:.1f} KB | Original: {original_size / 1024:.1f} KB | "
+                      f"{'Kleiner' if svg_size < original_size else 'Größer'}")
+        
+        show_profile(profile)
+    
+    # Download button; a preview is first rendered at full resolution
+    download_content = svg_content
+    if is_preview:
+        render_key = (uploaded_file.file_id, trace_background, tuple(sorted(trace_options.items())))
+        if st.button("Volle Auflösung berechnen", width='stretch'):
+            st.session_state['full_render'] = render_key
+        if st.session_state.get('full_render') == render_key:
+            with st.spinner("Konvertiere in voller Auflösung..."):
+                download_content, num_contours = cached_trace(
+                    image_array, background_color=trace_background, **trace_options
+                )
+            st.caption(f"Volle Auflösung: {len(download_content) / 1024:.1f} KB | "
+                      f"Gefundene Konturen: {num_contours}")
+        else:
+            download_content = None
+    
+    if download_content is not None:
+        st.download_button(
+            label="SVG herunterladen",
+            data=download_content,
+            file_name=Path(uploaded_file.name).stem + '.svg',
+            mime="image/svg+xml",
+            width='stretch'
+        )
     
     # Show SVG code
     with st.expander("SVG Code anzeigen"):
-        st.code(svg_content, language="xml")
+        if len(svg_content) > PREVIEW_MAX_CODE_CHARS:
+            st.caption(f"Gekürzt auf die ersten {PREVIEW_MAX_CODE_CHARS // 1000}k von {len(svg_content) // 1000}k Zeichen")
+        st.code(svg_content[:PREVIEW_MAX_CODE_CHARS], language="xml")
+
+
+@st.cache_resource
+def get_batch_executor():
+    """Worker processes for batch mode, started once and kept across reruns"""
+    return create_executor('process', os.cpu_count() or 1)
 
 
 def process_batch_mode(
     uploaded_files,
     conversion_method,
     use_auto_recommend,
-    threshold,
-    simplify,
-    background_color
+    trace_options,
+    background_color,
+    embed_options,
+    profile
 ):
     """Process multiple images in batch"""
     
     st.subheader(f"Batch-Verarbeitung ({len(uploaded_files)} Dateien)")
     
-    # Prepare image data
-    images_data = []
-    for uploaded_file in uploaded_files:
-        try:
-            image = Image.open(uploaded_file)
-            image_array = np.array(image)
-            images_data.append((uploaded_file.name, image_array))
-        except Exception as e:
-            st.warning(f"Fehler beim Laden von {uploaded_file.name}: {e}")
-    
-    if not images_data:
-        st.error("Keine Bilder konnten geladen werden")
-        return
+    # Encoded uploads only: each worker decodes its own image, so at most
+    # one decoded image per worker is in memory at a time
+    images_data = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
     
     # Progress bar
     progress_bar = st.progress(0)
@@ -255,57 +472,76 @@ def process_batch_mode(
         status_text.text(f"Verarbeitet: {current}/{total}")
     
     # Process based on auto-recommend or manual method
-    results = []
-    
-    with st.spinner("Verarbeite Bilder..."):
-        for i, (filename, image_array) in enumerate(images_data):
-            try:
-                # Analyze and determine method
-                if use_auto_recommend:
-                    analysis = analyze_image(image_array)
-                    recommendation = recommend_method(analysis)
-                    method = recommendation['method']
-                else:
-                    method = 'trace' if conversion_method == "Vektorisierung (Tracing)" else 'embed'
-                    analysis = analyze_image(image_array)
-                
-                # Convert
-                if method == 'trace':
-                    svg_content, _ = png_to_svg_trace(
-                        image_array,
-                        threshold=threshold,
-                        simplify=simplify,
-                        background_color=background_color if analysis.get('has_transparency') else None
-                    )
-                else:
-                    svg_content = png_to_svg_embed(image_array)
-                
-                results.append((filename, svg_content, True, ""))
-            except Exception as e:
-                results.append((filename, "", False, str(e)))
-            
-            update_progress(i + 1, len(images_data))
+    if use_auto_recommend:
+        method = 'auto'
+    else:
+        method = 'trace' if conversion_method == "Vektorisierung (Tracing)" else 'embed'
+    
+    # The ZIP is compressed into a temporary file while the images are
+    # converted, instead of building it in memory afterwards. Each SVG goes
+    # into the archive as it arrives; only its size and the first few SVGs
+    # for the grid below are kept
+    archive_file = tempfile.TemporaryFile()
+    summary = []
+    previews = []
+    
+    def keep_result(result):
+        filename, svg_content, success, error = result
+        archive.add_result(result)
+        svg_size = len(svg_content.encode('utf-8')) if success else 0
+        summary.append((filename, svg_size, success, error))
+        if success and len(previews) < BATCH_PREVIEW_COUNT and svg_size <= PREVIEW_MAX_SVG_BYTES:
+            previews.append((filename, svg_content, svg_size))
+    
+    with st.spinner("Verarbeite Bilder..."), ZipStreamWriter(archive_file) as archive:
+        process_batch(
+            images_data,
+            convert_file,
+            max_workers=min(len(images_data), os.cpu_count() or 1),
+            progress_callback=update_progress,
+            backend='process',
+            cache=get_cache(),
+            executor=get_batch_executor(),
+            result_callback=keep_result,
+            keep_results=False,
+            method=method,
+            background_color=background_color,
+            embed_options=embed_options,
+            profile=profile,
+            **trace_options
+        )
     
     progress_bar.empty()
     status_text.empty()
+    show_profile(profile)
     
     # Display results summary
-    successful = sum(1 for _, _, success, _ in results if success)
-    st.success(f"{successful}/{len(results)} Bilder erfolgreich konvertiert")
+    successful = sum(1 for _, _, success, _ in summary if success)
+    st.success(f"{successful}/{len(summary)} Bilder erfolgreich konvertiert")
     
-    if successful < len(results):
-        st.warning(f"{len(results) - successful} Fehler aufgetreten")
+    if successful < len(summary):
+        st.warning(f"{len(summary) - successful} Fehler aufgetreten")
     
-    # Show results in grid
     st.markdown("### Ergebnisse")
-    
-    cols = st.columns(min(3, len(results)))
-    for idx, (filename, svg_content, success, error) in enumerate(results):
-        with cols[idx % len(cols)]:
-            if success:
+    st.table([
+        {
+            'Datei': filename,
+            'Größe (KB)': round(svg_size / 1024, 1) if success else None,
+            'Status': "OK" if success else f"Fehler: {error}"
+        }
+        for filename, svg_size, success, error in summary
+    ])
+    
+    # Show the kept previews in a grid
+    if previews:
+        if len(previews) < successful:
+            st.caption(f"Vorschau der ersten {len(previews)} von {successful} SVGs; alle sind im ZIP enthalten.")
+        
+        cols = st.columns(min(3, len(previews)))
+        for idx, (filename, svg_content, svg_size) in enumerate(previews):
+            with cols[idx % len(cols)]:
                 st.markdown(f"**{filename}**")
                 st.markdown(svg_content, unsafe_allow_html=True)
-                svg_size = len(svg_content.encode('utf-8'))
                 st.caption(f"{svg_size / 1024:.1f} KB")
                 
                 # Individual download
@@ -316,18 +552,15 @@ def process_batch_mode(
                     mime="image/svg+xml",
                     key=f"download_{idx}"
                 )
-            else:
-                st.markdown(f"**Fehler: {filename}**")
-                st.error(f"Fehler: {error}")
     
     # Bulk download as ZIP
     if successful > 0:
         st.markdown("---")
-        zip_data = create_zip_archive(results)
+        archive_file.seek(0)
         
         st.download_button(
             label=f"Alle SVGs als ZIP herunterladen ({successful} Dateien)",
-            data=zip_data,
+            data=archive_file,
             file_name="converted_svgs.zip",
             mime="application/zip",
             width='stretch'
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+import pytest
+
+from utils.auto_threshold import otsu_threshold, parse_threshold, select_threshold, triangle_threshold
+
+
+def _histogram(gray):
+    return np.bincount(gray.ravel(), minlength=256)
+
+
+def _cv2_threshold(gray, method):
+    return int(cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | method)[0])
+
+
+def _gray_images():
+    rng = np.random.default_rng(0)
+    for level in range(256):
+        yield np.full((4, 4), level, dtype=np.uint8)
+    for low, high in rng.integers(0, 256, (200, 2)).tolist():
+        yield np.array([[low, low, low, high]], dtype=np.uint8)
+    for _ in range(50):
+        yield rng.integers(0, 256, (16, 16), dtype=np.uint8)
+        yield np.clip(rng.normal(rng.integers(0, 256), 20, (32, 32)), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize('method, function', [
+    (cv2.THRESH_OTSU, otsu_threshold),
+    (cv2.THRESH_TRIANGLE, triangle_threshold),
+])
+def test_matches_cv2(method, function):
+    for gray in _gray_images():
+        assert function(_histogram(gray)) == _cv2_threshold(gray, method), np.unique(gray)
+
+
+def test_triangle_single_level_stays_in_range():
+    for level in (0, 255):
+        assert 0 <= triangle_threshold(_histogram(np.full((2, 2), level, dtype=np.uint8))) <= 255
+
+
+def test_select_threshold():
+    histogram = _histogram(np.array([[10, 10, 200]], dtype=np.uint8))
+    assert select_threshold('otsu', histogram) == otsu_threshold(histogram)
+    with pytest.raises(ValueError):
+        select_threshold('adaptive', histogram)
+
+
+def test_parse_threshold():
+    assert parse_threshold('otsu') == 'otsu'
+    assert parse_threshold('100') == 100
+    for value in ('256', '-1', 'bright'):
+        with pytest.raises(ValueError):
+            parse_threshold(value)
+
+
+def test_trace_reports_chosen_threshold():
+    from utils.pipeline import image_histogram
+    from utils.svg_converter import png_to_svg_trace, png_to_svg_trace_info
+
+    rng = np.random.default_rng(1)
+    image = np.full((120, 160, 3), 220, dtype=np.uint8)
+    image[30:90, 40:120] = 40
+    image = np.clip(image + rng.normal(0, 6, image.shape), 0, 255).astype(np.uint8)
+    svg, num_contours, info = png_to_svg_trace_info(image, threshold='otsu')
+    assert info['threshold'] == otsu_threshold(image_histogram(image))
+    assert (svg, num_contours) == png_to_svg_trace(image, threshold='otsu')
+    assert png_to_svg_trace_info(image, threshold='adaptive')[2]['threshold'] is None
+    assert png_to_svg_trace_info(image, threshold=100)[2]['threshold'] == 100
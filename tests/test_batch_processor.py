@@ -0,0 +1,63 @@
+import numpy as np
+
+from utils.batch_processor import convert_image, create_executor, iter_batch, process_batch
+
+
+def _images(count=5):
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(count):
+        image = np.full((60, 80, 3), 230, dtype=np.uint8)
+        x, y = rng.integers(5, 40, 2)
+        image[y:y + 15, x:x + 25] = 20 + 30 * i
+        images.append((f"{i}.png", image))
+    return images
+
+
+def test_backends_give_the_same_results_in_order():
+    images = _images()
+    expected = process_batch(images, convert_image, max_workers=2, method='trace')
+    assert [name for name, _, _, _ in expected] == [name for name, _ in images]
+    assert all(success for _, _, success, _ in expected)
+    assert process_batch(images, convert_image, max_workers=2, backend='process', method='trace') == expected
+
+
+def test_process_backend_falls_back_to_threads_for_lambdas():
+    images = _images(3)
+    results = process_batch(images, lambda image, **kwargs: convert_image(image, **kwargs),
+                            max_workers=2, backend='process', method='trace')
+    assert results == process_batch(images, convert_image, method='trace')
+
+
+def test_errors_are_reported_per_file():
+    def fail_on_second(image, **kwargs):
+        if image[0, 0, 0] != 230 or image.mean() < 200:
+            raise RuntimeError("broken image")
+        return convert_image(image, **kwargs)
+
+    images = _images(2) + [("dark.png", np.zeros((10, 10, 3), dtype=np.uint8))]
+    results = process_batch(images, fail_on_second, method='trace')
+    assert [success for _, _, success, _ in results] == [True, True, False]
+    assert results[2][3] == "broken image"
+
+
+def test_shared_executor_is_left_running():
+    images = _images(3)
+    executor = create_executor('process', 2)
+    try:
+        first = list(iter_batch(images, convert_image, backend='process', executor=executor, method='trace'))
+        second = list(iter_batch(images, convert_image, backend='process', executor=executor, method='trace'))
+    finally:
+        executor.shutdown()
+    assert first == second
+    assert all(success for _, _, success, _ in first)
+
+
+def test_results_can_be_dropped_after_the_callback():
+    images = _images(3) + [("empty.png", np.zeros((0, 0, 3), dtype=np.uint8))]
+    expected = process_batch(images, convert_image, method='trace')
+    seen = []
+    results = process_batch(images, convert_image, result_callback=seen.append, keep_results=False, method='trace')
+    assert seen == expected
+    assert results == [(name, None, success, error) for name, _, success, error in expected]
+    assert [success for _, _, success, _ in results] == [True, True, True, False]
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+import pytest
+
+from utils.color_sampling import _sample_with_labels, sample_compound_colors, sample_contour_colors
+from .test_tiled_trace import _scene
+
+
+def _mask_mean(image, fill, clear=()):
+    """Reference: one full-image mask per contour and cv2.mean"""
+    mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    cv2.drawContours(mask, [fill], -1, 255, -1)
+    if clear:
+        cv2.drawContours(mask, list(clear), -1, 0, -1)
+        cv2.drawContours(mask, list(clear), -1, 255, 1)
+    channels = image.shape[2] if image.ndim == 3 else 1
+    return cv2.mean(image, mask=mask)[:channels]
+
+
+def _binary(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)[1]
+
+
+@pytest.mark.parametrize('gray', [False, True])
+@pytest.mark.parametrize('retrieval, disjoint', [(cv2.RETR_EXTERNAL, True), (cv2.RETR_TREE, False)])
+def test_contour_colors_match_masks(gray, retrieval, disjoint):
+    for seed in range(3):
+        image = _scene(seed)
+        contours, _ = cv2.findContours(_binary(image), retrieval, cv2.CHAIN_APPROX_SIMPLE)
+        if gray:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        expected = np.array([_mask_mean(image, contour) for contour in contours])
+        # All contours and only the first few
+        for subset in (contours, contours[:3]):
+            colors = sample_contour_colors(image, subset, disjoint=disjoint)
+            np.testing.assert_allclose(colors, expected[:len(subset)], rtol=0, atol=1e-9)
+            assert (colors.astype(int) == expected[:len(subset)].astype(int)).all()
+        if disjoint:
+            # Sparse scenes take the ROI path above; the label image as well
+            channels = 1 if gray else 3
+            colors = _sample_with_labels(image, contours, channels)
+            np.testing.assert_allclose(colors, expected, rtol=0, atol=1e-9)
+
+
+def test_compound_colors_match_masks():
+    for seed in range(3):
+        image = _scene(seed)
+        contours, hierarchy = cv2.findContours(_binary(image), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        links = hierarchy[0]
+        outlines = [i for i in range(len(contours)) if links[i][3] < 0]
+        expected = []
+        for i in outlines:
+            holes, child = [], links[i][2]
+            while child >= 0:
+                holes.append(contours[child])
+                child = links[child][0]
+            expected.append(_mask_mean(image, contours[i], holes))
+        colors = sample_compound_colors(image, contours, hierarchy, outlines)
+        np.testing.assert_allclose(colors, expected, rtol=0, atol=1e-9)
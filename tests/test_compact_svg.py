@@ -0,0 +1,113 @@
+import re
+import xml.etree.ElementTree as ET
+
+import cv2
+import numpy as np
+import pytest
+
+from png2svg_cli import trace_to_svg
+from utils.svg_converter import png_to_svg_trace
+from .test_tiled_trace import _scene
+
+SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
+PATH_TOKEN = re.compile(r'[MLCZmlcz]|-?\d+(?:\.\d+)?')
+CURVE_SEGMENTS = 8
+
+_T = np.linspace(0, 1, CURVE_SEGMENTS + 1)[1:, None]
+_BERNSTEIN = np.hstack(((1 - _T) ** 3, 3 * _T * (1 - _T) ** 2, 3 * _T ** 2 * (1 - _T), _T ** 3))
+
+
+def _rings(path_data):
+    """Polygon rings of path data with absolute and relative M/L/C/Z commands"""
+    rings, ring, command, numbers = [], [], None, []
+    position = start = np.zeros(2)
+    for token in PATH_TOKEN.findall(path_data):
+        if token in 'MLCZmlcz':
+            command = token
+            if token in 'Zz':
+                rings.append(np.array(ring))
+                ring, position = [], start
+            continue
+        numbers.append(float(token))
+        origin = position if command.islower() else np.zeros(2)
+        if command in 'MLml' and len(numbers) == 2:
+            position = origin + numbers
+            if command in 'Mm' and not ring:
+                start = position
+            ring.append(position)
+            numbers = []
+            command = {'M': 'L', 'm': 'l'}.get(command, command)
+        elif command in 'Cc' and len(numbers) == 6:
+            controls = np.vstack([position, origin + np.reshape(numbers, (3, 2))])
+            ring.extend(_BERNSTEIN @ controls)
+            position = controls[-1]
+            numbers = []
+    return rings
+
+
+def _render(svg):
+    """Rasterize traced SVG: every path in document order, evenodd or nonzero"""
+    root = ET.fromstring(svg)
+    height, width = int(root.get('height')), int(root.get('width'))
+    canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    def paint(element, inherited):
+        style = {**inherited, **{name: element.get(name) for name in ('fill', 'fill-rule') if element.get(name)}}
+        tag = element.tag.replace(SVG_NAMESPACE, '')
+        if tag == 'rect':
+            canvas[:] = _rgb(style['fill'])
+        elif tag == 'path':
+            crossings = np.zeros((height, width), dtype=np.int32)
+            winding = np.zeros((height, width), dtype=np.int32)
+            for ring in _rings(element.get('d')):
+                mask = np.zeros((height, width), dtype=np.uint8)
+                cv2.fillPoly(mask, [np.rint(ring).astype(np.int32)], 1)
+                # The sign of the shoelace area is the ring's direction
+                x, y = ring[:, 0], ring[:, 1]
+                clockwise = np.dot(x, np.roll(y, -1)) >= np.dot(np.roll(x, -1), y)
+                crossings += mask
+                winding += mask if clockwise else -mask.astype(np.int32)
+            filled = crossings % 2 == 1 if style.get('fill-rule') == 'evenodd' else winding != 0
+            canvas[filled] = _rgb(style.get('fill', '#000000'))
+        for child in element:
+            paint(child, style)
+
+    paint(root, {})
+    return canvas
+
+
+def _rgb(color):
+    color = {'white': '#ffffff'}.get(color, color)
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+@pytest.mark.parametrize('options', [
+    {'invert': True},
+    {'threshold': 'otsu'},
+    {'invert': True, 'holes': True},
+    {'invert': True, 'curves': True},
+    {'invert': True, 'holes': True, 'curves': True},
+    {'mode': 'quantize', 'n_colors': 6},
+    {'mode': 'quantize', 'n_colors': 6, 'curves': True},
+])
+def test_compact_renders_the_same(options):
+    for seed, alpha in ((0, False), (1, True)):
+        image = _scene(seed, alpha)
+        plain, plain_contours = png_to_svg_trace(image, **options)
+        compact, compact_contours = png_to_svg_trace(image, compact=True, **options)
+        assert compact_contours == plain_contours
+        assert len(compact) < len(plain)
+        rendered = _render(plain)
+        assert len(np.unique(rendered.reshape(-1, 3), axis=0)) > 2
+        assert np.array_equal(_render(compact), rendered), (seed, alpha)
+
+
+@pytest.mark.parametrize('holes', [False, True])
+def test_cli_compact_renders_the_same(tmp_path, holes):
+    path = tmp_path / 'scene.png'
+    cv2.imwrite(str(path), _scene(2))
+    trace_to_svg(str(path), str(tmp_path / 'plain.svg'), holes=holes)
+    trace_to_svg(str(path), str(tmp_path / 'compact.svg'), holes=holes, compact=True)
+    plain, compact = (_render((tmp_path / name).read_text()) for name in ('plain.svg', 'compact.svg'))
+    assert len(np.unique(plain.reshape(-1, 3), axis=0)) > 2
+    assert np.array_equal(compact, plain)
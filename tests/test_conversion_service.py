@@ -0,0 +1,134 @@
+import asyncio
+import io
+import json
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.conversion_cache import ConversionCache
+from utils.conversion_service import ConversionService, start_http_server
+
+MAX_UPLOAD_BYTES = 1024 * 1024
+
+
+def _png():
+    image = np.full((300, 400, 3), 240, dtype=np.uint8)
+    cv2.ellipse(image, (200, 150), (140, 100), 0, 0, 360, (30, 30, 30), -1)
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+async def _request(port, method, target, body=b'', headers=None):
+    """One HTTP/1.1 request: (status, headers, body)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    headers = {'Content-Length': str(len(body)), **(headers or {})} if method == 'POST' else {}
+    head = [f"{method} {target} HTTP/1.1", 'Host: localhost']
+    head += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    response_headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), response_headers, body
+
+
+async def _json_request(port, method, target, body=b'', headers=None):
+    status, _, body = await _request(port, method, target, body, headers)
+    return status, json.loads(body)
+
+
+async def _exercise(service, port):
+    png = _png()
+
+    # Unknown options and bad lengths are rejected before anything is queued
+    status, reply = await _json_request(port, 'POST', '/jobs?colour=red', png)
+    assert status == 400 and 'colour' in reply['error']
+    for length in ('abc', '-5', '1e3', ''):
+        status, _ = await _json_request(port, 'POST', '/jobs', headers={'Content-Length': length})
+        assert status == 400, length
+    status, _ = await _json_request(port, 'POST', '/jobs', headers={'Content-Length': str(10 ** 9)})
+    assert status == 413
+    # Oversized request heads get an answer instead of a dropped connection
+    status, _ = await _json_request(port, 'GET', '/health?' + 'x' * 70000)
+    assert status == 414
+    status, _ = await _json_request(port, 'POST', '/jobs', png, {'X-Long': 'x' * 70000})
+    assert status == 431
+    status, reply = await _json_request(port, 'POST', '/jobs', png, {f"X-Header-{i}": i for i in range(150)})
+    assert status == 431 and 'header lines' in reply['error']
+    assert service.stats()['jobs'] == 0
+
+    # One worker, one waiting job: distinct submissions fill the queue
+    submitted, status = [], 202
+    for threshold in range(100, 110):
+        status, reply = await _json_request(port, 'POST', f"/jobs?method=trace&invert=1&threshold={threshold}", png)
+        if status != 202:
+            break
+        assert reply['status'] in ('queued', 'running')
+        submitted.append(reply['id'])
+    assert status == 429 and 1 <= len(submitted) <= 2
+
+    job_id = submitted[0]
+    for _ in range(600):
+        status, headers, body = await _request(port, 'GET', f"/jobs/{job_id}/result")
+        if status != 202:
+            break
+        await asyncio.sleep(0.1)
+    assert status == 200 and headers['Content-Type'] == 'image/svg+xml'
+    assert body.startswith(b'<') and b'<path' in body
+
+    # The same image and options are answered from the cache
+    status, reply = await _json_request(port, 'POST', '/jobs?method=trace&invert=1&threshold=100', png)
+    assert status == 200 and reply['cache_hit']
+    status, _, cached = await _request(port, 'GET', f"/jobs/{reply['id']}/result")
+    assert (status, cached) == (200, body)
+
+    status, reply = await _json_request(port, 'GET', '/health')
+    assert status == 200 and reply['cache']['hits'] >= 1
+
+
+def test_http_service():
+    async def run():
+        service = ConversionService(max_workers=1, queue_size=1, cache=ConversionCache())
+        await service.start()
+        server = await start_http_server(service, port=0, max_upload_bytes=MAX_UPLOAD_BYTES)
+        try:
+            await _exercise(service, server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            await server.wait_closed()
+            await service.stop()
+
+    asyncio.run(run())
+
+
+def test_dropped_results_come_from_the_cache():
+    async def run():
+        cache = ConversionCache()
+        service = ConversionService(max_workers=1, cache=cache, max_result_bytes=1)
+        await service.start()
+        server = await start_http_server(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            status, reply = await _json_request(port, 'POST', '/jobs?method=trace&invert=1', _png())
+            assert status == 202
+            job = await service.wait(reply['id'])
+            assert job.status == 'done' and job.result is None and service._result_bytes == 0
+
+            status, _, body = await _request(port, 'GET', f"/jobs/{job.id}/result")
+            assert status == 200 and len(body) == job.svg_bytes
+            status, reply = await _json_request(port, 'GET', f"/jobs/{job.id}")
+            assert reply['svg_bytes'] == job.svg_bytes
+
+            cache.clear()
+            status, _ = await _json_request(port, 'GET', f"/jobs/{job.id}/result")
+            assert status == 410
+        finally:
+            server.close()
+            await server.wait_closed()
+            await service.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,125 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from png2svg_cli import batch_main
+from utils.job_manifest import JobManifest, discover_inputs, unique_outputs
+
+
+def _write_inputs(directory, count=3):
+    os.makedirs(directory / 'nested')
+    paths = []
+    for i in range(count):
+        image = np.full((60, 80, 3), 240, dtype=np.uint8)
+        cv2.circle(image, (40, 30), 10 + 5 * i, (20, 20, 20), -1)
+        path = directory / ('nested' if i == 0 else '') / f"{i}.png"
+        cv2.imwrite(str(path), image)
+        paths.append(path)
+    return paths
+
+
+def _run(capsys, *argv):
+    """batch_main's exit code and its 'Converted N, skipped N, failed N' counts"""
+    code = batch_main([*map(str, argv), '-j', '1'])
+    summary = next(line for line in capsys.readouterr().out.splitlines() if line.startswith('Converted'))
+    counts = [int(word.rstrip(',')) for word in summary.split()[1:6:2]]
+    return code, counts
+
+
+def test_batch_resumes_from_manifest(tmp_path, capsys):
+    inputs, output = tmp_path / 'in', tmp_path / 'out'
+    paths = _write_inputs(inputs)
+    assert _run(capsys, inputs, '-o', output) == (0, [3, 0, 0])
+    outputs = sorted(output.rglob('*.svg'))
+    assert [path.relative_to(output).as_posix() for path in outputs] == ['1.svg', '2.svg', 'nested/0.svg']
+    written = {path: path.stat().st_mtime_ns for path in outputs}
+
+    # Nothing changed: every input is skipped without converting
+    assert _run(capsys, inputs, '-o', output) == (0, [0, 3, 0])
+    # A touched input with the same content is recognized by its hash
+    os.utime(paths[1], ns=(1, 1))
+    assert _run(capsys, inputs, '-o', output) == (0, [0, 3, 0])
+    assert {path: path.stat().st_mtime_ns for path in outputs} == written
+
+    # Changed content, a missing output and an interrupted append are redone
+    image = cv2.imread(str(paths[2]))
+    cv2.imwrite(str(paths[2]), 255 - image)
+    (output / 'nested' / '0.svg').unlink()
+    with open(output / 'manifest.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{"input": "partial')
+    assert _run(capsys, inputs, '-o', output) == (0, [2, 1, 0])
+
+    # Other parameters invalidate every record
+    assert _run(capsys, inputs, '-o', output, '--simplify', '3') == (0, [3, 0, 0])
+    assert _run(capsys, inputs, '-o', output, '--simplify', '3', '--force') == (0, [3, 0, 0])
+
+    manifest = JobManifest(str(output / 'manifest.jsonl'))
+    assert len(manifest.records) == 3
+    assert all(record['status'] == 'ok' for record in manifest.records.values())
+    with open(output / 'manifest.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 3  # compacted after the run
+
+
+def test_failed_inputs_are_retried(tmp_path, capsys):
+    inputs, output = tmp_path / 'in', tmp_path / 'out'
+    paths = _write_inputs(inputs, 2)
+    paths[0].write_bytes(b'not an image')
+    assert _run(capsys, inputs, '-o', output) == (1, [1, 0, 1])
+    cv2.imwrite(str(paths[0]), np.zeros((10, 10, 3), dtype=np.uint8))
+    assert _run(capsys, inputs, '-o', output) == (0, [1, 1, 0])
+
+
+def test_manifest_keeps_latest_record(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    manifest = JobManifest(path)
+    manifest.append({'input': 'a', 'status': 'error'})
+    manifest.append({'input': 'b', 'status': 'ok'})
+    manifest.append({'input': 'a', 'status': 'ok'})
+    manifest.close()
+    reloaded = JobManifest(path)
+    assert reloaded.lookup('a')['status'] == 'ok'
+    reloaded.compact()
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)['input'] for line in f] == ['a', 'b']
+
+
+def test_append_after_interrupted_line(tmp_path):
+    path = tmp_path / 'manifest.jsonl'
+    path.write_text('{"input": "a", "status": "ok"}\n{"input": "b", "sta', encoding='utf-8')
+    manifest = JobManifest(str(path))
+    assert list(manifest.records) == ['a']
+    manifest.append({'input': 'c', 'status': 'ok'})
+    manifest.close()
+    assert list(JobManifest(str(path)).records) == ['a', 'c']
+
+
+def test_discover_inputs_mirrors_the_tree(tmp_path):
+    _write_inputs(tmp_path)
+    (tmp_path / 'notes.txt').write_text('skip me')
+    found = [relative for _, relative in discover_inputs([str(tmp_path)])]
+    assert found == ['1.png', '2.png', os.path.join('nested', '0.png')]
+    pattern = str(tmp_path / '**' / '*.png')
+    assert sorted(relative for _, relative in discover_inputs([pattern])) == sorted(found)
+
+
+def test_same_named_inputs_are_rejected(tmp_path, capsys):
+    for folder in ('a', 'b'):
+        os.makedirs(tmp_path / folder)
+        cv2.imwrite(str(tmp_path / folder / 'x.png'), np.zeros((10, 10, 3), dtype=np.uint8))
+    first, second = str(tmp_path / 'a' / 'x.png'), str(tmp_path / 'b' / 'x.png')
+    output = tmp_path / 'out'
+    with pytest.raises(SystemExit) as exited:
+        batch_main([first, second, '-o', str(output), '-j', '1'])
+    assert exited.value.code == 2
+    error = capsys.readouterr().err
+    assert 'same output' in error and first in error and second in error
+    assert not output.exists()
+
+    # The same file twice is converted once; x.png and x.jpg clash as well
+    assert _run(capsys, first, first, '-o', output) == (0, [1, 0, 0])
+    cv2.imwrite(str(tmp_path / 'a' / 'x.jpg'), np.zeros((10, 10, 3), dtype=np.uint8))
+    with pytest.raises(ValueError, match='x.jpg'):
+        unique_outputs(discover_inputs([str(tmp_path / 'a')]))
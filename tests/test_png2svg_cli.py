@@ -0,0 +1,78 @@
+import gzip
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from png2svg_cli import embed_to_svg, trace_to_svg
+from utils.conversion_cache import ConversionCache
+from utils.svg_converter import png_to_svg_trace, write_svg_trace
+
+
+def _logo():
+    image = np.full((240, 320, 3), 250, dtype=np.uint8)
+    cv2.circle(image, (90, 120), 60, (200, 30, 30), -1)
+    cv2.circle(image, (90, 120), 25, (250, 250, 250), -1)
+    cv2.rectangle(image, (180, 40), (300, 200), (20, 60, 160), -1)
+    cv2.putText(image, 'AB', (190, 150), cv2.FONT_HERSHEY_SIMPLEX, 2, (250, 250, 250), 5)
+    return image
+
+
+@pytest.fixture
+def logo_png(tmp_path):
+    path = tmp_path / 'logo.png'
+    Image.fromarray(_logo()).save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'compact': True},
+    {'holes': True, 'curves': True},
+    {'threshold': 'otsu', 'despeckle': 30},
+    {'mode': 'quantize', 'n_colors': 4},
+])
+def test_streamed_svg_matches_joined(options):
+    image = _logo()
+    sink = io.StringIO()
+    written, num_contours = write_svg_trace(image, sink, **options)
+    svg, expected_contours = png_to_svg_trace(image, **options)
+    assert sink.getvalue() == svg
+    assert (written, num_contours) == (len(svg), expected_contours)
+
+
+@pytest.mark.parametrize('extension', ['svg', 'svgz'])
+def test_cached_outputs_are_byte_identical(tmp_path, logo_png, extension):
+    cache_dir = str(tmp_path / 'cache')
+    fresh = tmp_path / f"fresh.{extension}"
+    cache, info = ConversionCache(disk_dir=cache_dir), {}
+    paths, _ = trace_to_svg(logo_png, str(fresh), threshold='otsu', cache=cache, info=info)
+    assert paths > 0 and info['threshold'] is not None
+
+    # Served from the memory tier and, as in a new process, from the disk tier
+    for cache in (cache, ConversionCache(max_bytes=0, disk_dir=cache_dir)):
+        cached, cached_info = tmp_path / f"cached.{extension}", {}
+        assert trace_to_svg(logo_png, str(cached), threshold='otsu', cache=cache, info=cached_info)[0] == paths
+        assert cached.read_bytes() == fresh.read_bytes()
+        assert cached_info == info
+        assert cache.stats()['hits'] == 1
+
+    uncached = tmp_path / f"uncached.{extension}"
+    trace_to_svg(logo_png, str(uncached), threshold='otsu')
+    assert uncached.read_bytes() == fresh.read_bytes()
+
+
+def test_svgz_is_the_gzipped_svg(tmp_path, logo_png):
+    trace_to_svg(logo_png, str(tmp_path / 'logo.svg'), compact=True)
+    trace_to_svg(logo_png, str(tmp_path / 'logo.svgz'), compact=True)
+    assert gzip.decompress((tmp_path / 'logo.svgz').read_bytes()) == (tmp_path / 'logo.svg').read_bytes()
+
+
+def test_cached_embed_is_byte_identical(tmp_path, logo_png):
+    cache_dir = str(tmp_path / 'cache')
+    size, info = embed_to_svg(logo_png, str(tmp_path / 'fresh.svg'), cache=ConversionCache(disk_dir=cache_dir))
+    cached = embed_to_svg(logo_png, str(tmp_path / 'cached.svg'), cache=ConversionCache(disk_dir=cache_dir))
+    assert cached == (size, info)
+    assert (tmp_path / 'cached.svg').read_bytes() == (tmp_path / 'fresh.svg').read_bytes()
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+
+from utils.speck_filter import cull_contours, remove_specks
+from utils.svg_converter import png_to_svg_trace
+
+
+def _scan():
+    """White page with a square, a hairline and a few one-pixel specks"""
+    image = np.full((120, 160, 3), 255, dtype=np.uint8)
+    image[20:80, 20:80] = 0
+    image[100, 10:150] = 0
+    for y, x in ((10, 100), (40, 120), (60, 140)):
+        image[y, x] = 0
+    return image
+
+
+def test_remove_specks_area():
+    mask = cv2.cvtColor(_scan(), cv2.COLOR_RGB2GRAY) < 128
+    cleaned, specks, holes = remove_specks(mask, 4)
+    assert (specks, holes) == (3, 0)
+    assert cleaned[100, 10:150].all() and cleaned[20:80, 20:80].all()
+
+
+def test_remove_specks_kernel_erases_hairlines():
+    mask = cv2.cvtColor(_scan(), cv2.COLOR_RGB2GRAY) < 128
+    cleaned, _, _ = remove_specks(mask, 0, kernel_size=3)
+    assert not cleaned[100].any()
+    assert cleaned[20:80, 20:80].all()
+
+
+def test_trace_despeckle_kernel():
+    image = _scan()
+    _, plain = png_to_svg_trace(image, invert=True, tile_size=0)
+    _, area = png_to_svg_trace(image, invert=True, tile_size=0, despeckle=4)
+    _, kernel = png_to_svg_trace(image, invert=True, tile_size=0, despeckle_kernel=3)
+    assert (plain, area, kernel) == (5, 2, 1)
+    # Off by default: 0 and 1 trace the mask as thresholded
+    assert png_to_svg_trace(image, invert=True, tile_size=0, despeckle_kernel=1) == \
+        png_to_svg_trace(image, invert=True, tile_size=0)
+
+
+def test_cull_contours_matches_cv2():
+    rng = np.random.default_rng(0)
+    contours = [rng.integers(0, 50, (n, 1, 2), dtype=np.int32) for n in rng.integers(1, 12, 200)]
+    expected = [i for i, c in enumerate(contours) if len(c) > 2 and cv2.contourArea(c) > 30]
+    assert cull_contours(contours, min_points=2, min_area=30).tolist() == expected
@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+import pytest
+
+from utils.svg_converter import png_to_svg_trace
+from utils.tiled_trace import trace_tiled
+
+
+def _scene(seed, alpha=False):
+    """Overlapping ellipses, text and specks, so shapes cross every seam"""
+    rng = np.random.default_rng(seed)
+    image = np.full((300, 420, 3), 235, dtype=np.uint8)
+    for _ in range(40):
+        center = tuple(rng.integers(0, (420, 300)).tolist())
+        axes = tuple(rng.integers(3, 60, 2).tolist())
+        color = tuple(rng.integers(0, 256, 3).tolist())
+        cv2.ellipse(image, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+    cv2.putText(image, 'Seam', (20, 200), cv2.FONT_HERSHEY_SIMPLEX, 3, (10, 10, 10), 7)
+    image[rng.random(image.shape[:2]) < 0.01] = 0
+    if alpha:
+        opacity = np.full(image.shape[:2] + (1,), 255, dtype=np.uint8)
+        opacity[:, :100] = 0
+        image = np.concatenate([image, opacity], axis=2)
+    return image
+
+
+@pytest.mark.parametrize('seed, alpha', [(0, False), (1, True)])
+@pytest.mark.parametrize('tile_size', [37, 64, 128])
+def test_tiled_trace_equals_untiled(seed, alpha, tile_size):
+    image = _scene(seed, alpha)
+    for options in ({}, {'threshold': 'otsu'}, {'threshold': 90, 'simplify': 1}, {'compact': True},
+                    {'invert': True, 'background_color': '#ff0000'}):
+        untiled = png_to_svg_trace(image, tile_size=0, **options)
+        assert untiled[1] > 0
+        assert png_to_svg_trace(image, tile_size=tile_size, **options) == untiled, options
+
+
+def test_trace_tiled_matches_single_tile():
+    image = _scene(2)
+    approxes, colors, num_contours = trace_tiled(image, tile_size=1024)
+    tiled = trace_tiled(image, tile_size=50, max_workers=2)
+    assert (tiled[1], tiled[2]) == (colors, num_contours)
+    assert len(tiled[0]) == len(approxes)
+    assert all(np.array_equal(a, b) for a, b in zip(tiled[0], approxes))
@@ -0,0 +1,94 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from utils.conversion_cache import ConversionCache
+from utils.lru import ByteLRU, DigestMemo
+from utils.pipeline import ConversionPipeline
+from utils.svg_writer import join_svg
+from utils.trace_memo import TraceMemo
+
+
+def _logo():
+    rng = np.random.default_rng(0)
+    image = np.full((96, 128, 3), 255, dtype=np.uint8)
+    for _ in range(12):
+        y, x = rng.integers(0, 80, 2)
+        image[y:y + 16, x:x + 24] = rng.integers(0, 256, 3)
+    return image
+
+
+def test_byte_lru_evicts_least_recently_used():
+    lru = ByteLRU(30, len)
+    lru.put('a', b'x' * 10)
+    lru.put('b', b'x' * 10)
+    lru.put('c', b'x' * 10)
+    assert lru.get('a')[0]  # 'a' is now the most recently used
+    lru.put('d', b'x' * 10)
+    assert [lru.get(key)[0] for key in 'abcd'] == [True, False, True, True]
+    assert (len(lru), lru.nbytes) == (3, 30)
+    lru.put('e', b'x' * 31)  # larger than the whole budget: not stored
+    assert not lru.get('e')[0] and lru.nbytes == 30
+
+
+def test_digest_memo_reuses_last_array():
+    image = _logo()
+    digest = DigestMemo()
+    assert digest(image) == digest(image) == digest(image.copy())
+    other = image.copy()
+    other[0, 0] = 0
+    assert digest(other) != digest(image)
+
+
+def test_memo_results_equal_fresh_traces():
+    image = _logo()
+    memo = TraceMemo()
+    memoized = ConversionPipeline(memo=memo)
+    sweeps = [
+        {'threshold': threshold, 'simplify': simplify, 'tile_size': 0}
+        for threshold in (96, 128, 'otsu', 'triangle', 'adaptive') for simplify in (1, 3)
+    ] + [
+        {'mode': 'quantize', 'n_colors': n_colors, 'simplify': simplify, 'despeckle': despeckle}
+        for n_colors in (4, 8) for simplify in (1, 3) for despeckle in (0, 20)
+    ]
+    for options in sweeps + sweeps:
+        fresh = ConversionPipeline().trace(image, **options)
+        result = memoized.trace(image, **options)
+        assert join_svg(result.chunks) == join_svg(fresh.chunks), options
+        assert (result.num_contours, result.threshold) == (fresh.num_contours, fresh.threshold)
+    assert memo.stats()['hits'] > 0
+
+
+def test_cache_serves_stored_results():
+    cache = ConversionCache(max_bytes=1024)
+    calls = []
+
+    def convert(image_array, scale=1):
+        calls.append(scale)
+        return image_array.sum() * scale
+
+    image = _logo()
+    assert cache.call(convert, image, scale=2) == cache.call(convert, image, scale=2)
+    assert cache.call(convert, image, scale=3) == image.sum() * 3
+    assert calls == [2, 3]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+
+def test_concurrent_disk_writes_leave_no_temp_files(tmp_path):
+    cache = ConversionCache(disk_dir=str(tmp_path))
+    values = [np.full(50000, i, dtype=np.uint8) for i in range(8)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda value: cache.put('same-key', value), values * 4))
+    assert [path.name for path in tmp_path.iterdir()] == ['same-key.pkl']
+    found, value = ConversionCache(max_bytes=0, disk_dir=str(tmp_path)).get('same-key')
+    assert found and any(np.array_equal(value, candidate) for candidate in values)
+
+    # A value that cannot be pickled leaves nothing behind either
+    with pytest.raises((pickle.PicklingError, AttributeError)):
+        cache.put('lambda', lambda: None)
+    assert [path.name for path in tmp_path.iterdir()] == ['same-key.pkl']
@@ -3,12 +3,14 @@ Utility modules for image to SVG conversion
 """
 
 from .svg_converter import png_to_svg_trace, png_to_svg_embed
+from .pipeline import ConversionPipeline
 from .image_analyzer import analyze_image, recommend_method
 from .batch_processor import process_batch
 
 __all__ = [
     'png_to_svg_trace',
     'png_to_svg_embed',
+    'ConversionPipeline',
     'analyze_image',
     'recommend_method',
     'process_batch',
@@ -0,0 +1,157 @@
+"""
+Automatic threshold selection
+
+Instead of a fixed value, a trace can pick its threshold from the image:
+
+    otsu      global, maximizes the between-class variance (two clear tones)
+    triangle  global, for one dominant tone with a long tail (faint strokes)
+    adaptive  local, every pixel against the mean of its neighbourhood
+              (unevenly lit scans, shadows)
+
+The global methods work on a 256-bin grayscale histogram, which the pipeline
+computes once per image from a bounded sample (see
+utils.pipeline.image_histogram) and shares with analyze_image, so the
+threshold the analysis suggests is the one the trace uses. otsu_threshold
+and triangle_threshold return the same values as cv2.threshold with
+THRESH_OTSU and THRESH_TRIANGLE on the sampled pixels.
+"""
+import cv2
+import numpy as np
+
+THRESHOLD_METHODS = ('otsu', 'triangle', 'adaptive')
+
+# Neighbourhood of adaptive_threshold: this share of the shorter image side
+# (odd, at least ADAPTIVE_MIN_BLOCK)
+ADAPTIVE_BLOCK_FRACTION = 1 / 16
+ADAPTIVE_MIN_BLOCK = 15
+
+# Pixels must differ from their neighbourhood mean by this share of the
+# distance between the two Otsu class means (at least ADAPTIVE_MIN_OFFSET
+# gray levels), so paper grain does not become specks
+ADAPTIVE_OFFSET_SHARE = 0.25
+ADAPTIVE_MIN_OFFSET = 8
+
+
+def parse_threshold(value):
+    """
+    Threshold option from text: a number (0-255) or one of THRESHOLD_METHODS
+
+    Raises:
+        ValueError: Neither
+    """
+    if value in THRESHOLD_METHODS:
+        return value
+    try:
+        threshold = int(value)
+    except ValueError:
+        raise ValueError(f"must be 0-255 or one of {', '.join(THRESHOLD_METHODS)}") from None
+    if not 0 <= threshold <= 255:
+        raise ValueError("must be 0-255")
+    return threshold
+
+
+def select_threshold(method, histogram):
+    """
+    Global threshold of a histogram
+
+    Args:
+        method: 'otsu' or 'triangle'
+        histogram: 256 pixel counts
+
+    Returns:
+        int: Threshold; pixels above it are the light class
+    """
+    if method == 'otsu':
+        return otsu_threshold(histogram)
+    if method == 'triangle':
+        return triangle_threshold(histogram)
+    raise ValueError(f"Unknown threshold method: {method}")
+
+
+def otsu_threshold(histogram):
+    """Otsu's threshold of a 256-bin histogram (as cv2.THRESH_OTSU)"""
+    histogram = np.asarray(histogram, dtype=np.float64)
+    total = histogram.sum()
+    if not total:
+        return 0
+    p = histogram / total
+    levels = np.arange(256)
+    q1 = np.cumsum(p)
+    q2 = 1 - q1
+    mean1 = np.cumsum(levels * p)
+    mean = mean1[-1]
+    valid = (np.minimum(q1, q2) >= np.finfo(np.float32).eps) & (np.maximum(q1, q2) <= 1 - np.finfo(np.float32).eps)
+    if not valid.any():
+        return 0
+    q1, q2, mean1 = q1[valid], q2[valid], mean1[valid]
+    mu1 = mean1 / q1
+    mu2 = (mean - mean1) / q2
+    sigma = q1 * q2 * (mu1 - mu2) ** 2
+    best = int(np.argmax(sigma))
+    return int(levels[valid][best]) if sigma[best] > 0 else 0
+
+
+def triangle_threshold(histogram):
+    """Triangle threshold of a 256-bin histogram (as cv2.THRESH_TRIANGLE)"""
+    histogram = np.asarray(histogram, dtype=np.int64)
+    used = np.flatnonzero(histogram)
+    if not len(used):
+        return 0
+    left = max(int(used[0]) - 1, 0)
+    right = min(int(used[-1]) + 1, 255)
+    peak = int(np.argmax(histogram))
+    height = int(histogram[peak])
+
+    # The tail is on the right: mirror so it is always on the left
+    flipped = peak - left < right - peak
+    if flipped:
+        histogram = histogram[::-1]
+        left, peak = 255 - right, 255 - peak
+
+    threshold = left
+    levels = np.arange(left + 1, peak + 1)
+    if len(levels):
+        distance = height * levels + (left - peak) * histogram[levels]
+        best = int(np.argmax(distance))
+        if distance[best] > 0:
+            threshold = int(levels[best])
+    threshold -= 1
+    return 255 - threshold if flipped else threshold
+
+
+def class_means(histogram, threshold):
+    """Mean gray level at and below threshold, and above it"""
+    histogram = np.asarray(histogram, dtype=np.float64)
+    levels = np.arange(256)
+    low, high = histogram[:threshold + 1], histogram[threshold + 1:]
+    dark = (levels[:threshold + 1] * low).sum() / max(low.sum(), 1)
+    light = (levels[threshold + 1:] * high).sum() / max(high.sum(), 1)
+    return dark, light
+
+
+def adaptive_threshold(gray, histogram, inverse=False, out=None):
+    """
+    Binarize against the local mean (cv2.adaptiveThreshold, box mean)
+
+    The offset scales with the contrast between the Otsu classes of the
+    image's histogram, so flat paper stays empty whatever its grain.
+
+    Args:
+        gray: uint8 (H, W) image
+        histogram: 256-bin histogram of the image (for the offset)
+        inverse: Dark pixels become the foreground
+        out: Optional uint8 (H, W) array to write the mask into
+
+    Returns:
+        tuple: (uint8 mask, 255 for foreground; block size; offset)
+    """
+    height, width = gray.shape
+    block = max(ADAPTIVE_MIN_BLOCK, int(min(height, width) * ADAPTIVE_BLOCK_FRACTION)) | 1
+    dark, light = class_means(histogram, otsu_threshold(histogram))
+    offset = max(ADAPTIVE_MIN_OFFSET, ADAPTIVE_OFFSET_SHARE * (light - dark))
+    kind = cv2.THRESH_BINARY_INV if inverse else cv2.THRESH_BINARY
+    # Foreground (binary): lighter than the local mean by more than the
+    # offset; inverse: darker by more than it
+    mask = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, kind, block,
+                                 offset if inverse else -offset, dst=out)
+    return mask, block, offset
@@ -1,94 +1,388 @@
 """
 Batch processing for multiple images
 """
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import io
-import zipfile
-from typing import List, Callable, Tuple
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
+from multiprocessing import get_context, shared_memory
+import pickle
+from typing import Iterable, Iterator, List, Callable, NamedTuple, Tuple
 import numpy as np
 
+from .conversion_cache import ConversionCache, cached_analyze, cached_embed, cached_embed_file, cached_trace
+from .image_analyzer import recommend_method
+from .image_io import load_image, read_bytes
+from .profiling import Profiler, profile_stage
+from .zip_stream import DEFAULT_COMPRESSLEVEL, iter_zip
+
+BatchResult = Tuple[str, str, bool, str]
+
+# Distinguishes batch results (SVG str) from direct calls in cache keys
+_BATCH_CACHE_TAG = ('batch',)
+
+# Worker processes start fresh instead of forking the parent (threads, open
+# files and locks of the app or service are not inherited)
+WORKER_START_METHOD = 'spawn'
+
+
+class SharedArrayRef(NamedTuple):
+    """Handle to an image the parent copied into shared memory"""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+def convert_image(image_array, method='auto', background_color=None, **trace_options):
+    """
+    Convert one image the way the app does: analyze, pick a method, convert
+    
+    Top-level (picklable) so it can run in process-pool workers.
+    
+    Args:
+        image_array: NumPy array of the image
+        method: 'trace', 'embed' or 'auto' (use recommend_method)
+        background_color: Background for transparent images when tracing
+        **trace_options: Extra arguments for png_to_svg_trace
+    
+    Returns:
+        str: SVG content
+    """
+    analysis = cached_analyze(image_array)
+    if method == 'auto':
+        method = recommend_method(analysis)['method']
+    
+    if method == 'trace':
+        svg_content, _ = cached_trace(
+            image_array,
+            background_color=background_color if analysis['has_transparency'] else None,
+            **trace_options
+        )
+        return svg_content
+    return cached_embed(image_array)
+
+
+def convert_file(source, method='auto', background_color=None, embed_options=None, **trace_options):
+    """
+    Decode an image file (path or encoded bytes) and convert it like convert_image
+    
+    Decoding happens in the worker, so the parent never holds decoded
+    pixels and memory is bounded by the number of workers, not the batch.
+    Embedding uses the encoded file itself (see file_to_svg_embed), so
+    method='embed' never decodes the pixels at all.
+    
+    Args:
+        source: Path or encoded image bytes
+        method, background_color, **trace_options: As in convert_image
+        embed_options: Optional dict with reencode, quality, png_level
+    
+    Returns:
+        str: SVG content
+    """
+    if method != 'embed':
+        image_array = load_image(source)
+        analysis = cached_analyze(image_array)
+        if method == 'auto':
+            method = recommend_method(analysis)['method']
+        if method == 'trace':
+            return convert_image(image_array, 'trace', background_color, **trace_options)
+    
+    file_bytes = read_bytes(source)
+    try:
+        return cached_embed_file(file_bytes, **(embed_options or {}))
+    except OSError:
+        # Not an encoded image (e.g. a .npy array): embed the pixels as PNG
+        return cached_embed(load_image(source))
+
 
 def process_batch(
-    images_data: List[Tuple[str, np.ndarray]],
+    images_data: Iterable[Tuple[str, np.ndarray]],
     conversion_func: Callable,
     max_workers: int = 4,
     progress_callback: Callable = None,
+    backend: str = 'thread',
+    chunksize: int = 1,
+    max_in_flight: int = None,
+    cache: ConversionCache = None,
+    executor: Executor = None,
+    profile: Profiler = None,
+    result_callback: Callable = None,
+    keep_results: bool = True,
     **conversion_kwargs
-) -> List[Tuple[str, str, bool, str]]:
+) -> List[BatchResult]:
     """
     Process multiple images in parallel
     
     Args:
-        images_data: List of (filename, image_array) tuples
-        conversion_func: Function to call for each image
+        images_data: Iterable of (filename, image_array) tuples; any
+            iterable works (e.g. utils.image_io.iter_images) and is
+            consumed lazily, or (filename, path/bytes) for convert_file
+        conversion_func: Function to call for each image; the process
+            backend needs a picklable (module-level) function and kwargs and
+            falls back to threads otherwise
         max_workers: Maximum number of parallel workers
         progress_callback: Optional callback function(current, total)
+        backend: 'thread' or 'process' (real parallelism)
+        chunksize: Images handed to a worker per task
+        max_in_flight: Maximum number of tasks submitted but not yet
+            collected (default: 2 * max_workers)
+        cache: Optional ConversionCache; hits are answered without a worker
+        executor: Optional running executor of this backend (see
+            create_executor) to reuse across batches; it is left running
+        profile: Optional utils.profiling.Profiler; records stage 'batch'
+            (wall time, parent-side peak allocation, images, failed,
+            cache_hits, bytes). Workers run in other processes and are not
+            profiled stage by stage.
+        result_callback: Optional callback(result) called with every result
+            as soon as it is available, in input order (e.g.
+            ZipStreamWriter.add_result to archive while converting)
+        keep_results: False drops every SVG once result_callback has seen
+            it, so a large batch never holds all of them; the returned
+            tuples then carry None instead of the SVG
         **conversion_kwargs: Additional arguments for conversion_func
     
     Returns:
-        List of (filename, svg_content, success, error_message) tuples
+        List of (filename, svg_content, success, error_message) tuples in input order
     """
+    total = len(images_data) if hasattr(images_data, '__len__') else None
+    hits_before = cache.hits if cache is not None else 0
+    
     results = []
-    total = len(images_data)
+    failed = svg_bytes = 0
+    with profile_stage(profile, 'batch'):
+        for result in iter_batch(
+            images_data,
+            conversion_func,
+            max_workers=max_workers,
+            backend=backend,
+            chunksize=chunksize,
+            max_in_flight=max_in_flight,
+            cache=cache,
+            executor=executor,
+            **conversion_kwargs
+        ):
+            filename, svg_content, success, error = result
+            if success:
+                svg_bytes += len(svg_content)
+            else:
+                failed += 1
+            if result_callback:
+                result_callback(result)
+            results.append(result if keep_results else (filename, None, success, error))
+            del result, svg_content
+            if progress_callback:
+                progress_callback(len(results), total if total is not None else len(results))
+        
+        if profile is not None:
+            profile.count('images', len(results))
+            profile.count('failed', failed)
+            profile.count('cache_hits', (cache.hits if cache is not None else 0) - hits_before)
+            profile.count('bytes', svg_bytes)
     
-    def process_single(filename, image_array):
+    return results
+
+
+def iter_batch(
+    images_data: Iterable[Tuple[str, object]],
+    conversion_func: Callable,
+    max_workers: int = 4,
+    backend: str = 'thread',
+    chunksize: int = 1,
+    max_in_flight: int = None,
+    cache: ConversionCache = None,
+    executor: Executor = None,
+    **conversion_kwargs
+) -> Iterator[BatchResult]:
+    """
+    Convert images in parallel and yield results in input order as they finish
+    
+    Input is consumed lazily: at most max_in_flight tasks (of chunksize
+    images each) are pending at any time. With the process backend each image
+    array is copied once into shared memory and workers map it without
+    pickling the pixel data; any other payload (e.g. a file path or encoded
+    bytes, decoded in the worker by convert_file) is passed to
+    conversion_func as is. With a cache, arrays and encoded bytes are looked
+    up by content in the parent and only misses are sent to workers.
+    
+    Args:
+        See process_batch
+    
+    Yields:
+        (filename, svg_content, success, error_message) tuples in input order
+    """
+    if backend not in ('process', 'thread'):
+        raise ValueError(f"Unknown batch backend: {backend}")
+    if backend == 'process' and executor is None and not _picklable((conversion_func, conversion_kwargs)):
+        # Lambdas and closures cannot reach worker processes
+        backend = 'thread'
+    shared_executor = executor is not None
+    if not shared_executor:
+        executor = create_executor(backend, max_workers)
+    
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+    max_buffered = max_in_flight * chunksize
+    
+    images = iter(images_data)
+    pending = {}   # future -> (input indices, cache keys, shared memory blocks)
+    finished = {}  # input index -> result, waiting to be yielded in order
+    next_index = 0
+    count = 0
+    exhausted = False
+    
+    try:
+        with nullcontext() if shared_executor else executor:
+            while True:
+                # Keep the pool fed up to the in-flight bound
+                while not exhausted and len(pending) < max_in_flight and len(finished) < max_buffered:
+                    indices, tasks, keys, shms = [], [], [], []
+                    while len(tasks) < chunksize and len(finished) < max_buffered:
+                        item = next(images, None)
+                        if item is None:
+                            exhausted = True
+                            break
+                        filename, payload = item
+                        index = count
+                        count += 1
+                        
+                        key = None
+                        if cache is not None and isinstance(payload, (np.ndarray, bytes)):
+                            content = payload if isinstance(payload, np.ndarray) else np.frombuffer(payload, np.uint8)
+                            key = cache.make_key(conversion_func, content, _BATCH_CACHE_TAG, conversion_kwargs)
+                            found, svg_content = cache.get(key)
+                            if found:
+                                finished[index] = (filename, svg_content, True, "")
+                                continue
+                        
+                        if backend == 'process' and isinstance(payload, np.ndarray):
+                            shm, payload = _to_shared(payload)
+                            shms.append(shm)
+                        indices.append(index)
+                        tasks.append((filename, payload))
+                        keys.append(key)
+                    
+                    if tasks:
+                        future = executor.submit(_run_chunk, conversion_func, tasks, conversion_kwargs)
+                        pending[future] = (indices, keys, shms)
+                
+                # Stream everything that is complete in input order
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+                
+                if not pending:
+                    if exhausted:
+                        break
+                    continue
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    indices, keys, shms = pending.pop(future)
+                    _release_shared(shms)
+                    for index, key, result in zip(indices, keys, future.result()):
+                        finished[index] = result
+                        if key is not None and result[2]:
+                            cache.put(key, result[1])
+    finally:
+        for future, (_, _, shms) in pending.items():
+            future.cancel()
+            _release_shared(shms)
+
+
+def create_executor(backend='thread', max_workers=4):
+    """
+    Executor for iter_batch/process_batch
+    
+    Worker processes are started with WORKER_START_METHOD and run OpenCV on
+    one thread each. Pass the executor to several batches to start the
+    workers only once; the caller shuts it down.
+    """
+    if backend == 'process':
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context(WORKER_START_METHOD),
+                                   initializer=_init_worker)
+    if backend == 'thread':
+        return ThreadPoolExecutor(max_workers=max_workers)
+    raise ValueError(f"Unknown batch backend: {backend}")
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+
+def _run_chunk(conversion_func, tasks, conversion_kwargs):
+    """Worker entry point: convert a chunk of (filename, image) tasks"""
+    results = []
+    for filename, payload in tasks:
+        shm = None
         try:
+            if isinstance(payload, SharedArrayRef):
+                shm, image_array = _attach_shared(payload)
+            else:
+                image_array = payload
             result = conversion_func(image_array, **conversion_kwargs)
             # Handle different return types
             if isinstance(result, tuple):
                 svg_content = result[0]
             else:
                 svg_content = result
-            return (filename, svg_content, True, "")
+            results.append((filename, svg_content, True, ""))
         except Exception as e:
-            return (filename, "", False, str(e))
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_data = {
-            executor.submit(process_single, filename, img): (filename, img)
-            for filename, img in images_data
-        }
-        
-        # Collect results as they complete
-        completed = 0
-        for future in as_completed(future_to_data):
-            result = future.result()
-            results.append(result)
-            completed += 1
-            
-            if progress_callback:
-                progress_callback(completed, total)
-    
-    # Sort results by original order
-    filename_order = {fn: i for i, (fn, _) in enumerate(images_data)}
-    results.sort(key=lambda x: filename_order.get(x[0], 999))
-    
+            results.append((filename, "", False, str(e)))
+        finally:
+            if shm is not None:
+                del image_array
+                shm.close()
     return results
 
 
-def create_zip_archive(svg_results: List[Tuple[str, str, bool, str]]) -> bytes:
+def _init_worker():
+    """Keep each worker process on one OpenCV thread to avoid oversubscription"""
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def _to_shared(image_array):
+    """Copy an array into a new shared memory block"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, image_array.nbytes))
+    view = np.ndarray(image_array.shape, dtype=image_array.dtype, buffer=shm.buf)
+    view[...] = image_array
+    del view
+    return shm, SharedArrayRef(shm.name, image_array.shape, image_array.dtype.str)
+
+
+def _attach_shared(ref):
+    """Map a shared memory block created by the parent as a NumPy array"""
+    # Pool workers share the parent's resource tracker, so attaching here
+    # does not register a second owner; the parent unlinks the block
+    shm = shared_memory.SharedMemory(name=ref.name)
+    return shm, np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=shm.buf)
+
+
+def _release_shared(shms):
+    """Close and unlink shared memory blocks once their task is done"""
+    for shm in shms:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def create_zip_archive(svg_results: List[Tuple[str, str, bool, str]],
+                       compresslevel: int = DEFAULT_COMPRESSLEVEL) -> bytes:
     """
     Create a ZIP archive from SVG conversion results
     
+    Builds the whole archive in memory; use utils.zip_stream (iter_zip,
+    write_zip, ZipStreamWriter) to stream it to a file or response instead.
+    
     Args:
         svg_results: List of (filename, svg_content, success, error) tuples
+        compresslevel: Deflate level 1-9, or 0 to store uncompressed
     
     Returns:
         bytes: ZIP file content
     """
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, svg_content, success, error in svg_results:
-            if success:
-                # Convert filename to .svg
-                svg_filename = filename.rsplit('.', 1)[0] + '.svg'
-                zip_file.writestr(svg_filename, svg_content)
-            else:
-                # Add error log for failed conversions
-                error_filename = filename.rsplit('.', 1)[0] + '_ERROR.txt'
-                zip_file.writestr(error_filename, f"Conversion failed: {error}")
-    
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+    return b''.join(iter_zip(svg_results, compresslevel))
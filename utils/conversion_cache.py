@@ -0,0 +1,298 @@
+"""
+Content-addressed cache for conversion results
+
+Results are keyed by a hash of the pixel buffer plus the function and its
+parameters, so identical inputs are never converted twice: not across
+Streamlit reruns, not within a batch and (with a disk tier) not across CLI
+runs.
+"""
+import hashlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+from .image_analyzer import analyze_image
+from .lru import ByteLRU, DigestMemo
+from .svg_converter import (
+    png_to_svg_trace, png_to_svg_trace_info, png_to_svg_embed, file_to_svg_embed, image_to_array
+)
+
+# Bump when the output of any cached function changes, so disk entries from
+# older versions are never served
+CACHE_VERSION = 4
+
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+DEFAULT_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+
+class ConversionCache:
+    """
+    Two-tier LRU cache: in-memory (bounded by bytes) plus optional disk tier
+
+    The disk tier stores pickled values as files named by key and evicts the
+    least recently used files once their total size exceeds disk_max_bytes.
+    Only point it at a directory you control.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, disk_dir=None, disk_max_bytes=DEFAULT_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = ByteLRU(max_bytes, _estimate_size)
+        self._lock = threading.Lock()
+        # analyze + trace on the same array only hash it once; callers must
+        # not modify an array in place after passing it to the cache
+        self._image_digest = DigestMemo()
+        self._disk_bytes = None  # running estimate, rescanned when over budget
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def make_key(self, func, image_array, args=(), kwargs=None):
+        """
+        Cache key for func(image_array, *args, **kwargs)
+
+        func may also be a plain string naming the operation.
+        """
+        name = func if isinstance(func, str) else f"{func.__module__}.{func.__qualname__}"
+        params = repr((args, sorted((kwargs or {}).items())))
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"v{CACHE_VERSION}|{name}|{params}|".encode())
+        digest.update(self._image_digest(image_array).encode())
+        return digest.hexdigest()
+
+    def call(self, func, image_array, *args, **kwargs):
+        """
+        Return func(image_array, *args, **kwargs), served from cache when possible
+
+        A 'profile' keyword is passed through but not part of the key (on a
+        hit nothing is recorded into it).
+        """
+        key = self.make_key(func, image_array, args, _without_profile(kwargs))
+        found, value = self.get(key)
+        if found:
+            return value
+        value = func(image_array, *args, **kwargs)
+        self.put(key, value)
+        return value
+
+    def get(self, key):
+        """
+        Look up a key in memory, then on disk
+
+        Returns:
+            tuple: (found, value)
+        """
+        found, value = self._entries.get(key)
+        if found:
+            with self._lock:
+                self.hits += 1
+            return True, value
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                os.utime(path)  # mark as recently used for eviction
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                self._entries.put(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return True, value
+
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        """Store a value in memory and, if configured, on disk"""
+        self._entries.put(key, value)
+        if self.disk_dir:
+            self._put_disk(key, value)
+
+    def stats(self):
+        """Hit/miss counters and current sizes for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'memory_bytes': self._entries.nbytes,
+                'memory_max_bytes': self.max_bytes,
+                'disk_bytes': self._disk_usage()[0] if self.disk_dir else 0,
+            }
+
+    def clear(self):
+        """Drop the memory tier and reset counters (disk files are kept)"""
+        self._entries.clear()
+        with self._lock:
+            self.hits = self.disk_hits = self.misses = 0
+
+    def _put_disk(self, key, value):
+        path = self._disk_path(key)
+        # A temporary name of its own per write: threads of one process may
+        # store the same key at the same time
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.disk_dir, suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except OSError:
+            _remove_partial(tmp_path)
+            return
+        except BaseException:
+            _remove_partial(tmp_path)
+            raise
+
+        if self._disk_bytes is None:
+            self._disk_bytes = self._disk_usage()[0]
+        else:
+            self._disk_bytes += size
+        if self._disk_bytes > self.disk_max_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        # Rescan: other processes may share the directory and evict as well
+        total, files = self._disk_usage()
+        for mtime, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_bytes = total
+
+    def _disk_usage(self):
+        files = []
+        total = 0
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.pkl'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+        return total, files
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.pkl')
+
+
+def _remove_partial(path):
+    """Delete a temporary file left by a failed write, if there is one"""
+    if path is None:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _without_profile(kwargs):
+    return {key: value for key, value in kwargs.items() if key != 'profile'}
+
+
+def _estimate_size(value):
+    """Approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(_estimate_size(item) for item in value) + 64
+    if isinstance(value, dict):
+        return sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items()) + 64
+    return sys.getsizeof(value)
+
+
+_default_cache = None
+
+
+def get_cache():
+    """Process-wide default cache (created on first use)"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ConversionCache()
+    return _default_cache
+
+
+def configure_cache(max_bytes=DEFAULT_MEMORY_BYTES, disk_dir=None, disk_max_bytes=DEFAULT_DISK_BYTES):
+    """Replace the default cache, e.g. to enable the disk tier"""
+    global _default_cache
+    _default_cache = ConversionCache(max_bytes, disk_dir, disk_max_bytes)
+    return _default_cache
+
+
+def decode_image(file_bytes):
+    """Decode encoded image bytes into a NumPy array"""
+    return image_to_array(Image.open(io.BytesIO(file_bytes)))
+
+
+def cached_decode(file_bytes):
+    """
+    decode_image through the default cache, keyed by the encoded bytes
+
+    The returned array is shared between callers and therefore read-only.
+    """
+    cache = get_cache()
+    key = cache.make_key(decode_image, np.frombuffer(file_bytes, dtype=np.uint8))
+    found, image_array = cache.get(key)
+    if not found:
+        image_array = decode_image(file_bytes)
+        image_array.flags.writeable = False
+        cache.put(key, image_array)
+    return image_array
+
+
+def cached_trace(image_array, **kwargs):
+    """png_to_svg_trace through the default cache"""
+    return get_cache().call(png_to_svg_trace, image_array, **kwargs)
+
+
+def cached_trace_info(image_array, **kwargs):
+    """png_to_svg_trace_info through the default cache"""
+    return get_cache().call(png_to_svg_trace_info, image_array, **kwargs)
+
+
+def cached_embed(image_array, **kwargs):
+    """png_to_svg_embed through the default cache"""
+    return get_cache().call(png_to_svg_embed, image_array, **kwargs)
+
+
+def cached_embed_file(file_bytes, **kwargs):
+    """file_to_svg_embed through the default cache, keyed by the encoded bytes"""
+    cache = get_cache()
+    key = cache.make_key(
+        file_to_svg_embed, np.frombuffer(file_bytes, dtype=np.uint8), kwargs=_without_profile(kwargs)
+    )
+    found, svg_content = cache.get(key)
+    if not found:
+        svg_content = file_to_svg_embed(file_bytes, **kwargs)
+        cache.put(key, svg_content)
+    return svg_content
+
+
+def cached_analyze(image_array, profile=None):
+    """analyze_image through the default cache"""
+    return get_cache().call(analyze_image, image_array, profile=profile)
@@ -0,0 +1,567 @@
+"""
+Asyncio conversion service: a local HTTP endpoint in front of the converters
+
+    python png2svg_cli.py serve --port 8765 --workers 4
+
+    POST   /jobs?method=trace&threshold=100   body: encoded image  -> 202 job
+    GET    /jobs/<id>                          job status
+    GET    /jobs/<id>/result                   SVG once done (202 while pending,
+                                               410 once it is no longer kept)
+    DELETE /jobs/<id>                          cancel a queued or running job
+    GET    /health                             queue, worker and cache counters
+
+Conversions run in worker processes owned by the service, one job per worker
+at a time. A job that times out or is cancelled while running is stopped by
+terminating its worker, which is restarted for the next job. At most
+queue_size jobs wait for a worker; further submissions get 429 with a
+Retry-After header. Results are looked up in and stored into a
+ConversionCache under the same kind of key process_batch uses, so a repeated
+image is answered without a worker. Finished jobs keep their SVG until the
+kept results exceed max_result_bytes; an older result dropped then is looked
+up in the cache again when it is requested.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from .auto_threshold import parse_threshold
+from .batch_processor import _BATCH_CACHE_TAG, WORKER_START_METHOD, convert_file
+from .conversion_cache import get_cache
+from .pipeline import TRACE_MODES
+from .svg_converter import EMBED_REENCODE_FORMATS
+
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_JOB_TIMEOUT = 60.0
+DEFAULT_MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+# Request head limits: a line longer than the StreamReader limit (64 KiB)
+# gets 414 or 431, as do more header lines than this
+MAX_HEADER_LINES = 100
+
+# Finished jobs kept for status and result calls
+MAX_FINISHED_JOBS = 1000
+
+# Total size of the SVGs those jobs keep; older results are dropped first
+MAX_FINISHED_RESULT_BYTES = 256 * 1024 * 1024
+
+FINISHED_STATES = ('done', 'failed', 'cancelled', 'timeout')
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when queue_size jobs are already waiting"""
+
+
+class ConversionError(Exception):
+    """A conversion raised in its worker process"""
+
+
+class Job:
+    """One submitted conversion"""
+
+    def __init__(self, payload, options, timeout, cache_key):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.options = options
+        self.timeout = timeout
+        self.cache_key = cache_key
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cache_hit = False
+        self.result = None
+        self.svg_bytes = None
+        self.error = None
+        self.task = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        """JSON-serializable status"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'seconds': round(self.finished - self.started, 4) if self.started and self.finished else None,
+            'cache_hit': self.cache_hit,
+            'error': self.error,
+            'svg_bytes': self.svg_bytes,
+        }
+
+
+class ConversionService:
+    """
+    Bounded job queue feeding a set of restartable worker processes
+
+    All methods must be called from the event loop the service was started
+    in.
+    """
+
+    def __init__(self, max_workers=None, queue_size=DEFAULT_QUEUE_SIZE, job_timeout=DEFAULT_JOB_TIMEOUT,
+                 cache=None, max_result_bytes=MAX_FINISHED_RESULT_BYTES):
+        """
+        Args:
+            max_workers: Worker processes (default: CPU count)
+            queue_size: Jobs that may wait for a worker before submit()
+                raises QueueFullError
+            job_timeout: Default and maximum seconds a job may run
+            cache: ConversionCache for results (default: the process-wide
+                cache, see utils.conversion_cache.get_cache)
+            max_result_bytes: Total size of the SVGs kept by finished jobs;
+                the oldest are dropped beyond it (see result())
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.cache = cache if cache is not None else get_cache()
+        self.max_result_bytes = max_result_bytes
+        self.jobs = OrderedDict()
+        self._finished = deque()
+        self._results = OrderedDict()
+        self._result_bytes = 0
+        self._queue = None
+        self._queued = 0
+        self._workers = []
+        self._dispatchers = []
+        self._closing = False
+
+    async def start(self):
+        """Start the dispatchers; worker processes are spawned on first use"""
+        self._queue = asyncio.Queue()
+        context = multiprocessing.get_context(WORKER_START_METHOD)
+        self._workers = [_Worker(context) for _ in range(self.max_workers)]
+        self._dispatchers = [asyncio.ensure_future(self._dispatch(worker)) for worker in self._workers]
+
+    async def stop(self):
+        """Cancel everything that is still pending and stop all workers"""
+        self._closing = True
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        for job in list(self.jobs.values()):
+            if job.status not in FINISHED_STATES:
+                self._finish(job, 'cancelled', error='Service stopped')
+        for worker in self._workers:
+            worker.close()
+
+    def submit(self, file_bytes, options=None, timeout=None):
+        """
+        Queue a conversion of an encoded image
+
+        Args:
+            file_bytes: Encoded image (PNG, JPEG, ...)
+            options: Keyword arguments for batch_processor.convert_file
+                (method, background_color, embed_options, trace options)
+            timeout: Seconds the job may run (capped at job_timeout)
+
+        Returns:
+            Job: Already 'done' when the result came from the cache
+
+        Raises:
+            QueueFullError: queue_size jobs are already waiting
+        """
+        options = options or {}
+        timeout = min(timeout or self.job_timeout, self.job_timeout)
+        key = self.cache.make_key(convert_file, np.frombuffer(file_bytes, np.uint8), _BATCH_CACHE_TAG, options)
+        found, svg_content = self.cache.get(key)
+        if not found and self._queued >= self.queue_size:
+            raise QueueFullError(f"{self._queued} jobs waiting")
+
+        job = Job(file_bytes, options, timeout, key)
+        self.jobs[job.id] = job
+        if found:
+            job.cache_hit = True
+            job.started = job.created
+            self._finish(job, 'done', result=svg_content)
+        else:
+            self._queued += 1
+            self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id):
+        """Job by id, or None"""
+        return self.jobs.get(job_id)
+
+    def result(self, job_id):
+        """
+        SVG of a done job
+
+        A result dropped to stay within max_result_bytes is looked up in the
+        cache again.
+
+        Returns:
+            str or None: None if the job is not done or its result is gone
+        """
+        job = self.jobs[job_id]
+        if job.status != 'done':
+            return None
+        if job.result is not None:
+            return job.result
+        found, svg_content = self.cache.get(job.cache_key)
+        return svg_content if found else None
+
+    def cancel(self, job_id):
+        """
+        Cancel a job; a running job's worker is terminated
+
+        Returns:
+            bool: False if the job had already finished
+        """
+        job = self.jobs[job_id]
+        if job.status == 'queued':
+            self._queued -= 1
+            self._finish(job, 'cancelled')
+            return True
+        if job.status == 'running':
+            job.task.cancel()
+            return True
+        return False
+
+    async def wait(self, job_id):
+        """Wait until a job has finished and return it"""
+        job = self.jobs[job_id]
+        await job.done.wait()
+        return job
+
+    def stats(self):
+        """Queue, worker and cache counters"""
+        return {
+            'queued': self._queued,
+            'running': sum(1 for job in self.jobs.values() if job.status == 'running'),
+            'workers': self.max_workers,
+            'queue_size': self.queue_size,
+            'jobs': len(self.jobs),
+            'cache': self.cache.stats(),
+        }
+
+    async def _dispatch(self, worker):
+        while True:
+            job = await self._queue.get()
+            if job.status != 'queued':
+                continue  # cancelled while waiting
+            self._queued -= 1
+            job.status = 'running'
+            job.started = time.time()
+            job.task = asyncio.ensure_future(
+                asyncio.wait_for(worker.run(convert_file, (job.payload,), job.options), job.timeout)
+            )
+            try:
+                svg_content = await job.task
+            except asyncio.TimeoutError:
+                self._finish(job, 'timeout', error=f"Timed out after {job.timeout:g}s")
+            except asyncio.CancelledError:
+                if self._closing:
+                    raise
+                self._finish(job, 'cancelled')
+            except Exception as e:
+                self._finish(job, 'failed', error=str(e))
+            else:
+                self.cache.put(job.cache_key, svg_content)
+                self._finish(job, 'done', result=svg_content)
+
+    def _finish(self, job, status, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished = time.time()
+        job.payload = None
+        job.task = None
+        job.done.set()
+        self._finished.append(job.id)
+        if result is not None:
+            job.svg_bytes = len(result)
+            self._results[job.id] = job
+            self._result_bytes += job.svg_bytes
+        while len(self._finished) > MAX_FINISHED_JOBS:
+            self._drop_result(self.jobs.pop(self._finished.popleft(), None))
+        while self._result_bytes > self.max_result_bytes:
+            self._drop_result(next(iter(self._results.values())))
+
+    def _drop_result(self, job):
+        if job is not None and self._results.pop(job.id, None) is not None:
+            self._result_bytes -= job.svg_bytes
+            job.result = None
+
+
+class _Worker:
+    """One worker process, restarted after it was terminated"""
+
+    def __init__(self, context):
+        self.context = context
+        self.process = None
+        self.conn = None
+        # Blocking pipe calls run here, off the event loop
+        self._io = ThreadPoolExecutor(max_workers=1)
+
+    async def run(self, func, args, kwargs):
+        """Run func(*args, **kwargs) in the worker; cancelling kills the worker"""
+        loop = asyncio.get_running_loop()
+        try:
+            if self.process is None:
+                await loop.run_in_executor(self._io, self._start)
+            await loop.run_in_executor(self._io, self.conn.send, (func, args, kwargs))
+            status, value = await loop.run_in_executor(self._io, self.conn.recv)
+        except BaseException:
+            # Timed out, cancelled or the worker died: start over next time
+            self._kill()
+            raise
+        if status == 'error':
+            raise ConversionError(value)
+        return value
+
+    def close(self):
+        self._kill()
+        self._io.shutdown(wait=True)
+
+    def _start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def _kill(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.join()
+        # A pending recv() on the I/O thread now fails; close after it
+        self._io.submit(self.conn.close)
+        self.process = None
+        self.conn = None
+
+
+def _worker_main(conn):
+    """Worker process loop: run (func, args, kwargs) requests until the pipe closes"""
+    # Ctrl-C stops the service, which terminates its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            func, args, kwargs = conn.recv()
+        except EOFError:
+            return
+        try:
+            reply = ('ok', func(*args, **kwargs))
+        except Exception as e:
+            reply = ('error', f"{type(e).__name__}: {e}")
+        conn.send(reply)
+
+
+# HTTP front end
+
+def _flag(value):
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"not a boolean: {value}")
+
+
+def _choice(*choices):
+    def parse(value):
+        if value not in choices:
+            raise ValueError(f"must be one of {', '.join(choices)}")
+        return value
+    return parse
+
+
+_TRACE_OPTIONS = {
+    'threshold': parse_threshold,
+    'simplify': int,
+    'invert': _flag,
+    'mode': _choice(*TRACE_MODES),
+    'n_colors': int,
+    'quantizer': _choice('mediancut', 'kmeans'),
+    'compact': _flag,
+    'holes': _flag,
+    'curves': _flag,
+    'despeckle': int,
+    'despeckle_kernel': int,
+}
+_EMBED_OPTIONS = {
+    'reencode': _choice(*sorted(EMBED_REENCODE_FORMATS)),
+    'quality': int,
+    'png_level': int,
+}
+
+
+def parse_job_options(query):
+    """
+    convert_file options and timeout from a query string
+
+    Returns:
+        tuple: (options dict, timeout seconds or None)
+
+    Raises:
+        ValueError: Unknown option or invalid value
+    """
+    options, embed_options, timeout = {}, {}, None
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        try:
+            if name == 'method':
+                options['method'] = _choice('auto', 'trace', 'embed')(value)
+            elif name == 'background_color':
+                options['background_color'] = value
+            elif name == 'timeout':
+                timeout = float(value)
+            elif name in _TRACE_OPTIONS:
+                options[name] = _TRACE_OPTIONS[name](value)
+            elif name in _EMBED_OPTIONS:
+                embed_options[name] = _EMBED_OPTIONS[name](value)
+            else:
+                raise ValueError("unknown option")
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from None
+    if embed_options:
+        options['embed_options'] = embed_options
+    return options, timeout
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+async def start_http_server(service, host='127.0.0.1', port=8765, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES):
+    """
+    Serve a started ConversionService over HTTP/1.1 (one request per connection)
+
+    Args:
+        port: TCP port; 0 picks a free one (see server.sockets)
+
+    Returns:
+        asyncio.Server
+    """
+    async def handle(reader, writer):
+        try:
+            try:
+                status, body, content_type, headers = await _handle_request(service, reader, max_upload_bytes)
+            except _HTTPError as e:
+                status, body, content_type, headers = e.status, _json({'error': str(e)}), 'application/json', e.headers
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(body)}",
+                    "Connection: close"]
+            head += [f"{name}: {value}" for name, value in headers.items()]
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def serve(host='127.0.0.1', port=8765, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES, **service_options):
+    """Run a ConversionService with its HTTP front end until cancelled"""
+    service = ConversionService(**service_options)
+    await service.start()
+    server = await start_http_server(service, host, port, max_upload_bytes)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+async def _read_line(reader, status, message):
+    """One line of the request head; _HTTPError(status) if it exceeds the reader's limit"""
+    try:
+        return await reader.readline()
+    except ValueError:
+        # readline turns asyncio.LimitOverrunError into ValueError
+        raise _HTTPError(status, message)
+
+
+async def _handle_request(service, reader, max_upload_bytes):
+    request_line = (await _read_line(reader, 414, 'Request line too long')).decode('latin-1').split()
+    if len(request_line) != 3:
+        raise _HTTPError(400, 'Malformed request line')
+    method, target, _ = request_line
+    headers = {}
+    for _ in range(MAX_HEADER_LINES + 1):
+        line = await _read_line(reader, 431, 'Header line too long')
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise _HTTPError(431, f"More than {MAX_HEADER_LINES} header lines")
+
+    url = urlsplit(target)
+    parts = [part for part in url.path.split('/') if part]
+
+    if method == 'GET' and parts == ['health']:
+        return _ok(service.stats())
+
+    if method == 'POST' and parts == ['jobs']:
+        if 'content-length' not in headers:
+            raise _HTTPError(411, 'Content-Length required')
+        length = headers['content-length']
+        if not (length.isascii() and length.isdigit()):
+            raise _HTTPError(400, f"Invalid Content-Length: {length!r}")
+        length = int(length)
+        if length > max_upload_bytes:
+            raise _HTTPError(413, f"Upload larger than {max_upload_bytes} bytes")
+        if length == 0:
+            raise _HTTPError(400, 'Empty body: send the encoded image')
+        body = await reader.readexactly(length)
+        try:
+            options, timeout = parse_job_options(url.query)
+        except ValueError as e:
+            raise _HTTPError(400, str(e))
+        try:
+            job = service.submit(body, options, timeout)
+        except QueueFullError as e:
+            raise _HTTPError(429, f"Queue full ({e})", {'Retry-After': '1'})
+        return _ok(job.to_dict(), 200 if job.status == 'done' else 202,
+                   {'Location': f"/jobs/{job.id}"})
+
+    if len(parts) in (2, 3) and parts[0] == 'jobs':
+        job = service.get(parts[1])
+        if job is None:
+            raise _HTTPError(404, 'Unknown job')
+        if method == 'GET' and len(parts) == 2:
+            return _ok(job.to_dict())
+        if method == 'DELETE' and len(parts) == 2:
+            if not service.cancel(job.id):
+                raise _HTTPError(409, f"Job already {job.status}")
+            if job.status == 'running':
+                await job.done.wait()
+            return _ok(job.to_dict())
+        if method == 'GET' and parts[2:] == ['result']:
+            if job.status == 'done':
+                svg_content = service.result(job.id)
+                if svg_content is None:
+                    raise _HTTPError(410, 'Result no longer kept: submit the image again')
+                return 200, svg_content.encode('utf-8'), 'image/svg+xml', {}
+            if job.status in FINISHED_STATES:
+                raise _HTTPError(409, f"Job {job.status}: {job.error}")
+            return _ok(job.to_dict(), 202, {'Retry-After': '1'})
+
+    raise _HTTPError(404, f"No route for {method} {url.path}")
+
+
+def _json(data):
+    return json.dumps(data).encode('utf-8')
+
+
+def _ok(data, status=200, headers=None):
+    return status, _json(data), 'application/json', headers or {}
@@ -0,0 +1,356 @@
+"""
+Cubic Bézier fitting of traced contours
+
+Douglas-Peucker leaves every path a polyline, so a smooth outline needs many
+points to look round. fit_curves fits the unsimplified contours with cubic
+Béziers (and lines where those suffice) that stay within a distance
+tolerance:
+
+1. Rings are resampled to at most FIT_STEP pixels between points and, except
+   at corners, smoothed over SMOOTH_REACH points on either side.
+2. A point where the direction of the ring, measured over a window on either
+   side, turns by more than CORNER_ANGLE degrees (and more than at its
+   neighbours) is a corner. Rings are cut into runs at their corners, and
+   into at least two runs.
+3. Every run is fitted with one cubic by least squares with fixed end
+   tangents (Schneider's algorithm: one-sided tangents at corners, centered
+   ones elsewhere so the joins are smooth), improved by Newton steps on the
+   curve parameters. A run within the tolerance of its chord becomes a line;
+   a run the cubic misses by more than the tolerance is split at its worst
+   point and fitted again.
+
+The runs of all rings are fitted together: every round of splitting is a few
+NumPy passes over the points of the runs still open.
+"""
+import numpy as np
+
+from .path_model import PathSet, concat_ranges, offsets_from_counts
+
+# Largest distance between resampled ring points, in pixels
+FIT_STEP = 1.0
+
+# Smallest turn of direction (degrees) that makes a corner
+CORNER_ANGLE = 60
+
+# Corners are measured over this many times the tolerance (at least 2 px)
+CORNER_WINDOW = 2.0
+
+# Points averaged on either side of every point before fitting
+SMOOTH_REACH = 2
+
+# Smallest window (points on either side) for the end tangents of curves
+TANGENT_REACH = 4
+
+# Newton reparameterizations per fit
+NEWTON_STEPS = 1
+
+# Runs still above the tolerance after this many splits keep their curve
+MAX_SPLIT_ROUNDS = 32
+
+# Rings with fewer resampled points are kept as polylines
+MIN_FIT_POINTS = 8
+
+
+def fit_curves(rings, ring_counts=None, tolerance=2.0):
+    """
+    Fit closed contours with cubic Béziers and lines
+
+    Args:
+        rings: Unsimplified closed contours (e.g. from cv2.findContours),
+            all shaped (N, 1, 2) or all shaped (N, 2)
+        ring_counts: Rings per path, consumed in order (default: one ring
+            per path)
+        tolerance: Largest distance in pixels between a contour and its fit
+
+    Returns:
+        PathSet: Without colors; its controls mark the Bézier control points
+    """
+    if ring_counts is None:
+        ring_counts = np.ones(len(rings), dtype=np.int64)
+    if not len(rings):
+        return PathSet.from_rings([], ring_counts)
+    tolerance = max(float(tolerance), 0.1)
+
+    points, offsets = _resample(rings)
+    lengths = np.diff(offsets)
+    fit = lengths >= MIN_FIT_POINTS
+    fitted = _fit_rings(points, offsets, np.flatnonzero(fit), tolerance)
+    kept = PathSet.from_rings([rings[i] for i in np.flatnonzero(~fit).tolist()])
+
+    # Back to input order: one ring per path until regrouped
+    combined = PathSet.concat([fitted, kept])
+    order = np.argsort(np.concatenate([np.flatnonzero(fit), np.flatnonzero(~fit)]), kind='stable')
+    combined = combined.select(order)
+    combined.path_offsets = offsets_from_counts(ring_counts)
+    return combined
+
+
+def _resample(rings):
+    """
+    Points of all rings, closing segment included, at most FIT_STEP apart
+
+    Returns:
+        tuple: (float64 (P, 2) points, (R + 1,) ring offsets)
+    """
+    lengths = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+    points = np.concatenate(rings).reshape(-1, 2).astype(np.float64)
+    starts = offsets_from_counts(lengths)[:-1]
+
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    steps = points[following] - points
+    pieces = np.ceil(np.hypot(steps[:, 0], steps[:, 1]) / FIT_STEP).astype(np.int64)
+    # Repeated points vanish, but every ring keeps at least its first one
+    ring_pieces = np.add.reduceat(pieces, starts)
+    pieces[starts[ring_pieces == 0]] = 1
+
+    source = np.repeat(np.arange(len(points)), pieces)
+    piece_offsets = offsets_from_counts(pieces)
+    fraction = (np.arange(piece_offsets[-1]) - piece_offsets[source]) / pieces[source]
+    resampled = points[source] + steps[source] * fraction[:, None]
+    return resampled, offsets_from_counts(np.add.reduceat(pieces, starts))
+
+
+def _fit_rings(points, offsets, rings, tolerance):
+    """Fit the selected rings of resampled points; one single-ring path each"""
+    if not len(rings):
+        return PathSet.from_rings([])
+    starts = offsets[rings]
+    lengths = offsets[rings + 1] - starts
+    # Only the selected rings, back to back
+    points = points[concat_ranges(starts, lengths)]
+    offsets = offsets_from_counts(lengths)
+    ring_of = np.repeat(np.arange(len(rings)), lengths)
+    size = lengths[ring_of]
+    local = np.arange(len(points)) - offsets[ring_of]
+
+    # Direction over a window on either side of every point
+    window = max(2.0, CORNER_WINDOW * tolerance) / FIT_STEP
+    reach = np.clip(np.minimum(np.ceil(window), lengths // 4), 1, None).astype(np.int64)[ring_of]
+    forward, backward = _directions(points, offsets, ring_of, local, reach)
+    turn = 1 - np.einsum('ij,ij->i', forward, backward)  # 0 straight .. 2 reversed
+
+    # Corners turn more than CORNER_ANGLE and most within the window
+    corner = turn > 1 - np.cos(np.radians(CORNER_ANGLE))
+    for shift in range(1, int(reach.max()) + 1):
+        within = shift <= reach
+        later = offsets[ring_of] + (local + shift) % size
+        earlier = offsets[ring_of] + (local - shift) % size
+        corner &= ~within | ((turn > turn[later]) & (turn >= turn[earlier]))
+    corners = np.flatnonzero(corner)
+
+    # Pixel stairs stray up to half a pixel from the shape they outline:
+    # fit a moving average of the ring instead (corners stay in place)
+    smoothed = points.copy()
+    for shift in range(1, SMOOTH_REACH + 1):
+        smoothed += points[offsets[ring_of] + (local + shift) % size]
+        smoothed += points[offsets[ring_of] + (local - shift) % size]
+    smoothed /= 2 * SMOOTH_REACH + 1
+    smoothed[corners] = points[corners]
+    points = smoothed
+
+    # End tangents of the curves, over a window of the smoothed ring
+    reach = np.clip(np.minimum(np.ceil(max(window, TANGENT_REACH)), lengths // 4), 1, None).astype(np.int64)[ring_of]
+    forward, backward = _directions(points, offsets, ring_of, local, reach)
+    centered = _unit(forward + backward)
+
+    # Rings with fewer than two corners get extra (smooth) breakpoints
+    corner_count = np.bincount(ring_of[corners], minlength=len(rings))
+    first = offsets[:-1].copy()  # first corner, or the ring's start
+    with_corners = np.flatnonzero(corner_count)
+    first[with_corners] = corners[np.searchsorted(ring_of[corners], with_corners)]
+    short = np.flatnonzero(corner_count < 2)
+    extra = np.concatenate([
+        first[short[corner_count[short] == 0]],
+        offsets[short] + (first[short] - offsets[short] + lengths[short] // 2) % lengths[short],
+    ])
+    breaks = np.unique(np.concatenate([corners, extra]))
+    is_corner = corner[breaks]
+
+    # Runs from every breakpoint to the next one of its ring (wrapping)
+    break_ring = ring_of[breaks]
+    following = np.arange(1, len(breaks) + 1)
+    ring_last = np.flatnonzero(np.append(break_ring[1:] != break_ring[:-1], True))
+    ring_first = np.append(0, ring_last[:-1] + 1)
+    following[ring_last] = ring_first
+    run_ring = break_ring
+    run_start = breaks - offsets[run_ring]
+    run_stop = breaks[following] - offsets[run_ring]
+    run_stop = np.where(run_stop <= run_start, run_stop + lengths[run_ring], run_stop)
+    start_corner, stop_corner = is_corner, is_corner[following]
+
+    accepted = []
+    for split_round in range(MAX_SPLIT_ROUNDS + 1):
+        if not len(run_ring):
+            break
+        run_points = run_stop - run_start + 1
+        run_offsets = offsets_from_counts(run_points)
+        run_of = np.repeat(np.arange(len(run_ring)), run_points)
+        index = offsets[run_ring[run_of]] + (run_start[run_of] + np.arange(run_offsets[-1])
+                                             - run_offsets[run_of]) % lengths[run_ring[run_of]]
+        data = points[index]
+        head, tail = index[run_offsets[:-1]], index[run_offsets[1:] - 1]
+        tangent_in = np.where(start_corner[:, None], forward[head], centered[head])
+        tangent_out = -np.where(stop_corner[:, None], backward[tail], centered[tail])
+
+        line = (run_points <= 2) | (_chord_error(data, run_of, run_offsets) <= tolerance ** 2)
+        controls = np.zeros((len(run_ring), 2, 2))
+        error = np.zeros(len(run_ring))
+        worst = np.zeros(len(run_ring), dtype=np.int64)
+        curved = np.flatnonzero(~line)
+        if len(curved):
+            curved_points = run_points[curved]
+            controls[curved], error[curved], worst[curved] = _fit_cubics(
+                data[concat_ranges(run_offsets[curved], curved_points)],
+                np.repeat(np.arange(len(curved)), curved_points),
+                offsets_from_counts(curved_points),
+                tangent_in[curved], tangent_out[curved],
+            )
+        done = line | (error <= tolerance ** 2) | (run_points <= 3) | (split_round == MAX_SPLIT_ROUNDS)
+        accepted.append((
+            run_ring[done], run_start[done], line[done], controls[done],
+            data[run_offsets[1:][done] - 1],
+        ))
+
+        # Split the others at their worst point, with a smooth join
+        split = ~done
+        middle = run_start[split] + np.clip(worst[split], 1, run_points[split] - 2)
+        run_ring = np.repeat(run_ring[split], 2)
+        run_start, run_stop = (
+            np.column_stack((run_start[split], middle)).ravel(),
+            np.column_stack((middle, run_stop[split])).ravel(),
+        )
+        start_corner = np.column_stack((start_corner[split], np.zeros(len(middle), dtype=bool))).ravel()
+        stop_corner = np.column_stack((np.zeros(len(middle), dtype=bool), stop_corner[split])).ravel()
+
+    ring, start, line, controls, end = (np.concatenate(parts) for parts in zip(*accepted))
+    order = np.lexsort((start, ring))
+    ring, start, line, controls, end = ring[order], start[order], line[order], controls[order], end[order]
+
+    # Per run: [ring start (first run only), control 1, control 2, end];
+    # a closing line is left to "Z"
+    first_run = np.append(True, ring[1:] != ring[:-1])
+    last_run = np.append(ring[1:] != ring[:-1], True)
+    rows = np.empty((len(ring), 4, 2), dtype=np.float64)
+    rows[:, 0] = points[offsets[ring] + start % lengths[ring]]
+    rows[:, 1:3] = controls
+    rows[:, 3] = end
+    keep = np.column_stack((first_run, ~line, ~line, ~(line & last_run)))
+    control_rows = np.broadcast_to(np.array([False, True, True, False]), keep.shape)
+    ring_lengths = np.add.reduceat(keep.sum(axis=1), np.flatnonzero(first_run))
+    return PathSet(
+        np.rint(rows[keep]).astype(np.int32),
+        offsets_from_counts(ring_lengths),
+        np.arange(len(rings) + 1, dtype=np.int64),
+        controls=control_rows[keep].copy(),
+    )
+
+
+def _directions(points, offsets, ring_of, local, reach):
+    """Unit vectors from every ring point reach points ahead, and from as far behind"""
+    size = np.diff(offsets)[ring_of]
+    ahead = points[offsets[ring_of] + (local + reach) % size] - points
+    behind = points - points[offsets[ring_of] + (local - reach) % size]
+    return _unit(ahead), _unit(behind)
+
+
+def _chord_error(data, run_of, run_offsets):
+    """Largest squared distance of every run's points from its chord"""
+    head = data[run_offsets[:-1]][run_of]
+    chord = data[run_offsets[1:] - 1][run_of] - head
+    relative = data - head
+    length = np.einsum('ij,ij->i', chord, chord)
+    along = np.clip(np.einsum('ij,ij->i', relative, chord) / np.maximum(length, 1e-12), 0, 1)
+    offset = relative - chord * along[:, None]
+    return np.maximum.reduceat(np.einsum('ij,ij->i', offset, offset), run_offsets[:-1])
+
+
+def _fit_cubics(data, run_of, run_offsets, tangent_in, tangent_out):
+    """
+    Least-squares cubic per run with fixed end tangents
+
+    Returns:
+        tuple: ((runs, 2, 2) control points, largest squared error per run,
+        offset of the worst point within its run)
+    """
+    starts, stops = run_offsets[:-1], run_offsets[1:] - 1
+    x, y = data[:, 0], data[:, 1]
+    head, tail = data[starts], data[stops]
+
+    # Chord-length parameters
+    step = np.zeros(len(data))
+    step[1:] = np.hypot(x[1:] - x[:-1], y[1:] - y[:-1])
+    step[starts] = 0
+    along = np.cumsum(step)
+    along -= along[starts][run_of]
+    u = along / np.maximum(along[stops], 1e-12)[run_of]
+
+    chord = np.hypot(*(tail - head).T)
+    cross = np.einsum('ij,ij->i', tangent_in, tangent_out)
+    x0, y0, x3, y3 = head[run_of, 0], head[run_of, 1], tail[run_of, 0], tail[run_of, 1]
+    for iteration in range(NEWTON_STEPS + 1):
+        v = 1 - u
+        b1, b2 = 3 * u * v * v, 3 * u * u * v
+        start_weight, stop_weight = v * v * v + b1, u * u * u + b2
+        rest_x = x - x0 * start_weight - x3 * stop_weight
+        rest_y = y - y0 * start_weight - y3 * stop_weight
+        c11 = np.add.reduceat(b1 * b1, starts)
+        c12 = np.add.reduceat(b1 * b2, starts) * cross
+        c22 = np.add.reduceat(b2 * b2, starts)
+        x1 = tangent_in[:, 0] * np.add.reduceat(b1 * rest_x, starts) + \
+            tangent_in[:, 1] * np.add.reduceat(b1 * rest_y, starts)
+        x2 = tangent_out[:, 0] * np.add.reduceat(b2 * rest_x, starts) + \
+            tangent_out[:, 1] * np.add.reduceat(b2 * rest_y, starts)
+        det = c11 * c22 - c12 * c12
+        solvable = np.abs(det) > 1e-12
+        safe = np.where(solvable, det, 1)
+        alpha1 = (x1 * c22 - c12 * x2) / safe
+        alpha2 = (c11 * x2 - c12 * x1) / safe
+        # Degenerate or reversed handles: the usual third of the chord
+        fallback = ~solvable | (alpha1 < 1e-6 * chord) | (alpha2 < 1e-6 * chord)
+        alpha1 = np.where(fallback, chord / 3, alpha1)
+        alpha2 = np.where(fallback, chord / 3, alpha2)
+        c1 = head + tangent_in * alpha1[:, None]
+        c2 = tail + tangent_out * alpha2[:, None]
+        offset_x, offset_y, u = _newton(x, y, u, run_of, head, c1, c2, tail, iteration < NEWTON_STEPS)
+
+    error = offset_x * offset_x + offset_y * offset_y
+    largest = np.maximum.reduceat(error, starts)
+    worst_points = np.flatnonzero(error == largest[run_of])
+    _, first = np.unique(run_of[worst_points], return_index=True)
+    worst = worst_points[first] - starts
+    return np.stack((c1, c2), axis=1), largest, worst
+
+
+def _newton(x, y, u, run_of, p0, c1, c2, p3, step=True):
+    """
+    Distance of every point from its curve point and, with step, parameters
+    moved one Newton-Raphson step towards the closest curve points
+
+    Returns:
+        tuple: (x offsets, y offsets, parameters)
+    """
+    v = 1 - u
+    b0, b1, b2, b3 = v * v * v, 3 * u * v * v, 3 * u * u * v, u * u * u
+    offsets = []
+    for axis, values in ((0, x), (1, y)):
+        a, b, c, d = p0[run_of, axis], c1[run_of, axis], c2[run_of, axis], p3[run_of, axis]
+        offsets.append(a * b0 + b * b1 + c * b2 + d * b3 - values)
+        if step:
+            offsets.append(3 * ((b - a) * v * v + (c - b) * 2 * u * v + (d - c) * u * u))
+            offsets.append(6 * ((c - 2 * b + a) * v + (d - 2 * c + b) * u))
+    if not step:
+        return offsets[0], offsets[1], u
+    (offset_x, d1_x, d2_x), (offset_y, d1_y, d2_y) = offsets[:3], offsets[3:]
+    numerator = offset_x * d1_x + offset_y * d1_y
+    denominator = d1_x * d1_x + d1_y * d1_y + offset_x * d2_x + offset_y * d2_y
+    usable = np.abs(denominator) > 1e-12
+    moved = np.where(usable, u - numerator / np.where(usable, denominator, 1), u)
+    return offset_x, offset_y, np.clip(moved, 0, 1)
+
+
+
+def _unit(vectors):
+    """Vectors scaled to length 1 (zero vectors stay zero)"""
+    length = np.hypot(vectors[:, 0], vectors[:, 1])
+    return vectors / np.maximum(length, 1e-12)[:, None]
@@ -1,69 +1,90 @@
 """
 Image analysis functions to determine best conversion method
 """
+import cv2
 import numpy as np
-from PIL import Image
 
+from .auto_threshold import otsu_threshold, triangle_threshold
+from .pipeline import image_histogram, sample_image
+from .profiling import profile_count, profile_stage
+from .trace_memo import get_trace_memo
 
-def analyze_image(image_array):
+# Largest color count recommend_method and the complexity rules distinguish
+# (thresholds 10/20/100/200/500); counting stops once it is exceeded
+COLOR_COUNT_LIMIT = 500
+
+# Pixels marked per step while counting colors
+COLOR_COUNT_CHUNK = 65536
+
+
+def analyze_image(image_array, profile=None):
     """
     Analyze image characteristics
     
+    Everything is measured on one working copy of about a million pixels
+    (utils.pipeline.sample_image): transparency and variance come from its
+    per-channel histograms, so the cost hardly grows with the image.
+    Transparent areas or colors smaller than the sampling step can be
+    missed; width, height and total_pixels are those of the full image.
+    
     Args:
         image_array: NumPy array of the image
+        profile: Optional utils.profiling.Profiler; records the stages
+            'analyze.sample', 'analyze.histograms', 'analyze.grayscale',
+            'analyze.colors' and 'analyze.thresholds'
     
     Returns:
         dict: Analysis results with keys:
             - has_alpha: bool
+            - has_transparency: bool
             - is_grayscale: bool
-            - num_colors: int
+            - num_colors: int (exact up to COLOR_COUNT_LIMIT, a lower bound above)
             - complexity: str (low, medium, high)
             - is_photo: bool
+            - thresholds: dict with the 'otsu' and 'triangle' thresholds
+              a trace with threshold='otsu' or 'triangle' uses
+            - width, height, total_pixels: int
     """
+    h, w = image_array.shape[:2]
+    channels = image_array.shape[2] if image_array.ndim == 3 else 1
     analysis = {}
     
-    # Check alpha channel
-    if len(image_array.shape) == 3 and image_array.shape[2] == 4:
-        analysis['has_alpha'] = True
-        # Check if alpha is actually used
-        alpha_channel = image_array[:, :, 3]
-        analysis['has_transparency'] = np.any(alpha_channel < 255)
-    else:
-        analysis['has_alpha'] = False
-        analysis['has_transparency'] = False
-    
-    # Check if grayscale
-    if len(image_array.shape) == 2:
-        analysis['is_grayscale'] = True
-    elif len(image_array.shape) == 3:
-        # Check if all channels are equal
-        if image_array.shape[2] >= 3:
-            r, g, b = image_array[:, :, 0], image_array[:, :, 1], image_array[:, :, 2]
-            analysis['is_grayscale'] = np.array_equal(r, g) and np.array_equal(g, b)
+    with profile_stage(profile, 'analyze.sample'):
+        sample = sample_image(image_array)
+        profile_count(profile, 'sampled_pixels', sample.shape[0] * sample.shape[1])
+    
+    with profile_stage(profile, 'analyze.histograms'):
+        # One histogram per channel; color channels are RGB, or the gray
+        # plane of gray and LA images
+        histograms = [_histogram(sample, channel) for channel in range(channels)]
+        color_channels = 3 if channels >= 3 else 1
+        
+        # Alpha statistics (RGBA or LA): is any pixel not fully opaque?
+        analysis['has_alpha'] = channels in (2, 4)
+        analysis['has_transparency'] = bool(
+            analysis['has_alpha'] and histograms[-1][-1] < histograms[-1].sum()
+        )
+        
+        # Variance of all color channel values together
+        variance = _histogram_variance(sum(histograms[:color_channels]))
+    
+    with profile_stage(profile, 'analyze.grayscale'):
+        if color_channels == 1:
+            analysis['is_grayscale'] = True
         else:
-            analysis['is_grayscale'] = False
-    
-    # Count unique colors (sample for performance)
-    img_for_colors = image_array[:, :, :3] if len(image_array.shape) == 3 and image_array.shape[2] >= 3 else image_array
+            # Equal planes have equal histograms; compare pixels only then
+            r, g, b = sample[:, :, 0], sample[:, :, 1], sample[:, :, 2]
+            analysis['is_grayscale'] = bool(
+                np.array_equal(histograms[0], histograms[1]) and np.array_equal(histograms[1], histograms[2])
+                and np.array_equal(r, g) and np.array_equal(g, b)
+            )
     
-    # Sample image if too large
-    h, w = img_for_colors.shape[:2]
-    if h * w > 1000000:  # If more than 1M pixels, sample
-        step = int(np.sqrt(h * w / 1000000))
-        img_for_colors = img_for_colors[::step, ::step]
-    
-    # Reshape and count unique colors
-    if len(img_for_colors.shape) == 3:
-        pixels = img_for_colors.reshape(-1, img_for_colors.shape[2])
-        unique_colors = len(np.unique(pixels, axis=0))
-    else:
-        unique_colors = len(np.unique(img_for_colors))
+    with profile_stage(profile, 'analyze.colors'):
+        unique_colors = count_colors(sample[:, :, :3] if channels >= 3 else _plane(sample, 0))
+        profile_count(profile, 'colors', unique_colors)
     
     analysis['num_colors'] = unique_colors
     
-    # Determine complexity based on color count and variance
-    variance = np.var(img_for_colors)
-    
     if unique_colors < 10 and variance < 1000:
         analysis['complexity'] = 'low'
     elif unique_colors < 100 and variance < 5000:
@@ -74,6 +95,15 @@ def analyze_image(image_array):
     # Detect if it's likely a photo (high color count + high variance)
     analysis['is_photo'] = unique_colors > 500 and variance > 3000
     
+    with profile_stage(profile, 'analyze.thresholds'):
+        # Gray histogram of the same working copy, shared with the traces of
+        # this image through the trace memo
+        histogram = image_histogram(image_array, memo=get_trace_memo(), sample=sample)
+        analysis['thresholds'] = {
+            'otsu': otsu_threshold(histogram),
+            'triangle': triangle_threshold(histogram),
+        }
+    
     # Image dimensions
     analysis['width'] = w
     analysis['height'] = h
@@ -82,6 +112,69 @@ def analyze_image(image_array):
     return analysis
 
 
+def _plane(image_array, channel):
+    """One channel of an image (a 2D image is its only channel)"""
+    return image_array if image_array.ndim == 2 else image_array[:, :, channel]
+
+
+def _histogram(image_array, channel):
+    """Pixel counts per value of one channel of an integer image (256 bins for uint8)"""
+    if image_array.dtype != np.uint8:
+        plane = _plane(image_array, channel)
+        return np.bincount(plane.ravel(), minlength=np.iinfo(plane.dtype).max + 1)
+    return cv2.calcHist([image_array], [channel], None, [256], [0, 256]).ravel()
+
+
+def _histogram_variance(histogram):
+    """Variance of the values a histogram counts (as np.var of the values)"""
+    histogram = np.asarray(histogram, dtype=np.float64)
+    total = histogram.sum()
+    if not total:
+        return 0.0
+    levels = np.arange(len(histogram), dtype=np.float64)
+    mean = (levels * histogram).sum() / total
+    return float((((levels - mean) ** 2) * histogram).sum() / total)
+
+
+def count_colors(image_array, limit=COLOR_COUNT_LIMIT):
+    """
+    Count distinct colors, stopping early once more than limit are found
+    
+    RGB pixels are packed into one uint32 and marked in a 2^24-entry bitmap
+    chunk by chunk, so no sort over pixel rows is needed.
+    
+    Args:
+        image_array: RGB array (H, W, 3) or single-channel array (H, W)
+        limit: Stop as soon as the count exceeds this (None = count all)
+    
+    Returns:
+        int: Exact count if <= limit, otherwise a lower bound > limit
+    """
+    if image_array.dtype != np.uint8:
+        # 16-bit or float data: fall back to sorting
+        if image_array.ndim == 3:
+            return len(np.unique(image_array.reshape(-1, image_array.shape[2]), axis=0))
+        return len(np.unique(image_array))
+    
+    if image_array.ndim == 2:
+        return int(np.count_nonzero(cv2.calcHist([image_array], [0], None, [256], [0, 256])))
+    
+    # Packed chunk by chunk, so an early stop skips packing the rest
+    pixels = image_array.reshape(-1, 3)
+    seen = np.zeros(1 << 24, dtype=bool)
+    count = 0
+    for start in range(0, len(pixels), COLOR_COUNT_CHUNK):
+        rgb = pixels[start:start + COLOR_COUNT_CHUNK]
+        chunk = (rgb[:, 0].astype(np.uint32) << 16) | (rgb[:, 1].astype(np.uint32) << 8) | rgb[:, 2]
+        fresh = chunk[~seen[chunk]]
+        if len(fresh):
+            seen[fresh] = True
+            count += len(np.unique(fresh))
+            if limit is not None and count > limit:
+                break
+    return count
+
+
 def recommend_method(analysis):
     """
     Recommend conversion method based on image analysis
@@ -0,0 +1,244 @@
+"""
+Lazy image input: memory-mapped raw formats, reduced decodes, generators
+
+Uncompressed formats (24/32-bit BMP, binary PGM/PPM, ``.npy``) are mapped
+instead of read, so only the pages a conversion touches are loaded. Other
+formats are decoded with PIL, optionally at reduced resolution via
+``Image.draft`` (JPEG DCT scaling) and ``Image.reduce``.
+"""
+import hashlib
+import io
+import os
+import struct
+
+import numpy as np
+from PIL import Image
+
+# analyze_image samples about this many pixels, so decoding more is wasted
+ANALYSIS_MAX_PIXELS = 1000000
+
+
+def open_image(source):
+    """
+    Open an image lazily (header only) with PIL
+
+    Args:
+        source: Path, encoded bytes or binary file-like object (e.g. an
+            uploaded file)
+
+    Returns:
+        PIL.Image.Image
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return Image.open(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+def read_bytes(source):
+    """
+    Encoded bytes of a path, bytes object or binary file-like object
+
+    Returns:
+        bytes (bytes-like inputs are returned as they are)
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def image_to_array(image):
+    """
+    Convert a PIL image to a NumPy array the converters understand
+
+    Palette images are expanded (to RGBA if they carry transparency), 'PA'
+    becomes RGBA and premultiplied or exotic modes are converted, so alpha
+    is never lost as raw palette indices.
+
+    Args:
+        image: PIL Image
+
+    Returns:
+        np.ndarray: (H, W), (H, W, 2) LA, (H, W, 3) RGB or (H, W, 4) RGBA
+    """
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    elif image.mode in ('PA', 'RGBa'):
+        image = image.convert('RGBA')
+    elif image.mode == 'La':
+        image = image.convert('LA')
+    elif image.mode == '1':
+        image = image.convert('L')
+    elif image.mode in ('CMYK', 'YCbCr', 'LAB', 'HSV'):
+        image = image.convert('RGB')
+    return np.array(image)
+
+
+def load_image(source, max_pixels=None, mode=None):
+    """
+    Load an image as a NumPy array, mapping raw files instead of reading them
+
+    Args:
+        source: Path, encoded bytes or binary file-like object
+        max_pixels: Decode at reduced resolution with at most about this many
+            pixels (for analysis-only callers); None decodes full size
+        mode: Optional PIL mode to convert decoded images to (e.g. 'RGB');
+            mapped files are returned as RGB/grayscale views without alpha
+
+    Returns:
+        np.ndarray: Decoded array, or a read-only memory-mapped view
+    """
+    if max_pixels is None and isinstance(source, (str, os.PathLike)):
+        array = map_raw_image(source)
+        if array is not None:
+            if mode is not None and array.ndim == 3 and array.shape[2] == 4:
+                array = array[:, :, :3]
+            return array
+
+    image = open_image(source)
+    if max_pixels is not None:
+        image = _reduce(image, max_pixels)
+    if mode is not None and image.mode != mode:
+        image = image.convert(mode)
+    return image_to_array(image)
+
+
+def map_raw_image(path):
+    """
+    Memory-map an uncompressed image file
+
+    Returns:
+        np.ndarray view of the pixels (RGB or grayscale, read-only), or None
+        if the file is not in a format that can be mapped
+    """
+    extension = os.path.splitext(os.fspath(path))[1].lower()
+    try:
+        if extension == '.npy':
+            return _map_npy(path)
+        if extension in ('.pgm', '.ppm'):
+            return _map_netpbm(path)
+        if extension == '.bmp':
+            return _map_bmp(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    return None
+
+
+def iter_images(sources, max_pixels=None, mode=None, on_error=None):
+    """
+    Yield (name, image_array) pairs, decoding each image only when requested
+
+    Combined with process_batch/iter_batch (which pull inputs as workers
+    free up) at most a few images per worker are decoded at any time.
+
+    Args:
+        sources: Iterable of paths or (name, source) pairs
+        max_pixels, mode: As in load_image
+        on_error: Optional callback(name, exception); failing images are
+            skipped. Without it the exception propagates.
+
+    Yields:
+        tuple: (name, image_array)
+    """
+    for item in sources:
+        if isinstance(item, tuple):
+            name, source = item
+        else:
+            name, source = os.path.basename(os.fspath(item)), item
+        try:
+            image_array = load_image(source, max_pixels=max_pixels, mode=mode)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(name, e)
+            continue
+        yield name, image_array
+
+
+def image_digest(image_array):
+    """
+    Fast content hash (BLAKE2b, 128 bit) of an image's pixels, shape and dtype
+    """
+    image_array = np.ascontiguousarray(image_array)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image_array.shape}{image_array.dtype.str}".encode())
+    digest.update(memoryview(image_array).cast('B'))
+    return digest.hexdigest()
+
+
+def _reduce(image, max_pixels):
+    """Downscale during or right after decoding to at most ~max_pixels"""
+    width, height = image.size
+    if width * height <= max_pixels:
+        return image
+    scale = (width * height / max_pixels) ** 0.5
+    target = (max(1, int(width / scale)), max(1, int(height / scale)))
+    # JPEG: decode directly at 1/2, 1/4 or 1/8 scale (no-op for other formats)
+    image.draft(image.mode, target)
+    factor = int(min(image.size[0] / target[0], image.size[1] / target[1]))
+    if factor > 1:
+        image = image.reduce(factor)
+    return image
+
+
+def _map_npy(path):
+    array = np.load(path, mmap_mode='r')
+    if array.dtype != np.uint8 or array.ndim not in (2, 3):
+        return None
+    if array.ndim == 3 and array.shape[2] not in (3, 4):
+        return None
+    return array
+
+
+def _map_netpbm(path):
+    """Binary PGM (P5) / PPM (P6) with 8-bit samples"""
+    with open(path, 'rb') as f:
+        header = f.read(512)
+    tokens = []
+    pos = 0
+    while len(tokens) < 4:
+        while header[pos:pos + 1].isspace():
+            pos += 1
+        if header[pos:pos + 1] == b'#':
+            pos = header.index(b'\n', pos) + 1
+            continue
+        end = pos
+        while end < len(header) and not header[end:end + 1].isspace():
+            end += 1
+        tokens.append(header[pos:end])
+        pos = end
+    magic, width, height, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+    if magic not in (b'P5', b'P6') or maxval > 255:
+        return None
+    shape = (height, width) if magic == b'P5' else (height, width, 3)
+    # Exactly one whitespace byte separates the header from the pixels
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=pos + 1, shape=shape)
+
+
+def _map_bmp(path):
+    """Uncompressed (BI_RGB) 24- and 32-bit BMP, bottom-up or top-down"""
+    with open(path, 'rb') as f:
+        header = f.read(54)
+    if header[:2] != b'BM' or struct.unpack_from('<I', header, 14)[0] < 40:
+        return None
+    offset = struct.unpack_from('<I', header, 10)[0]
+    width, height = struct.unpack_from('<ii', header, 18)
+    bits, compression = struct.unpack_from('<HI', header, 28)
+    if compression != 0 or bits not in (24, 32):
+        return None
+
+    channels = bits // 8
+    stride = (width * channels + 3) & ~3
+    rows = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(abs(height), stride))
+    pixels = rows[:, :width * channels].reshape(abs(height), width, channels)
+    if height > 0:
+        pixels = pixels[::-1]  # stored bottom-up
+    # BGR(X) -> RGB; like PIL, the fourth byte of 32-bit BI_RGB is ignored
+    return pixels[:, :, 2::-1]
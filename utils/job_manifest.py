@@ -0,0 +1,183 @@
+"""
+Input discovery and resumable JSON Lines manifest for batch conversions
+"""
+import hashlib
+import json
+import os
+import glob
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.pgm', '.ppm', '.npy')
+
+# Read size for hashing input files
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def discover_inputs(sources, extensions=IMAGE_EXTENSIONS):
+    """
+    Expand directories, glob patterns and plain files into input images
+
+    Args:
+        sources: Iterable of directory paths, glob patterns or file paths
+        extensions: Accepted (lowercase) file extensions
+
+    Yields:
+        tuple: (input_path, relative_output_stem) where the relative path
+            mirrors the input tree below the directory or glob root
+    """
+    for source in sources:
+        if os.path.isdir(source):
+            for dirpath, dirnames, filenames in os.walk(source):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(extensions):
+                        path = os.path.join(dirpath, filename)
+                        yield path, os.path.relpath(path, source)
+        elif _has_magic(source):
+            root = _glob_root(source)
+            for path in sorted(glob.iglob(source, recursive=True)):
+                if os.path.isfile(path) and path.lower().endswith(extensions):
+                    yield path, os.path.relpath(path, root)
+        elif os.path.isfile(source):
+            yield source, os.path.basename(source)
+        else:
+            raise FileNotFoundError(f"Input not found: {source}")
+
+
+def unique_outputs(inputs):
+    """
+    Check that every input gets an output of its own
+
+    Plain files map to their basename and every source mirrors its own
+    tree, so different inputs (a/x.png and b/x.png, or x.png and x.jpg)
+    can map to the same output and overwrite each other.
+
+    Args:
+        inputs: (input_path, relative_output_stem) pairs from discover_inputs
+
+    Returns:
+        list: The pairs, an input given more than once only the first time
+
+    Raises:
+        ValueError: Different inputs map to the same output; lists them
+    """
+    owners = {}
+    unique = []
+    clashes = {}
+    for input_path, relative_path in inputs:
+        stem = os.path.normcase(os.path.normpath(os.path.splitext(relative_path)[0]))
+        owner = owners.get(stem)
+        if owner is None:
+            owners[stem] = input_path
+            unique.append((input_path, relative_path))
+        elif not os.path.samefile(owner, input_path):
+            clashes.setdefault(stem, [owner]).append(input_path)
+    if clashes:
+        lines = [f"{stem}: {', '.join(paths)}" for stem, paths in clashes.items()]
+        raise ValueError('inputs map to the same output:\n  ' + '\n  '.join(lines))
+    return unique
+
+
+def file_digest(path):
+    """Fast content hash of a file (BLAKE2b, 128 bit)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_digest(params):
+    """Stable hash of conversion parameters"""
+    encoded = json.dumps(params, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+class JobManifest:
+    """
+    Append-only JSON Lines log of per-file conversion results
+
+    Every finished file is appended and flushed immediately, so an interrupted
+    run loses at most the files that were still in flight. The latest record
+    per input wins; compact() rewrites the file with only those.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self._partial_line = False  # the last line of the file has no newline
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    self._partial_line = not line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Partially written last line of an interrupted run
+                        continue
+                    self.records[record['input']] = record
+        self._file = None
+
+    def lookup(self, input_path):
+        """Latest record for an input, or None"""
+        return self.records.get(input_path)
+
+    def is_current(self, record, size, mtime_ns, params_hash):
+        """
+        True if a record proves the output is up to date without re-hashing
+
+        Used as the fast path on resume: same parameters, same size and
+        modification time as the successful run, and the output still exists.
+        """
+        return (
+            record is not None
+            and record.get('status') == 'ok'
+            and record.get('params_hash') == params_hash
+            and record.get('size') == size
+            and record.get('mtime_ns') == mtime_ns
+            and os.path.exists(record.get('output', ''))
+        )
+
+    def append(self, record):
+        """Record a result and flush it to disk"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if self._partial_line:
+                # Start after the interrupted line instead of extending it
+                self._file.write('\n')
+                self._partial_line = False
+        self.records[record['input']] = record
+        self._file.write(json.dumps(record, sort_keys=True) + '\n')
+        self._file.flush()
+
+    def compact(self):
+        """Rewrite the manifest with one (latest) record per input"""
+        self.close()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        os.replace(tmp_path, self.path)
+        self._partial_line = False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _has_magic(pattern):
+    return any(c in pattern for c in '*?[')
+
+
+def _glob_root(pattern):
+    """Directory part of a glob pattern before the first wildcard"""
+    parts = []
+    for part in pattern.replace('\\', '/').split('/'):
+        if _has_magic(part):
+            break
+        parts.append(part)
+    root = '/'.join(parts)
+    if pattern.startswith('/') and not root:
+        return '/'
+    return root or '.'
@@ -0,0 +1,99 @@
+"""
+Byte-bounded LRU and image digest memo shared by the in-process caches
+
+ConversionCache (whole conversion results) and TraceMemo (intermediate trace
+products) both keep values in memory up to a byte budget and both key them
+by image content; the bookkeeping for that lives here.
+"""
+from collections import OrderedDict
+import threading
+import weakref
+
+from .image_io import image_digest
+
+
+class ByteLRU:
+    """
+    Thread-safe LRU mapping bounded by the total size of its values
+
+    Sizes come from the sizeof callable; a value larger than max_bytes on
+    its own is not stored.
+    """
+
+    def __init__(self, max_bytes, sizeof):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up a key and mark it as recently used
+
+        Returns:
+            tuple: (found, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[0]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used ones over max_bytes"""
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self):
+        """Total size of the stored values"""
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DigestMemo:
+    """
+    image_digest that remembers the last array by identity
+
+    Analyzing and tracing the same array, or re-tracing it with other
+    parameters, then only hashes it once; do not modify an array in place
+    after its digest was taken.
+    """
+
+    def __init__(self):
+        self._last = (None, None)  # (weakref to last array, its digest)
+
+    def __call__(self, image_array):
+        ref, digest = self._last
+        if ref is not None and ref() is image_array:
+            return digest
+        digest = image_digest(image_array)
+        try:
+            self._last = (weakref.ref(image_array), digest)
+        except TypeError:
+            pass
+        return digest
+
+    def clear(self):
+        """Forget the last array"""
+        self._last = (None, None)
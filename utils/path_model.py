@@ -0,0 +1,257 @@
+"""
+Compact, array-backed geometry of traced paths
+
+A PathSet holds all paths of a trace in four flat arrays instead of one
+OpenCV array (or path data string) per contour:
+
+    points        (P, 2) int32    coordinates of all rings, back to back
+    ring_offsets  (R + 1,) int64  ring i is points[ring_offsets[i]:ring_offsets[i + 1]]
+    path_offsets  (N + 1,) int64  path j is rings path_offsets[j]:path_offsets[j + 1]
+    colors        (N, 3) uint8    RGB fill of every path (None until sampled)
+    controls      (P,) bool       Bézier control points (None: polylines only)
+
+A path becomes one SVG <path>: its first ring is the outline, any further
+rings are its holes. Without controls every ring is a polygon; with them (see
+utils.curve_fit) two consecutive control points and the following point make
+a cubic Bézier from the point before them, and all other points are line
+ends. Selecting, merging and moving paths are NumPy operations
+on these arrays; path data text is only produced while the SVG is written.
+"""
+import numpy as np
+
+from .svg_writer import PATH_BATCH_SIZE, format_rings, format_rings_compact
+
+# Two hex digits per channel value
+_HEX_BYTES = [f"{value:02x}" for value in range(256)]
+
+
+class PathSet:
+    """Paths (one or more closed rings each) with their fill colors"""
+
+    __slots__ = ('points', 'ring_offsets', 'path_offsets', 'colors', 'controls')
+
+    def __init__(self, points, ring_offsets, path_offsets, colors=None, controls=None):
+        self.points = points
+        self.ring_offsets = ring_offsets
+        self.path_offsets = path_offsets
+        self.colors = colors
+        self.controls = controls
+
+    @classmethod
+    def from_rings(cls, rings, ring_counts=None, colors=None):
+        """
+        Build a PathSet from separate point arrays
+
+        Args:
+            rings: Sequence of point arrays, all shaped (N, 1, 2) (OpenCV
+                contours) or all shaped (N, 2)
+            ring_counts: Rings per path, consumed in order (default: one
+                ring per path)
+            colors: Optional (N, 3) uint8 RGB fill per path
+        """
+        lengths = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+        if len(rings):
+            points = np.concatenate(rings).reshape(-1, 2)
+        else:
+            points = np.zeros((0, 2), dtype=np.int32)
+        if ring_counts is None:
+            path_offsets = np.arange(len(rings) + 1, dtype=np.int64)
+        else:
+            path_offsets = offsets_from_counts(ring_counts)
+        return cls(points.astype(np.int32, copy=False), offsets_from_counts(lengths), path_offsets, colors)
+
+    @classmethod
+    def concat(cls, path_sets):
+        """Merge PathSets into one, keeping their order"""
+        path_sets = list(path_sets)
+        if not path_sets:
+            return cls.from_rings([])
+        ring_lengths = np.concatenate([np.diff(ps.ring_offsets) for ps in path_sets])
+        ring_counts = np.concatenate([np.diff(ps.path_offsets) for ps in path_sets])
+        colors = None
+        if all(ps.colors is not None for ps in path_sets):
+            colors = np.concatenate([ps.colors for ps in path_sets])
+        controls = None
+        if any(ps.controls is not None for ps in path_sets):
+            controls = np.concatenate([
+                ps.controls if ps.controls is not None else np.zeros(ps.num_points, dtype=bool)
+                for ps in path_sets
+            ])
+        return cls(
+            np.concatenate([ps.points for ps in path_sets]),
+            offsets_from_counts(ring_lengths),
+            offsets_from_counts(ring_counts),
+            colors,
+            controls,
+        )
+
+    def __len__(self):
+        return len(self.path_offsets) - 1
+
+    @property
+    def num_rings(self):
+        return len(self.ring_offsets) - 1
+
+    @property
+    def num_points(self):
+        return len(self.points)
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays"""
+        arrays = (self.points, self.ring_offsets, self.path_offsets, self.colors, self.controls)
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def select(self, indices):
+        """
+        PathSet of a subset of the paths
+
+        Args:
+            indices: Boolean mask over the paths, or path indices (in the
+                order they should appear)
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        else:
+            indices = indices.astype(np.intp, copy=False)
+
+        ring_starts = self.path_offsets[indices]
+        ring_counts = self.path_offsets[indices + 1] - ring_starts
+        rings = concat_ranges(ring_starts, ring_counts)
+        point_starts = self.ring_offsets[rings]
+        ring_lengths = self.ring_offsets[rings + 1] - point_starts
+        points = concat_ranges(point_starts, ring_lengths)
+        return PathSet(
+            self.points[points],
+            offsets_from_counts(ring_lengths),
+            offsets_from_counts(ring_counts),
+            self.colors[indices] if self.colors is not None else None,
+            self.controls[points] if self.controls is not None else None,
+        )
+
+    def translate(self, dx, dy):
+        """PathSet moved by (dx, dy) pixels"""
+        offset = np.array([dx, dy], dtype=np.int32)
+        return PathSet(self.points + offset, self.ring_offsets, self.path_offsets, self.colors, self.controls)
+
+    def scale(self, sx, sy):
+        """PathSet with coordinates scaled by (sx, sy), rounded to whole pixels"""
+        factors = np.array([sx, sy], dtype=np.float64)
+        points = np.rint(self.points * factors).astype(np.int32)
+        return PathSet(points, self.ring_offsets, self.path_offsets, self.colors, self.controls)
+
+    def bounds(self):
+        """
+        Bounding box of every path (control points included)
+
+        Returns:
+            np.ndarray: (N, 4) int32 array of x0, y0, x1, y1 (inclusive)
+        """
+        if not len(self):
+            return np.zeros((0, 4), dtype=np.int32)
+        starts = self.ring_offsets[self.path_offsets[:-1]]
+        low = np.minimum.reduceat(self.points, starts, axis=0)
+        high = np.maximum.reduceat(self.points, starts, axis=0)
+        return np.hstack((low, high))
+
+    def iter_path_data(self, batch_size=PATH_BATCH_SIZE, compact=False):
+        """
+        Yield SVG path data for each path
+
+        Args:
+            batch_size: Number of paths formatted together
+            compact: Relative commands with minimal separators
+                (svg_writer.format_rings_compact) instead of absolute ones
+
+        Yields:
+            str: "M x y L x y ... Z[ M ... Z]" per path (rings joined by
+            spaces; "C x y x y x y" for curves), or "Mx yl..z[M..z]" when
+            compact, in order
+        """
+        format_batch = format_rings_compact if compact else format_rings
+        controls = self.controls
+        separator = '' if compact else ' '
+        path_offsets = self.path_offsets
+        single_ring = self.num_rings == len(self)
+        for start in range(0, len(self), batch_size):
+            stop = min(start + batch_size, len(self))
+            first_ring, last_ring = int(path_offsets[start]), int(path_offsets[stop])
+            offsets = self.ring_offsets[first_ring:last_ring + 1]
+            batch = slice(offsets[0], offsets[-1])
+            rings = format_batch(
+                self.points[batch], np.diff(offsets), controls[batch] if controls is not None else None
+            )
+            if single_ring:
+                yield from rings
+                continue
+            bounds = (path_offsets[start:stop + 1] - first_ring).tolist()
+            for ring_start, ring_stop in zip(bounds[:-1], bounds[1:]):
+                yield separator.join(rings[ring_start:ring_stop])
+
+    def iter_colors(self):
+        """Yield the fill of each path as a hex string ('#rrggbb')"""
+        for red, green, blue in self.colors.tolist():
+            yield '#' + _HEX_BYTES[red] + _HEX_BYTES[green] + _HEX_BYTES[blue]
+
+    def iter_paths(self, batch_size=PATH_BATCH_SIZE):
+        """Yield (path_data, fill_color) per path, as iter_svg expects"""
+        return zip(self.iter_path_data(batch_size), self.iter_colors())
+
+    def iter_color_groups(self, by_color=True, compact=True):
+        """
+        Yield the paths grouped by fill color, as iter_svg_groups expects
+
+        Args:
+            by_color: One group per distinct color, in order of first
+                appearance (reorders paths, so only for paths that do not
+                overlap). False groups only consecutive runs of one color,
+                which keeps the painting order.
+            compact: Compact path data (see iter_path_data)
+
+        Yields:
+            tuple: (fill_color, list of path data)
+        """
+        if not len(self):
+            return
+        packed = self.colors.astype(np.int32) @ np.array([1 << 16, 1 << 8, 1], dtype=np.int32)
+        if by_color:
+            _, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+            rank = np.argsort(np.argsort(first))[inverse]
+            order = np.argsort(rank, kind='stable')
+            paths = self.select(order)
+            run_starts = np.flatnonzero(np.diff(rank[order], prepend=-1))
+        else:
+            paths = self
+            run_starts = np.flatnonzero(np.diff(packed, prepend=-1))
+        run_stops = np.append(run_starts[1:], len(paths))
+
+        path_data = paths.iter_path_data(compact=compact)
+        colors = paths.colors[run_starts].tolist()
+        for (red, green, blue), count in zip(colors, (run_stops - run_starts).tolist()):
+            color = '#' + _HEX_BYTES[red] + _HEX_BYTES[green] + _HEX_BYTES[blue]
+            yield color, [next(path_data) for _ in range(count)]
+
+
+def colors_from_hex(hex_colors):
+    """(N, 3) uint8 array from '#rrggbb' strings"""
+    data = bytes.fromhex(''.join(color[1:] for color in hex_colors))
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).copy()
+
+
+def offsets_from_counts(counts):
+    """Start offsets plus the total: [0, c0, c0 + c1, ...]"""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def concat_ranges(starts, lengths):
+    """Concatenation of arange(start, start + length) for every pair"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    steps = np.repeat(np.asarray(starts, dtype=np.int64) - (ends - lengths), lengths)
+    return steps + np.arange(total, dtype=np.int64)
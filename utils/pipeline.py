@@ -0,0 +1,862 @@
+"""
+Conversion pipeline shared by the library, the CLI, the Streamlit app and batch workers
+
+Tracing runs as a fixed sequence of stages,
+
+    decode -> alpha -> threshold -> contour -> simplify -> fit -> color -> emit
+
+each a plain function ``stage(pipeline, state)`` that reads and updates a
+TraceState. A ConversionPipeline holds the stage table (any stage can be
+replaced), the tracing style (contour retrieval, filters, SVG attributes),
+scratch buffers that are reused while the image size stays the same, and the
+wall time of every stage of the last run. From the simplify stage on, the
+geometry is a utils.path_model.PathSet. With a utils.trace_memo.TraceMemo,
+stages reuse the products of earlier traces of the same image whose
+parameters they depend on are unchanged.
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .auto_threshold import THRESHOLD_METHODS, adaptive_threshold, otsu_threshold, select_threshold
+from .color_sampling import sample_compound_colors, sample_contour_colors, color_to_hex
+from .curve_fit import fit_curves
+from .image_io import image_to_array, load_image
+from .path_model import PathSet, colors_from_hex
+from .profiling import profile_count, profile_stage
+from .quantize import quantize_image
+from .speck_filter import cull_contours, remove_specks
+from .svg_writer import iter_svg, iter_svg_groups
+from .tiled_trace import trace_tiled
+from .trace_memo import get_trace_memo
+
+STAGES = ('decode', 'alpha', 'threshold', 'contour', 'simplify', 'fit', 'color', 'emit')
+
+TRACE_MODES = ('threshold', 'quantize')
+
+# Pixels composited per block in composite_alpha (bounds scratch memory)
+ALPHA_BLOCK_PIXELS = 1 << 20
+
+# Threshold tracing switches to tiles above this many pixels (tile_size=None)
+TILED_TRACE_MIN_PIXELS = 64 * 1024 * 1024
+TILED_TRACE_TILE_SIZE = 2048
+
+# Larger images are sampled for statistics (sample_image: image_histogram,
+# analyze_image)
+STATISTICS_SAMPLE_PIXELS = 1000000
+
+# Scratch buffers larger than this are allocated per call instead of kept
+BUFFER_MAX_BYTES = 64 * 1024 * 1024
+
+_RETRIEVAL_MODES = {'external': cv2.RETR_EXTERNAL, 'tree': cv2.RETR_TREE, 'compound': cv2.RETR_CCOMP}
+
+
+class TraceResult(NamedTuple):
+    """Outcome of ConversionPipeline.trace"""
+    chunks: Iterator[str]
+    num_contours: int
+    num_paths: int
+    timings: dict
+    threshold: Optional[int] = None  # threshold used (None: adaptive or quantize mode)
+
+
+class TraceState:
+    """Working data handed from stage to stage during one trace"""
+
+    def __init__(self, source, params, profile=None, memo=None):
+        self.source = source
+        self.params = params
+        self.profile = profile
+        self.memo = memo
+        self.image_key = None  # content key of the image once memoizing
+        self.retrieval = None
+        self.image = None
+        self.size = None  # (height, width) of the SVG, even when tracing a proxy
+        self.tile_size = 0
+        self.histogram = None  # grayscale histogram (automatic thresholds)
+        self.threshold = None  # threshold used, once chosen
+        self.invert = False  # foreground is dark, once chosen
+        self.binary = None
+        self.labels = None
+        self.palette = None
+        self.contours = None
+        self.hierarchy = None
+        self.contour_params = None  # what the contours depend on, besides the image
+        self.layers = None  # quantize mode: palette index of every path
+        self.kept = None  # contour (outline) of every path
+        self.kept_indices = None  # and its index in contours
+        self.rings = None  # unsimplified contour of every ring of paths
+        self.paths = None  # PathSet, once simplified
+        self.num_contours = 0
+        self.num_paths = 0
+        self.chunks = None
+
+    def count(self, key, value):
+        """Add to a profiling counter of the running stage (no-op unprofiled)"""
+        profile_count(self.profile, key, value)
+
+    def memo_key(self, product, *depends_on):
+        """Memo key of a product of this image, or None when not memoizing"""
+        if self.image_key is None:
+            return None
+        return (product, self.image_key) + depends_on
+
+    def recall(self, key):
+        """Memoized product for a memo_key, or None"""
+        if key is None:
+            return None
+        value = self.memo.get(key)
+        if value is not None:
+            self.count('memo_hits', 1)
+        return value
+
+    def remember(self, key, value):
+        """Memoize value under a memo_key (no-op for None) and return it"""
+        if key is not None:
+            self.memo.put(key, value)
+        return value
+
+
+class ConversionPipeline:
+    """
+    Configurable tracing pipeline (decode, alpha, threshold, contour,
+    simplify, fit, color, emit)
+
+    A pipeline is not thread-safe (it owns scratch buffers); use one per
+    thread, e.g. via get_pipeline().
+    """
+
+    def __init__(self, stages=None, decoder=None, retrieval='external', min_points=None,
+                 min_area=0, min_approx_points=0, sample_gray=False, background=None,
+                 path_attrs=' stroke="none"', memo=None):
+        """
+        Args:
+            stages: Optional {stage_name: function(pipeline, state)} overrides
+            decoder: Turns a non-array source into an image array
+                (default: utils.image_io.load_image)
+            retrieval: 'external' (outer contours only, tileable), 'tree'
+                (nested contours, painted in order) or 'compound' (each
+                outer contour with its holes as one evenodd path)
+            min_points: Drop contours with at most this many points
+                (None: 2 * simplify)
+            min_area: Drop contours enclosing at most this area (0: no test)
+            min_approx_points: Drop simplified contours with at most this
+                many points
+            sample_gray: Sample path colors from grayscale images instead of
+                filling them black
+            background: Optional fill color of a full-size background <rect>
+            path_attrs: Extra attributes for every traced <path>
+            memo: TraceMemo for intermediate products (default: the
+                process-wide one, see utils.trace_memo.configure_trace_memo)
+        """
+        if retrieval not in _RETRIEVAL_MODES:
+            raise ValueError(f"Unknown contour retrieval: {retrieval}")
+        unknown = set(stages or ()) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown pipeline stages: {', '.join(sorted(unknown))}")
+
+        self.stages = {**DEFAULT_STAGES, **(stages or {})}
+        self.decoder = decoder or load_image
+        self.retrieval = retrieval
+        self.min_points = min_points
+        self.min_area = min_area
+        self.min_approx_points = min_approx_points
+        self.sample_gray = sample_gray
+        self.background = background
+        self.path_attrs = path_attrs
+        self.memo = memo
+        self.timings = {}
+        self._buffers = {}
+
+    def trace(self, source, threshold=128, simplify=2, invert=False, auto_invert=True,
+              background_color=None, mode='threshold', n_colors=8, quantizer='mediancut',
+              tile_size=None, profile=None, compact=False, max_edge=None, holes=False,
+              curves=False, despeckle=0, despeckle_kernel=0):
+        """
+        Trace an image and return the SVG as lazily produced chunks
+
+        Args:
+            source: Image array, PIL image, path or encoded bytes
+            threshold: Threshold value for binary conversion (0-255), or
+                'otsu', 'triangle' or 'adaptive' to choose it from the
+                image (utils.auto_threshold); the value chosen is
+                returned in TraceResult.threshold
+            simplify: Simplification factor for contours
+            invert: Whether to invert the binary threshold
+            auto_invert: Also invert when the image is mostly dark; with an
+                automatic threshold, invert when the dark class is the
+                smaller one (ink on paper), so the shapes are traced
+            background_color: Background for transparent images (hex string)
+            mode: 'threshold' (single binary layer) or 'quantize' (one layer
+                per color)
+            n_colors: Number of colors for mode='quantize'
+            quantizer: 'mediancut' or 'kmeans' for mode='quantize'
+            tile_size: Trace mode='threshold' in tiles of this size to bound
+                memory (same output, external retrieval only). None tiles
+                only images above TILED_TRACE_MIN_PIXELS, 0 never tiles.
+            profile: Optional utils.profiling.Profiler; stages are recorded
+                as 'trace.<stage>' with their counters
+            compact: Compact SVG (relative path commands, one element per
+                fill color, shared attributes written once) instead of one
+                absolute <path> per shape
+            max_edge: Trace a copy downscaled to this longest edge (if the
+                image is larger) and scale the paths back up: a fast preview
+                with the full trace's size and coordinates, less detail
+            holes: Keep holes (the counters of letters like O and B): use
+                'compound' contour retrieval instead of the pipeline's own
+            curves: Fit cubic Béziers (and lines) within simplify pixels of
+                the contours instead of Douglas-Peucker polylines; never
+                tiled
+            despeckle: Erase specks and fill pinholes smaller than this
+                many pixels in the mask (or every color layer) before
+                contours are found; 0 traces the mask as thresholded.
+                Never tiled.
+            despeckle_kernel: Open and close the mask (or every color
+                layer) with a square kernel of this many pixels first,
+                which also erases hairlines thinner than the kernel and
+                merges shapes closer than it; 0 or 1 skips it. Never tiled.
+
+        Returns:
+            TraceResult: chunks, num_contours (found), num_paths (emitted),
+            seconds per stage and the threshold used; 'emit' keeps growing
+            while the chunks are consumed
+        """
+        if mode not in TRACE_MODES:
+            raise ValueError(f"Unknown tracing mode: {mode}")
+        if isinstance(threshold, str) and threshold not in THRESHOLD_METHODS:
+            raise ValueError(f"Unknown threshold method: {threshold}")
+
+        state = TraceState(source, {
+            'threshold': threshold,
+            'simplify': simplify,
+            'invert': invert,
+            'auto_invert': auto_invert,
+            'background_color': background_color,
+            'mode': mode,
+            'n_colors': n_colors,
+            'quantizer': quantizer,
+            'tile_size': tile_size,
+            'compact': compact,
+            'curves': curves,
+            'despeckle': despeckle,
+            'despeckle_kernel': despeckle_kernel,
+            'max_edge': max_edge,
+        }, profile, self.memo if self.memo is not None else get_trace_memo())
+        state.retrieval = 'compound' if holes else self.retrieval
+        timings = {}
+        self.timings = timings
+        for name in STAGES:
+            start = time.perf_counter()
+            with profile_stage(profile, 'trace.' + name):
+                self.stages[name](self, state)
+            timings[name] = time.perf_counter() - start
+
+        chunks = _timed_chunks(state.chunks, timings, 'emit', profile)
+        return TraceResult(chunks, state.num_contours, state.num_paths, timings, state.threshold)
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        """
+        Scratch array kept across calls while shape and dtype stay the same
+
+        Contents are undefined; arrays above BUFFER_MAX_BYTES are not kept.
+        """
+        array = self._buffers.get(name)
+        if array is not None and array.shape == tuple(shape) and array.dtype == dtype:
+            return array
+        array = np.empty(shape, dtype=dtype)
+        if array.nbytes <= BUFFER_MAX_BYTES:
+            self._buffers[name] = array
+        else:
+            self._buffers.pop(name, None)
+        return array
+
+    def release(self):
+        """Drop all scratch buffers"""
+        self._buffers.clear()
+
+
+def decode_stage(pipeline, state):
+    """Source -> image array; plans tiling once the size is known"""
+    source = state.source
+    if isinstance(source, np.ndarray):
+        image = source
+    elif isinstance(source, Image.Image):
+        image = image_to_array(source)
+    else:
+        image = pipeline.decoder(source)
+    state.size = image.shape[:2]
+    params = state.params
+    memo = state.memo
+    full_image = image
+
+    max_edge = params['max_edge']
+    if max_edge and max(image.shape[:2]) > max_edge:
+        # The proxy is memoized under the full image's key, so a rerun
+        # neither resizes the image nor hashes the proxy
+        if memo is not None:
+            full_key = memo.image_key(image)
+            proxy = memo.get(('proxy', full_key, max_edge))
+            if proxy is None:
+                proxy = downscale_image(image, max_edge)
+                memo.put(('proxy', full_key, max_edge), proxy)
+            state.image_key = (full_key, max_edge)
+            image = proxy
+        else:
+            image = downscale_image(image, max_edge)
+        # Same tolerance in full-size pixels, so the preview keeps the shapes
+        # the full trace keeps
+        params['simplify'] = params['simplify'] * image.shape[1] / state.size[1]
+        params['despeckle'] = params['despeckle'] * (image.shape[1] / state.size[1]) ** 2
+        params['despeckle_kernel'] = round(params['despeckle_kernel'] * image.shape[1] / state.size[1])
+    state.image = image
+    state.count('pixels', image.shape[0] * image.shape[1])
+
+    tile_size = params['tile_size']
+    if tile_size is None and image.shape[0] * image.shape[1] > TILED_TRACE_MIN_PIXELS:
+        tile_size = TILED_TRACE_TILE_SIZE
+    tileable = (
+        params['mode'] == 'threshold'
+        and state.retrieval == 'external'
+        and params['auto_invert']
+        and not params['curves']
+        and not params['despeckle']
+        and params['despeckle_kernel'] <= 1
+        and params['threshold'] != 'adaptive'
+    )
+    state.tile_size = tile_size if tile_size and tileable else 0
+    if state.tile_size:
+        state.image_key = None
+    elif memo is not None and state.image_key is None:
+        state.image_key = memo.image_key(image)
+
+    if params['mode'] == 'threshold' and params['threshold'] in THRESHOLD_METHODS:
+        # Of the full image, so a preview, the full trace and analyze_image
+        # agree on the threshold; tiled (huge) images are not hashed for it
+        shared = memo if state.image_key is not None else None
+        state.histogram = image_histogram(full_image, params['background_color'], memo=shared)
+
+
+def alpha_stage(pipeline, state):
+    """Composite RGBA/LA onto the background (per tile when tiling)"""
+    if state.tile_size or not has_alpha_channel(state.image):
+        return
+    background_color = state.params['background_color']
+    key = state.memo_key('rgb', background_color)
+    image = state.recall(key)
+    if image is None:
+        # Memoized products outlive the trace, so they never use scratch buffers
+        height, width = state.image.shape[:2]
+        out = pipeline.buffer('alpha', (height, width, 3)) if key is None else None
+        image = state.remember(key, composite_alpha(state.image, background_color, out=out))
+    state.image = image
+
+
+def threshold_stage(pipeline, state):
+    """Binary mask (threshold mode) or color labels (quantize mode)"""
+    params = state.params
+    histogram = state.histogram
+    if params['mode'] == 'threshold':
+        state.threshold, state.invert = params['threshold'], params['invert']
+    if histogram is not None:
+        # Automatic threshold; adaptive splits the classes for the polarity
+        # with Otsu's threshold
+        split = otsu_threshold(histogram)
+        if params['threshold'] == 'adaptive':
+            state.threshold = None
+        else:
+            split = state.threshold = select_threshold(params['threshold'], histogram)
+            state.count('threshold', state.threshold)
+        if not state.invert and params['auto_invert']:
+            state.invert = bool(histogram[:split + 1].sum() < histogram[split + 1:].sum())
+    if state.tile_size:
+        return
+    background_color = params['background_color']
+    if params['mode'] == 'quantize':
+        key = state.memo_key('labels', background_color, params['n_colors'], params['quantizer'])
+        quantized = state.recall(key)
+        if quantized is None:
+            labels, palette, _ = quantize_image(state.image, params['n_colors'], params['quantizer'])
+            quantized = state.remember(key, (labels, palette))
+        state.labels, state.palette = quantized
+        state.count('colors', len(state.palette))
+        return
+
+    image = state.image
+    gray = image
+    if image.ndim == 3:
+        key = state.memo_key('gray', background_color)
+        gray = state.recall(key)
+        if gray is None:
+            out = pipeline.buffer('gray', image.shape[:2]) if key is None else None
+            gray = state.remember(key, cv2.cvtColor(image, cv2.COLOR_RGB2GRAY, dst=out))
+
+    invert = state.invert
+    if histogram is None and not invert and params['auto_invert']:
+        key = state.memo_key('mean', background_color)
+        mean = state.recall(key)
+        if mean is None:
+            mean = state.remember(key, gray.mean())
+        invert = state.invert = mean < 127
+
+    despeckle, kernel_size = params['despeckle'], params['despeckle_kernel']
+    state.contour_params = (background_color, params['threshold'], invert, state.retrieval, despeckle, kernel_size)
+    found = state.recall(state.memo_key('contours', *state.contour_params))
+    if found is not None:
+        state.contours, state.hierarchy = found
+        return  # same binary image as before: no need to build it
+    out = pipeline.buffer('binary', gray.shape)
+    if params['threshold'] == 'adaptive':
+        state.binary, block, _ = adaptive_threshold(gray, histogram, invert, out=out)
+        state.count('adaptive_block', block)
+    else:
+        kind = cv2.THRESH_BINARY_INV if invert else cv2.THRESH_BINARY
+        _, state.binary = cv2.threshold(gray, state.threshold, 255, kind, dst=out)
+    if despeckle or kernel_size > 1:
+        _, specks, holes = remove_specks(state.binary, despeckle, kernel_size, out=state.binary)
+        state.count('specks', specks)
+        state.count('pinholes', holes)
+
+
+def contour_stage(pipeline, state):
+    """
+    Find contours
+
+    Tiled traces run threshold, contour, simplify and color per tile here;
+    quantize mode traces and simplifies every color layer here.
+    """
+    params = state.params
+    if state.tile_size:
+        prepare = None
+        if has_alpha_channel(state.image):
+            background_color = params['background_color']
+            prepare = lambda region: composite_alpha(region, background_color)
+        # An automatic threshold has chosen the polarity already
+        approxes, colors, state.num_contours = trace_tiled(
+            state.image, state.threshold, params['simplify'], state.invert,
+            auto_invert=state.histogram is None, prepare=prepare, tile_size=state.tile_size
+        )
+        state.paths = PathSet.from_rings(approxes, colors=colors_from_hex(colors))
+        state.count('contours', state.num_contours)
+        return
+
+    if params['mode'] == 'quantize':
+        # Colors are ordered by frequency; layer i covers every pixel whose
+        # color ranks i or lower, so layers overlap instead of leaving seams
+        # and holes only reveal the layers painted below them.
+        # OpenCV releases the GIL, so layers trace concurrently in threads.
+        labels, simplify, despeckle = state.labels, params['simplify'], params['despeckle']
+        kernel_size = params['despeckle_kernel']
+        layer_indices = range(1, len(state.palette))
+        key = state.memo_key('layers', params['background_color'], params['n_colors'], params['quantizer'],
+                             despeckle, kernel_size)
+        layer_contours = state.recall(key)
+        workers = max(1, min(len(layer_indices), os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            if layer_contours is None:
+                layer_contours = state.remember(key, list(executor.map(
+                    lambda i: find_compound_contours(
+                        remove_specks(labels >= i, despeckle, kernel_size)[0] if despeckle or kernel_size > 1
+                        else labels >= i
+                    ), layer_indices
+                )))
+            layers = list(executor.map(
+                lambda found: compound_paths(*found, simplify, curves=params['curves']), layer_contours
+            ))
+        state.paths = PathSet.concat(paths for paths, _ in layers)
+        state.layers = np.repeat(
+            np.arange(1, len(state.palette)), [len(paths) for paths, _ in layers]
+        )
+        state.num_contours = sum(count for _, count in layers)
+        state.count('contours', state.num_contours)
+        return
+
+    if state.contours is None:
+        found = cv2.findContours(state.binary, _RETRIEVAL_MODES[state.retrieval], cv2.CHAIN_APPROX_SIMPLE)
+        state.contours, state.hierarchy = state.remember(
+            state.memo_key('contours', *state.contour_params), found
+        )
+    state.num_contours = len(state.contours)
+    state.count('contours', state.num_contours)
+
+
+def simplify_stage(pipeline, state):
+    """Cull small contours in bulk and simplify the rest with Douglas-Peucker"""
+    if state.contours is None:
+        if state.paths is not None:
+            # Simplified per tile or per color layer already
+            state.count('points_after', state.paths.num_points)
+        return
+    simplify = state.params['simplify']
+    min_points = simplify * 2 if pipeline.min_points is None else pipeline.min_points
+
+    contours = state.contours
+    candidates = cull_contours(contours, min_points, pipeline.min_area)
+    state.count('culled', len(contours) - len(candidates))
+    kept_indices, approxes = [], []
+    for index in candidates.tolist():
+        approx = cv2.approxPolyDP(contours[index], simplify, True)
+        if len(approx) > pipeline.min_approx_points:
+            kept_indices.append(index)
+            approxes.append(approx)
+    if state.profile is not None:
+        state.count('points_before', sum(len(contours[i]) for i in kept_indices))
+
+    ring_counts = None
+    if state.retrieval == 'compound' and kept_indices:
+        # Holes (and small outlines) are filtered like any contour; holes
+        # of a dropped outline go with it
+        position = dict(zip(kept_indices, range(len(kept_indices))))
+        rings, ring_counts = _group_holes(state.hierarchy[0, :, 3], kept_indices)
+        approxes = [approxes[position[i]] for i in rings.tolist()]
+        kept_indices = rings[np.cumsum(ring_counts) - ring_counts].tolist()
+    state.kept_indices = kept_indices
+    state.kept = [contours[i] for i in kept_indices]
+    state.rings = state.kept if ring_counts is None else [contours[i] for i in rings.tolist()]
+    state.paths = PathSet.from_rings(approxes, ring_counts)
+    state.count('points_after', state.paths.num_points)
+
+
+def fit_stage(pipeline, state):
+    """Fit the kept contours with cubic Béziers (curves=True)"""
+    if not state.params['curves'] or state.rings is None:
+        # Off, or fitted per color layer already
+        return
+    ring_counts = np.diff(state.paths.path_offsets)
+    state.paths = fit_curves(state.rings, ring_counts, state.params['simplify'])
+    state.count('points_after', state.paths.num_points)
+
+
+def color_stage(pipeline, state):
+    """Fill color per path: mean color inside the contour, or the palette"""
+    paths = state.paths
+    if paths.colors is not None:
+        return
+    if state.palette is not None:
+        paths.colors = np.asarray(state.palette, dtype=np.uint8)[state.layers]
+        return
+
+    image = state.image
+    if image.ndim == 2 and not pipeline.sample_gray:
+        paths.colors = np.zeros((len(paths), 3), dtype=np.uint8)
+        return
+    mean_colors = _sample_kept_colors(pipeline, state)
+    if image.ndim == 2:
+        mean_colors = np.repeat(mean_colors, 3, axis=1)
+    # Truncated like color_to_hex
+    paths.colors = mean_colors.astype(np.uint8).reshape(-1, 3)
+
+
+def emit_stage(pipeline, state):
+    """Lazy SVG chunks; the most frequent color is the quantize background"""
+    height, width = state.size
+    paths = state.paths
+    proxy_height, proxy_width = state.image.shape[:2]
+    if (proxy_height, proxy_width) != (height, width):
+        paths = paths.scale(width / proxy_width, height / proxy_height)
+    state.num_paths = len(paths)
+    state.count('paths', state.num_paths)
+    path_attrs, background = pipeline.path_attrs, pipeline.background
+    if state.layers is not None:
+        path_attrs = ' fill-rule="evenodd"' + path_attrs
+        background = color_to_hex(state.palette[0])
+    elif state.retrieval == 'compound':
+        path_attrs = ' fill-rule="evenodd"' + path_attrs
+
+    if state.params['compact']:
+        # Outer contours (with or without their holes) never overlap and
+        # color layers are already painted one after the other, so
+        # same-colored paths can become one <path>; nested (tree) contours
+        # must keep their painting order
+        by_color = state.retrieval in ('external', 'compound')
+        state.chunks = iter_svg_groups(
+            width, height, paths.iter_color_groups(by_color=by_color),
+            path_attrs=path_attrs, background=background, merge=by_color,
+        )
+        return
+
+    state.chunks = iter_svg(width, height, paths.iter_paths(), path_attrs=path_attrs, background=background)
+
+
+DEFAULT_STAGES = {
+    'decode': decode_stage,
+    'alpha': alpha_stage,
+    'threshold': threshold_stage,
+    'contour': contour_stage,
+    'simplify': simplify_stage,
+    'fit': fit_stage,
+    'color': color_stage,
+    'emit': emit_stage,
+}
+
+_local = threading.local()
+
+
+def get_pipeline():
+    """Default (library style) pipeline of the calling thread"""
+    pipeline = getattr(_local, 'pipeline', None)
+    if pipeline is None:
+        pipeline = _local.pipeline = ConversionPipeline()
+    return pipeline
+
+
+def trace_compound_layer(mask, simplify):
+    """
+    Trace a boolean layer into compound paths (outer contour plus its holes)
+
+    Returns:
+        tuple: (PathSet without colors, number of contours found)
+    """
+    return compound_paths(*find_compound_contours(mask), simplify)
+
+
+def find_compound_contours(mask):
+    """Contours of a boolean layer with their two-level (RETR_CCOMP) hierarchy"""
+    return cv2.findContours(mask.view(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+
+
+def compound_paths(contours, hierarchy, simplify, curves=False):
+    """
+    Simplify the contours of find_compound_contours into compound paths
+
+    With curves, the contours are fitted with cubic Béziers within simplify
+    pixels (utils.curve_fit) instead of Douglas-Peucker.
+
+    Returns:
+        tuple: (PathSet without colors, number of contours found)
+    """
+    if not contours:
+        return PathSet.from_rings([]), 0
+
+    kept = cull_contours(contours, simplify * 2)
+    rings, ring_counts = _group_holes(hierarchy[0, :, 3], kept)
+    if curves:
+        return fit_curves([contours[i] for i in rings.tolist()], ring_counts, simplify), len(contours)
+    approxes = [cv2.approxPolyDP(contours[i], simplify, True) for i in rings.tolist()]
+    return PathSet.from_rings(approxes, ring_counts), len(contours)
+
+
+def _group_holes(parents, kept):
+    """
+    Group kept RETR_CCOMP contours into compound paths
+
+    Args:
+        parents: Parent index of every contour (-1 for outer contours)
+        kept: Indices of the contours that passed the filters
+
+    Returns:
+        tuple: (contour indices, outline first and then its holes for every
+        kept outer contour in order; number of rings per path)
+    """
+    kept = np.asarray(kept, dtype=np.intp)
+    is_kept = np.zeros(len(parents), dtype=bool)
+    is_kept[kept] = True
+
+    # Holes whose outline was dropped are dropped too
+    owners = np.where(parents[kept] < 0, kept, parents[kept])
+    valid = is_kept[owners]
+    rings, owners = kept[valid], owners[valid]
+    order = np.lexsort((rings, rings != owners, owners))
+    rings, owners = rings[order], owners[order]
+    _, ring_counts = np.unique(owners, return_counts=True)
+    return rings, ring_counts
+
+
+def _sample_kept_colors(pipeline, state):
+    """
+    Mean color inside every kept contour
+
+    Memoized per raw contour: a simplify change keeps a different subset of
+    the same contours, so only contours never sampled before are sampled.
+    """
+    image, contours = state.image, state.contours
+    if state.retrieval == 'compound':
+        # Sampled inside the outline but outside all of its holes (also
+        # holes dropped as too small, so the color does not depend on simplify)
+        sample = lambda indices: sample_compound_colors(image, contours, state.hierarchy, indices)
+    else:
+        # External contours never overlap, so they are sampled all at once
+        disjoint = state.retrieval == 'external'
+        sample = lambda indices: sample_contour_colors(image, [contours[i] for i in indices], disjoint=disjoint)
+
+    key = state.memo_key('colors', *state.contour_params) if state.contour_params else None
+    if key is None:
+        return sample(state.kept_indices)
+
+    memoized = state.recall(key)
+    if memoized is None:
+        channels = state.image.shape[2] if state.image.ndim == 3 else 1
+        memoized = state.remember(key, (
+            np.zeros((len(state.contours), channels), dtype=np.float64),
+            np.zeros(len(state.contours), dtype=bool),
+        ))
+    means, sampled = memoized
+    indices = np.asarray(state.kept_indices, dtype=np.intp)
+    missing = indices[~sampled[indices]]
+    if len(missing):
+        means[missing] = sample(missing.tolist())
+        sampled[missing] = True
+    return means[indices]
+
+
+def has_alpha_channel(image_array):
+    """True for LA (H, W, 2) and RGBA (H, W, 4) arrays"""
+    return image_array.ndim == 3 and image_array.shape[2] in (2, 4)
+
+
+def sample_image(image_array, max_pixels=STATISTICS_SAMPLE_PIXELS):
+    """
+    Bounded working copy of an image for statistics
+
+    Every step-th pixel of every step-th row, step = int(sqrt(pixels /
+    max_pixels)): about max_pixels pixels, always fewer than 4 * max_pixels.
+
+    Returns:
+        np.ndarray: The image itself if the step is 1
+    """
+    height, width = image_array.shape[:2]
+    step = math.isqrt(height * width // max_pixels)
+    if step <= 1:
+        return image_array
+    return np.ascontiguousarray(image_array[::step, ::step])
+
+
+def image_histogram(image_array, background_color=None, memo=None, sample=None):
+    """
+    256-bin grayscale histogram of an image, as the trace sees it
+
+    Counted on the working copy of sample_image (exact for images below
+    4 * STATISTICS_SAMPLE_PIXELS); transparent images are composited onto
+    background_color first.
+
+    Args:
+        image_array: Image array (gray, LA, RGB or RGBA)
+        background_color: Background for transparent images (hex string)
+        memo: Optional TraceMemo sharing the histogram between traces and
+            analyze_image ('histogram' entries)
+        sample: sample_image(image_array), if the caller already made it
+
+    Returns:
+        np.ndarray: int64 pixel counts per gray level
+    """
+    key = None
+    if memo is not None:
+        key = ('histogram', memo.image_key(image_array), background_color)
+        histogram = memo.get(key)
+        if histogram is not None:
+            return histogram
+    if sample is None:
+        sample = sample_image(image_array)
+    if has_alpha_channel(sample):
+        sample = composite_alpha(sample, background_color)
+    if sample.ndim == 3:
+        sample = cv2.cvtColor(sample, cv2.COLOR_RGB2GRAY)
+    histogram = cv2.calcHist([sample], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    if key is not None:
+        memo.put(key, histogram)
+    return histogram
+
+
+def downscale_image(image_array, max_edge):
+    """
+    Shrink an image (area averaging) so its longest edge is at most max_edge
+
+    Returns:
+        np.ndarray: The image itself if it is small enough
+    """
+    height, width = image_array.shape[:2]
+    factor = max_edge / max(height, width)
+    if factor >= 1:
+        return image_array
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    return cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+
+
+def composite_alpha(image_array, background_color=None, out=None):
+    """
+    Composite an RGBA or LA image onto a solid background
+
+    Uses integer math, (a*c + (255-a)*bg + 127) // 255, in row blocks that
+    reuse two uint16 scratch buffers. Fully opaque blocks are copied without
+    any arithmetic.
+
+    Args:
+        image_array: RGBA (H, W, 4) or LA (H, W, 2) image array
+        background_color: Background color to use (hex string or None for white)
+        out: Optional uint8 (H, W, 3) array to write the result into
+
+    Returns:
+        RGB image array
+    """
+    if background_color is None:
+        background_color = "#FFFFFF"
+
+    # Convert hex to RGB
+    bg_color = np.array(
+        [int(background_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4)], dtype=np.uint16
+    )
+
+    height, width = image_array.shape[:2]
+    color = image_array[:, :, :-1]  # RGB, or the gray plane of LA (broadcast to RGB)
+    alpha = image_array[:, :, -1:]
+
+    # Fully opaque: just drop the alpha channel
+    if alpha.min() == 255:
+        if image_array.shape[2] == 4:
+            return cv2.cvtColor(image_array, cv2.COLOR_RGBA2RGB, dst=out)
+        return cv2.cvtColor(np.ascontiguousarray(color), cv2.COLOR_GRAY2RGB, dst=out)
+
+    output = out if out is not None else np.empty((height, width, 3), dtype=np.uint8)
+
+    rows = max(1, ALPHA_BLOCK_PIXELS // max(1, width))
+    blended = np.empty((rows, width, 3), dtype=np.uint16)
+    scratch = np.empty((rows, width, 3), dtype=np.uint16)
+
+    for y in range(0, height, rows):
+        block = slice(y, y + rows)
+        n = min(rows, height - y)
+        a = alpha[block]
+
+        if a.min() == 255:
+            output[block] = color[block]
+            continue
+
+        acc, tmp = blended[:n], scratch[:n]
+        np.multiply(color[block], a, out=acc, dtype=np.uint16)
+        np.subtract(255, a, out=tmp, dtype=np.uint16)
+        np.multiply(tmp, bg_color, out=tmp)
+        acc += tmp
+        # (x + 127) // 255 for x <= 255 * 255, without a division
+        acc += 128
+        np.right_shift(acc, 8, out=tmp)
+        acc += tmp
+        acc >>= 8
+        output[block] = acc
+
+    return output
+
+
+def _timed_chunks(chunks, timings, name, profile=None):
+    """
+    Yield from chunks, adding the time spent producing them to timings[name]
+
+    With a profile, each chunk is produced inside stage 'trace.<name>' and
+    counted as bytes (SVG output is ASCII).
+    """
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        with profile_stage(profile, 'trace.' + name):
+            chunk = next(iterator, None)
+            if chunk is not None:
+                profile_count(profile, 'bytes', len(chunk))
+        timings[name] += time.perf_counter() - start
+        if chunk is None:
+            return
+        yield chunk
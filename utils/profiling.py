@@ -0,0 +1,128 @@
+"""
+Opt-in per-stage profiling: wall time, peak allocation and counters
+
+Functions that accept ``profile=`` (png_to_svg_trace, png_to_svg_embed,
+analyze_image, process_batch, ConversionPipeline.trace) record into a
+Profiler when one is passed and cost nothing otherwise. Peak allocation is
+measured with tracemalloc, which sees NumPy and Python allocations but not
+memory allocated inside OpenCV or PIL.
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    """
+    Collects wall time, peak traced allocation and counters per stage
+
+    Stages may nest and may be entered repeatedly (e.g. once per emitted
+    chunk); repeated entries add up time and counters and keep the highest
+    peak.
+    """
+
+    def __init__(self, trace_memory=True):
+        """
+        Args:
+            trace_memory: Measure peak allocation with tracemalloc (slows
+                allocation-heavy code down noticeably)
+        """
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._stack = []  # open frames: [name, start_current, max_peak_seen]
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage name"""
+        self._enter(name)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            self._exit(name, seconds)
+
+    def count(self, key, value=1):
+        """Add value to counter key of the innermost open stage"""
+        if not self._stack:
+            raise RuntimeError("Profiler.count() outside of a stage")
+        counts = self._record(self._stack[-1][0])['counts']
+        counts[key] = counts.get(key, 0) + value
+
+    def as_dict(self):
+        """
+        Structured results
+
+        Returns:
+            dict: {stage_name: {'seconds', 'peak_bytes', 'calls', 'counts'}}
+            in the order stages were first entered; peak_bytes is None
+            without memory tracing
+        """
+        return {
+            name: {**record, 'counts': dict(record['counts'])}
+            for name, record in self.stages.items()
+        }
+
+    def format_table(self):
+        """Human-readable table of all stages"""
+        lines = [f"{'stage':<20} {'time':>10} {'peak':>10}  counts"]
+        for name, record in self.stages.items():
+            peak = record['peak_bytes']
+            peak_text = f"{peak / 1024:.0f} KB" if peak is not None else '-'
+            counts = ', '.join(f"{key}={value}" for key, value in record['counts'].items())
+            lines.append(f"{name:<20} {record['seconds'] * 1000:>7.1f} ms {peak_text:>10}  {counts}")
+        return '\n'.join(lines)
+
+    def _record(self, name):
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = {
+                'seconds': 0.0,
+                'peak_bytes': 0 if self.trace_memory else None,
+                'calls': 0,
+                'counts': {},
+            }
+        return record
+
+    def _enter(self, name):
+        self._record(name)
+        current = 0
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            # Fold the peak so far into the enclosing stage before resetting
+            if self._stack:
+                self._stack[-1][2] = max(self._stack[-1][2], peak)
+            tracemalloc.reset_peak()
+        self._stack.append([name, current, current])
+
+    def _exit(self, name, seconds):
+        _, start_current, max_peak = self._stack.pop()
+        record = self.stages[name]
+        record['seconds'] += seconds
+        record['calls'] += 1
+        if not self.trace_memory:
+            return
+
+        peak = max(max_peak, tracemalloc.get_traced_memory()[1])
+        record['peak_bytes'] = max(record['peak_bytes'], peak - start_current)
+        if self._stack:
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+            tracemalloc.reset_peak()
+        elif self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+def profile_stage(profile, name):
+    """profile.stage(name), or a no-op context when profile is None"""
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+def profile_count(profile, key, value=1):
+    """profile.count(key, value), or nothing when profile is None"""
+    if profile is not None:
+        profile.count(key, value)
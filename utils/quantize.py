@@ -0,0 +1,101 @@
+"""
+Color quantization for multi-color tracing
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+# Pixels used to fit the k-means model; prediction still covers every pixel
+KMEANS_SAMPLE_SIZE = 100000
+KMEANS_PREDICT_CHUNK = 1000000
+
+# Pixels used to build the median-cut palette before mapping the full image
+MEDIANCUT_SAMPLE_SIZE = 65536
+
+
+def quantize_image(image_array, n_colors=8, method='mediancut'):
+    """
+    Reduce an image to at most n_colors flat colors
+
+    Args:
+        image_array: RGB image array (H, W, 3) or grayscale array (H, W)
+        n_colors: Maximum number of colors (2-256)
+        method: 'mediancut' (PIL, fast, deterministic) or 'kmeans'
+            (scikit-learn MiniBatchKMeans, slower, often cleaner on gradients)
+
+    Returns:
+        tuple: (labels, palette, counts)
+            - labels: uint8 array (H, W) with the palette index of each pixel,
+              renumbered so index 0 is the most frequent color
+            - palette: uint8 array (K, 3) of RGB colors
+            - counts: int64 array (K,) with the pixel count per color
+    """
+    if image_array.ndim == 2:
+        image_array = np.dstack([image_array] * 3)
+
+    if method == 'mediancut':
+        labels, palette = _quantize_mediancut(image_array, n_colors)
+    elif method == 'kmeans':
+        labels, palette = _quantize_kmeans(image_array, n_colors)
+    else:
+        raise ValueError(f"Unknown quantization method: {method}")
+
+    # Drop unused palette entries and order colors by frequency
+    histogram = cv2.calcHist([labels], [0], None, [256], [0, 256]).ravel()
+    counts = histogram[:len(palette)].astype(np.int64)
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0]
+    remap = np.zeros(256, dtype=np.uint8)
+    remap[order] = np.arange(len(order), dtype=np.uint8)
+
+    return cv2.LUT(labels, remap), palette[order], counts[order]
+
+
+def _quantize_mediancut(image_array, n_colors):
+    """
+    Median-cut quantization via PIL without dithering
+
+    The palette is built on a strided pixel sample (no averaging, so flat
+    logo colors survive exactly); every pixel is then mapped to its nearest
+    palette entry in one PIL pass.
+    """
+    h, w = image_array.shape[:2]
+    step = max(1, int(np.sqrt(h * w / MEDIANCUT_SAMPLE_SIZE)))
+    sample = Image.fromarray(np.ascontiguousarray(image_array[::step, ::step]))
+    palette_image = sample.quantize(
+        colors=n_colors,
+        method=Image.Quantize.MEDIANCUT,
+        dither=Image.Dither.NONE,
+    )
+    quantized = Image.fromarray(np.ascontiguousarray(image_array)).quantize(
+        palette=palette_image,
+        dither=Image.Dither.NONE,
+    )
+    labels = np.asarray(quantized)
+    palette = np.array(quantized.getpalette(), dtype=np.uint8).reshape(-1, 3)
+    return labels, palette
+
+
+def _quantize_kmeans(image_array, n_colors):
+    """K-means quantization fitted on a random pixel sample"""
+    try:
+        from sklearn.cluster import MiniBatchKMeans
+    except ImportError as e:
+        raise ImportError("k-means quantization requires scikit-learn (pip install scikit-learn)") from e
+
+    pixels = image_array.reshape(-1, 3)
+    rng = np.random.default_rng(0)
+    if len(pixels) > KMEANS_SAMPLE_SIZE:
+        sample = pixels[rng.choice(len(pixels), KMEANS_SAMPLE_SIZE, replace=False)]
+    else:
+        sample = pixels
+
+    model = MiniBatchKMeans(n_clusters=n_colors, random_state=0, n_init=3)
+    model.fit(sample.astype(np.float32))
+
+    labels = np.empty(len(pixels), dtype=np.uint8)
+    for start in range(0, len(pixels), KMEANS_PREDICT_CHUNK):
+        chunk = pixels[start:start + KMEANS_PREDICT_CHUNK].astype(np.float32)
+        labels[start:start + KMEANS_PREDICT_CHUNK] = model.predict(chunk)
+    palette = np.clip(np.rint(model.cluster_centers_), 0, 255).astype(np.uint8)
+    return labels.reshape(image_array.shape[:2]), palette
@@ -0,0 +1,106 @@
+"""
+Speck removal on binary masks and bulk culling of contours
+
+Noisy scans threshold into masks with thousands of isolated specks, each of
+which would become a contour to filter, simplify and sample. remove_specks
+cleans the mask before contours are found: connected components of ink
+(specks) and of paper (pinholes) below a minimum area are erased or filled,
+optionally after a morphological open and close. cull_contours tests the
+contours that remain as arrays (point counts, bounding boxes, shoelace
+areas) instead of one cv2 call per contour, so the per-contour work after it
+only sees contours that are kept.
+"""
+import cv2
+import numpy as np
+
+from .path_model import concat_ranges, offsets_from_counts
+
+
+def remove_specks(mask, min_area, kernel_size=0, out=None):
+    """
+    Erase foreground specks and fill background pinholes smaller than
+    min_area pixels
+
+    Specks are 8-connected, pinholes 4-connected (the background between
+    diagonally touching ink stays open, as in the contours). The optional
+    open and close also erase hairlines thinner than the kernel and merge
+    shapes closer than it, so it is off by default.
+
+    Args:
+        mask: uint8 or bool (H, W) mask, non-zero is foreground
+        min_area: Components with fewer pixels are removed (0: none)
+        kernel_size: Square open/close kernel applied first (0: none)
+        out: Optional uint8 (H, W) array to write the result into (may be
+            mask itself)
+
+    Returns:
+        tuple: (uint8 mask, 255 for foreground; specks erased; pinholes
+        filled)
+    """
+    mask = mask.view(np.uint8)
+    if kernel_size > 1:
+        kernel = np.ones((kernel_size, kernel_size), dtype=np.uint8)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, dst=out)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, dst=mask)
+    out = cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY, dst=out)[1]
+    if min_area <= 0:
+        return out, 0, 0
+
+    specks = _drop_components(out, out, min_area, 8, 0)
+    holes = _drop_components(cv2.bitwise_not(out), out, min_area, 4, 255)
+    return out, specks, holes
+
+
+def _drop_components(mask, out, min_area, connectivity, value):
+    """
+    Write mask to out (0/255) with its components below min_area set to
+    value and everything else to the opposite; returns their number
+    """
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=connectivity)
+    small = stats[:, cv2.CC_STAT_AREA] < min_area
+    small[0] = False  # label 0 is everything else
+    count = int(small.sum())
+    if count:
+        lut = np.where(small, value, 255 - value).astype(np.uint8)
+        lut[0] = value
+        np.take(lut, labels, out=out)
+    return count
+
+
+def cull_contours(contours, min_points=0, min_area=0):
+    """
+    Indices of the contours with more than min_points points that enclose
+    more than min_area (shoelace area, the same as cv2.contourArea)
+
+    The cheap tests run first: only contours with enough points have their
+    bounding box tested, and only those whose box is larger than min_area
+    have their area computed.
+
+    Returns:
+        np.ndarray: Ascending contour indices
+    """
+    if not len(contours):
+        return np.zeros(0, dtype=np.intp)
+    lengths = np.fromiter(map(len, contours), dtype=np.intp, count=len(contours))
+    kept = np.flatnonzero(lengths > min_points)
+    if not min_area or not len(kept):
+        return kept
+
+    points = np.concatenate([contours[i] for i in kept.tolist()]).reshape(-1, 2).astype(np.int64)
+    lengths = lengths[kept]
+    starts = offsets_from_counts(lengths)[:-1]
+    size = np.maximum.reduceat(points, starts, axis=0) - np.minimum.reduceat(points, starts, axis=0)
+    # A polygon never encloses more than its bounding box
+    boxed = np.flatnonzero(size[:, 0] * size[:, 1] > min_area)
+    if not len(boxed):
+        return kept[boxed]
+
+    points = points[concat_ranges(starts[boxed], lengths[boxed])]
+    lengths = lengths[boxed]
+    starts = offsets_from_counts(lengths)[:-1]
+    # Every point with the next one of its ring (the last with the first)
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    x, y = points[:, 0], points[:, 1]
+    areas = np.abs(np.add.reduceat(x * y[following] - x[following] * y, starts)) / 2
+    return kept[boxed[areas > min_area]]
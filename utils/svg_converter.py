@@ -1,167 +1,251 @@
 """
 SVG conversion functions - extracted from original png_to_svg_converter.py
 """
-import cv2
-import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 import io
-import base64
 
+from .image_io import image_to_array
+from .pipeline import get_pipeline
+from .profiling import profile_count, profile_stage
+from .svg_writer import iter_svg_embed, join_svg, write_svg
 
-def png_to_svg_trace(image_array, threshold=128, simplify=2, invert=False, background_color=None):
+# Encoded formats browsers display in <image>; these are embedded as-is
+EMBED_MIME_TYPES = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+# Explicit re-encode choices for embedding
+EMBED_REENCODE_FORMATS = {'png': 'PNG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+
+def png_to_svg_trace(image_array, threshold=128, simplify=2, invert=False, background_color=None,
+                     mode='threshold', n_colors=8, quantizer='mediancut', tile_size=None, profile=None,
+                     compact=False, max_edge=None, holes=False, curves=False, despeckle=0,
+                     despeckle_kernel=0):
     """
     Convert image to SVG using contour tracing
     
     Args:
         image_array: NumPy array of the image
-        threshold: Threshold value for binary conversion (0-255)
+        threshold: Threshold value for binary conversion (0-255), or
+            'otsu' / 'triangle' (chosen from the image histogram) or
+            'adaptive' (local mean, for unevenly lit scans)
         simplify: Simplification factor for contours
         invert: Whether to invert the binary threshold
         background_color: Optional background color for transparent images (hex string)
+        mode: 'threshold' (single binary layer) or 'quantize' (one layer per color)
+        n_colors: Number of colors for mode='quantize'
+        quantizer: 'mediancut' or 'kmeans' for mode='quantize'
+        tile_size: Trace mode='threshold' in tiles of this size to bound
+            memory (same output). None tiles only images above
+            TILED_TRACE_MIN_PIXELS, 0 never tiles.
+        profile: Optional utils.profiling.Profiler to record stage timings,
+            peak allocation and counts into
+        compact: Smaller SVG with relative path commands and one element
+            per fill color (same rendering)
+        max_edge: Trace a copy downscaled to this longest edge and scale
+            the paths back up (fast preview, same size and coordinates)
+        holes: Keep holes such as the counters of O and B: each outer
+            contour and its holes become one fill-rule="evenodd" path
+        curves: Cubic Béziers within simplify pixels of the contours
+            instead of polylines (smoother shapes, fewer points)
+        despeckle: Erase specks smaller than this many pixels from the
+            mask before tracing (0: off)
+        despeckle_kernel: Open and close the mask with a square kernel of
+            this many pixels before tracing, which also erases hairlines
+            thinner than it (0: off)
     
     Returns:
         tuple: (svg_content, num_contours)
     """
-    # Handle alpha channel if present
-    if image_array.shape[2] == 4 if len(image_array.shape) == 3 else False:
-        image_array = _handle_alpha_channel(image_array, background_color)
-    
-    # Convert to grayscale if needed
-    if len(image_array.shape) == 3:
-        gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = image_array
+    chunks, num_contours = iter_svg_trace(
+        image_array, threshold, simplify, invert, background_color, mode, n_colors, quantizer, tile_size,
+        profile, compact, max_edge, holes, curves, despeckle, despeckle_kernel
+    )
+    return join_svg(chunks), num_contours
+
+
+def write_svg_trace(image_array, sink, **trace_kwargs):
+    """
+    Trace an image and stream the SVG to a sink without building one str
     
-    # Auto-detect if image should be inverted
-    mean_val = gray.mean()
-    if mean_val < 127 and not invert:
-        invert = True
+    Args:
+        image_array: NumPy array of the image
+        sink: File-like object, primed generator or callable (see write_svg)
+        **trace_kwargs: Options as in png_to_svg_trace
     
-    # Apply threshold
-    if invert:
-        _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
-    else:
-        _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
-    
-    # Find contours
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Get image dimensions
-    height, width = binary.shape
-    
-    # Build SVG with multiple colors if original has colors
-    svg_paths = []
-    
-    # Detect colors from original image
-    if len(image_array.shape) == 3:
-        for contour in contours:
-            if len(contour) > simplify * 2:
-                # Simplify contour
-                epsilon = simplify
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                
-                # Get average color inside contour
-                mask = np.zeros(binary.shape, dtype=np.uint8)
-                cv2.drawContours(mask, [contour], -1, 255, -1)
-                mean_color = cv2.mean(image_array, mask=mask)[:3]
-                
-                # Build path data
-                path_data = f"M {approx[0][0][0]} {approx[0][0][1]}"
-                for point in approx[1:]:
-                    path_data += f" L {point[0][0]} {point[0][1]}"
-                path_data += " Z"
-                
-                # Convert color to hex
-                color_hex = '#{:02x}{:02x}{:02x}'.format(
-                    int(mean_color[0]), int(mean_color[1]), int(mean_color[2])
-                )
-                
-                svg_paths.append((path_data, color_hex))
-    else:
-        for contour in contours:
-            if len(contour) > simplify * 2:
-                epsilon = simplify
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                
-                path_data = f"M {approx[0][0][0]} {approx[0][0][1]}"
-                for point in approx[1:]:
-                    path_data += f" L {point[0][0]} {point[0][1]}"
-                path_data += " Z"
-                
-                svg_paths.append((path_data, "#000000"))
+    Returns:
+        tuple: (characters_written, num_contours)
+    """
+    chunks, num_contours = iter_svg_trace(image_array, **trace_kwargs)
+    return write_svg(chunks, sink), num_contours
+
+
+def iter_svg_trace(image_array, threshold=128, simplify=2, invert=False, background_color=None,
+                   mode='threshold', n_colors=8, quantizer='mediancut', tile_size=None, profile=None,
+                   compact=False, max_edge=None, holes=False, curves=False, despeckle=0,
+                   despeckle_kernel=0):
+    """
+    Trace an image and return the SVG as a lazy sequence of chunks
     
-    # Create SVG
-    svg = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
-'''
+    Args:
+        image_array: NumPy array of the image
+        threshold, simplify, invert, background_color, mode, n_colors, quantizer, tile_size,
+        profile, compact, max_edge, holes, curves, despeckle, despeckle_kernel: As in
+        png_to_svg_trace
     
-    for path_data, color in svg_paths:
-        svg += f'  <path d="{path_data}" fill="{color}" stroke="none"/>\n'
+    Returns:
+        tuple: (chunk_iterator, num_contours)
+    """
+    result = _trace(
+        image_array, threshold, simplify, invert, background_color, mode, n_colors, quantizer, tile_size,
+        profile, compact, max_edge, holes, curves, despeckle, despeckle_kernel
+    )
+    return result.chunks, result.num_contours
+
+
+def png_to_svg_trace_info(image_array, **trace_kwargs):
+    """
+    Trace an image like png_to_svg_trace and report what the trace chose
     
-    svg += '</svg>'
+    Args:
+        image_array: NumPy array of the image
+        **trace_kwargs: Options as in png_to_svg_trace
     
-    return svg, len(contours)
+    Returns:
+        tuple: (svg_content, num_contours, info); info['threshold'] is the
+        threshold used: the value 'otsu' or 'triangle' picked, the given
+        number, or None for 'adaptive' and mode='quantize'
+    """
+    result = _trace(image_array, **trace_kwargs)
+    return join_svg(result.chunks), result.num_contours, {'threshold': result.threshold}
 
 
-def png_to_svg_embed(image_array, preserve_alpha=True):
+def _trace(image_array, threshold=128, simplify=2, invert=False, background_color=None,
+           mode='threshold', n_colors=8, quantizer='mediancut', tile_size=None, profile=None,
+           compact=False, max_edge=None, holes=False, curves=False, despeckle=0, despeckle_kernel=0):
+    """ConversionPipeline.trace of the shared pipeline (a TraceResult)"""
+    return get_pipeline().trace(
+        image_array,
+        threshold=threshold,
+        simplify=simplify,
+        invert=invert,
+        background_color=background_color,
+        mode=mode,
+        n_colors=n_colors,
+        quantizer=quantizer,
+        tile_size=tile_size,
+        profile=profile,
+        compact=compact,
+        max_edge=max_edge,
+        holes=holes,
+        curves=curves,
+        despeckle=despeckle,
+        despeckle_kernel=despeckle_kernel,
+    )
+
+
+def png_to_svg_embed(image_array, preserve_alpha=True, profile=None):
     """
     Embed image as base64 in SVG (not true vectorization)
     
     Args:
         image_array: NumPy array of the image
         preserve_alpha: Whether to preserve alpha channel
+        profile: Optional Profiler (stages 'embed.encode' and 'embed.emit')
     
     Returns:
         str: SVG content with embedded image
     """
-    # Convert to PIL Image
-    pil_image = Image.fromarray(image_array)
-    
-    # Determine format based on alpha channel
-    has_alpha = pil_image.mode in ('RGBA', 'LA', 'PA')
-    img_format = "PNG" if (has_alpha and preserve_alpha) else "PNG"
-    
-    # Convert to base64
-    buffered = io.BytesIO()
-    pil_image.save(buffered, format=img_format)
-    img_base64 = base64.b64encode(buffered.getvalue()).decode()
+    with profile_stage(profile, 'embed.encode'):
+        # Convert to PIL Image
+        pil_image = Image.fromarray(image_array)
+        
+        # Determine format based on alpha channel
+        has_alpha = pil_image.mode in ('RGBA', 'LA', 'PA')
+        img_format = "PNG" if (has_alpha and preserve_alpha) else "PNG"
+        
+        buffered = io.BytesIO()
+        pil_image.save(buffered, format=img_format)
+        profile_count(profile, 'payload_bytes', buffered.tell())
     
     height, width = image_array.shape[:2]
-    
-    svg = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
-  <image width="{width}" height="{height}" xlink:href="data:image/png;base64,{img_base64}"/>
-</svg>'''
-    
-    return svg
+    return _emit_embed(iter_svg_embed(width, height, buffered.getbuffer()), profile)
 
 
-def _handle_alpha_channel(image_array, background_color=None):
+def prepare_embed(file_bytes, reencode=None, quality=90, png_level=6):
     """
-    Handle alpha channel in images
+    Choose the encoded bytes to embed for an image file
+    
+    PNG, JPEG and WebP files are passed through unchanged; decoding and
+    re-encoding only happens for other formats (BMP, TIFF, ...), for JPEGs
+    whose EXIF orientation would otherwise be lost, or when reencode asks
+    for it explicitly.
     
     Args:
-        image_array: RGBA image array
-        background_color: Background color to use (hex string or None for white)
+        file_bytes: Encoded image file
+        reencode: None (pass through when possible), 'png', 'jpeg' or 'webp'
+        quality: JPEG/WebP quality (1-100) when re-encoding
+        png_level: PNG compression level (0-9) when re-encoding
     
     Returns:
-        RGB image array
+        tuple: (payload, mime_type, width, height, passed_through)
     """
-    if background_color is None:
-        background_color = "#FFFFFF"
-    
-    # Convert hex to RGB
-    bg_color = tuple(int(background_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-    
-    # Create background
-    background = np.ones((image_array.shape[0], image_array.shape[1], 3), dtype=np.uint8)
-    background[:] = bg_color
+    image = Image.open(io.BytesIO(file_bytes))
+    width, height = image.size
+    if (reencode is None and image.format in EMBED_MIME_TYPES
+            and image.getexif().get(0x0112, 1) == 1):
+        return file_bytes, EMBED_MIME_TYPES[image.format], width, height, True
+    
+    img_format = EMBED_REENCODE_FORMATS[reencode or 'png']
+    pil_image = Image.fromarray(image_to_array(ImageOps.exif_transpose(image)))
+    width, height = pil_image.size
+    buffered = io.BytesIO()
+    if img_format == 'PNG':
+        pil_image.save(buffered, format='PNG', compress_level=png_level)
+    else:
+        if img_format == 'JPEG' and pil_image.mode not in ('L', 'RGB'):
+            # JPEG has no alpha channel
+            pil_image = pil_image.convert('L' if pil_image.mode == 'LA' else 'RGB')
+        elif pil_image.mode not in ('L', 'RGB', 'RGBA'):
+            pil_image = pil_image.convert('RGBA' if 'A' in pil_image.mode else 'RGB')
+        pil_image.save(buffered, format=img_format, quality=quality)
+    return buffered.getbuffer(), EMBED_MIME_TYPES[img_format], width, height, False
+
+
+def iter_svg_embed_file(file_bytes, profile=None, **embed_options):
+    """
+    Embed an image file in SVG without decoding it where possible
     
-    # Extract alpha channel
-    alpha = image_array[:, :, 3] / 255.0
+    Args:
+        file_bytes: Encoded image file
+        profile: Optional Profiler (stage 'embed.prepare')
+        **embed_options: reencode, quality, png_level as in prepare_embed
     
-    # Blend with background
-    for c in range(3):
-        background[:, :, c] = (alpha * image_array[:, :, c] + (1 - alpha) * background[:, :, c]).astype(np.uint8)
+    Returns:
+        tuple: (chunks, info) - an iterator of SVG str chunks and a dict with
+        'mime', 'payload_bytes' and 'passed_through'
+    """
+    with profile_stage(profile, 'embed.prepare'):
+        payload, mime, width, height, passed_through = prepare_embed(file_bytes, **embed_options)
+        profile_count(profile, 'payload_bytes', len(payload))
+        profile_count(profile, 'reencoded', int(not passed_through))
+    info = {'mime': mime, 'payload_bytes': len(payload), 'passed_through': passed_through}
+    return iter_svg_embed(width, height, payload, mime), info
+
+
+def file_to_svg_embed(file_bytes, profile=None, **embed_options):
+    """
+    Embed an image file as base64 in SVG (see prepare_embed)
     
-    return background
+    Returns:
+        str: SVG content with the embedded image
+    """
+    chunks, _ = iter_svg_embed_file(file_bytes, profile, **embed_options)
+    return _emit_embed(chunks, profile)
+
+
+def _emit_embed(chunks, profile):
+    """Base64-encode and join embed chunks as stage 'embed.emit'"""
+    with profile_stage(profile, 'embed.emit'):
+        svg = join_svg(chunks)
+        profile_count(profile, 'bytes', len(svg))
+    return svg
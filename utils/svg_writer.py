@@ -0,0 +1,353 @@
+"""
+Streaming SVG emitter for traced paths and embedded images
+
+Formats contour point arrays in bulk with NumPy and produces the document as a
+sequence of string chunks, so large traces never need quadratic string
+concatenation or one giant in-memory str.
+
+Rings are polygons, or mix lines with cubic Béziers ("C") when they come
+from utils.curve_fit. Besides the plain format (one absolute
+"M x y L x y ... Z" <path> per shape) there is a compact one: relative, implicit line commands with minimal
+separators and one element per fill color (see iter_svg_groups). Either can be
+gzip-compressed on the fly into .svgz with iter_svgz.
+"""
+import base64
+import zlib
+
+import numpy as np
+
+SVG_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
+'''
+SVG_FOOTER = '</svg>'
+
+EMBED_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
+  <image width="{width}" height="{height}" xlink:href="data:{mime};base64,'''
+EMBED_FOOTER = '''"/>
+</svg>'''
+
+# Number of paths formatted per NumPy batch and target size of emitted chunks
+PATH_BATCH_SIZE = 4096
+CHUNK_SIZE = 64 * 1024
+
+# zlib window bits for a gzip container (.svgz)
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Encoded bytes per base64 chunk; a multiple of 3, so the chunks concatenate
+# to the same text as encoding everything at once
+BASE64_BLOCK_SIZE = 48 * 1024
+
+
+def iter_path_data(contours, batch_size=PATH_BATCH_SIZE):
+    """
+    Yield SVG path data ("M x y L x y ... Z") for each contour
+
+    Coordinates of a whole batch of contours are converted to strings in one
+    NumPy operation; only the final per-path join happens in Python.
+
+    Args:
+        contours: Sequence of point arrays, shaped (N, 1, 2) or (N, 2)
+        batch_size: Number of contours formatted together
+
+    Yields:
+        str: Path data for each contour, in input order
+    """
+    for batch_start in range(0, len(contours), batch_size):
+        batch = contours[batch_start:batch_start + batch_size]
+        lengths = np.fromiter((len(c) for c in batch), dtype=np.intp, count=len(batch))
+        points = np.concatenate([np.asarray(c).reshape(-1, 2) for c in batch])
+        yield from format_rings(points, lengths)
+
+
+def format_rings(points, lengths, controls=None):
+    """
+    Path data of consecutive closed rings stored back to back
+
+    Args:
+        points: (P, 2) array of all ring points
+        lengths: Number of points of every ring (summing to P)
+        controls: Optional (P,) bool array marking Bézier control points
+            (see utils.path_model)
+
+    Returns:
+        list: "M x y L x y ... Z" per ring, with "C x y x y x y" for curves
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    if len(lengths) == 0:
+        return []
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    if controls is not None and controls.any():
+        return _format_curved_rings(points, lengths, starts, controls)
+
+    tokens = np.empty((len(points), 3), dtype=object)
+    tokens[:, 0] = 'L'
+    tokens[starts, 0] = 'M'
+    tokens[:, 1:] = points.astype(str)
+    flat = tokens.ravel().tolist()
+
+    return [
+        ' '.join(flat[start:start + length]) + ' Z'
+        for start, length in zip((starts * 3).tolist(), (lengths * 3).tolist())
+    ]
+
+
+def format_rings_compact(points, lengths, controls=None):
+    """
+    Compact path data of consecutive closed rings stored back to back
+
+    Every ring starts with an absolute moveto; the remaining points are
+    relative linetos after a single "l", separated by a space only where
+    the next number has no minus sign: "M10 10l0 49 49 0 0-49z". Curves are
+    relative "c" commands; a command letter is written only where the
+    segment type changes.
+
+    Args:
+        points: (P, 2) array of all ring points
+        lengths: Number of points of every ring (summing to P)
+        controls: Optional (P,) bool array marking Bézier control points
+
+    Returns:
+        list: Path data per ring
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    if len(lengths) == 0:
+        return []
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    if controls is not None and controls.any():
+        return _format_curved_rings_compact(points, lengths, starts, controls)
+
+    values = points.astype(np.int64)
+    values[1:] -= values[:-1].copy()
+    values[starts] = points[starts]  # ring starts stay absolute
+
+    tokens = np.empty((len(points), 4), dtype=object)
+    tokens[:, 1::2] = values.astype(str)
+    separators = np.where(values < 0, '', ' ')
+    tokens[:, 0] = separators[:, 0]
+    tokens[:, 2] = separators[:, 1]
+    tokens[starts, 0] = 'M'
+    second = starts[lengths > 1] + 1
+    tokens[second, 0] = 'l'
+    flat = tokens.ravel().tolist()
+
+    return [
+        ''.join(flat[start:start + length]) + 'z'
+        for start, length in zip((starts * 4).tolist(), (lengths * 4).tolist())
+    ]
+
+
+def _format_curved_rings(points, lengths, starts, controls):
+    """format_rings for rings with Bézier segments"""
+    after_control = np.zeros(len(points), dtype=bool)
+    after_control[1:] = controls[:-1]
+    prefixes = np.where(after_control, ' ', np.where(controls, ' C ', ' L ')).astype(object)
+    prefixes[starts] = 'M '
+
+    tokens = np.empty((len(points), 4), dtype=object)
+    tokens[:, 0] = prefixes
+    tokens[:, 1::2] = points.astype(str)
+    tokens[:, 2] = ' '
+    flat = tokens.ravel().tolist()
+
+    return [
+        ''.join(flat[start:start + length]) + ' Z'
+        for start, length in zip((starts * 4).tolist(), (lengths * 4).tolist())
+    ]
+
+
+def _format_curved_rings_compact(points, lengths, starts, controls):
+    """format_rings_compact for rings with Bézier segments"""
+    index = np.arange(len(points))
+    ring_start = np.zeros(len(points), dtype=bool)
+    ring_start[starts] = True
+    after_control = np.zeros(len(points), dtype=bool)
+    after_control[1:] = controls[:-1]
+
+    # Relative to the current point: the last point that is not a control
+    # point, also for both control points of a curve
+    current = np.maximum.accumulate(np.where(controls, 0, index))
+    values = points.astype(np.int64)
+    values[1:] -= values[current[:-1]]
+    values[starts] = points[starts]
+
+    # A letter where a segment (line point or first control point) differs
+    # in type from the previous segment of its ring
+    segments = np.flatnonzero(~after_control & ~ring_start)
+    curve = controls[segments]
+    ring = np.cumsum(ring_start)[segments]
+    new_type = np.ones(len(segments), dtype=bool)
+    new_type[1:] = (curve[1:] != curve[:-1]) | (ring[1:] != ring[:-1])
+    lettered = segments[new_type]
+
+    tokens = np.empty((len(points), 4), dtype=object)
+    tokens[:, 1::2] = values.astype(str)
+    separators = np.where(values < 0, '', ' ')
+    tokens[:, 0] = separators[:, 0]
+    tokens[:, 2] = separators[:, 1]
+    tokens[starts, 0] = 'M'
+    tokens[lettered, 0] = np.where(controls[lettered], 'c', 'l')
+    flat = tokens.ravel().tolist()
+
+    return [
+        ''.join(flat[start:start + length]) + 'z'
+        for start, length in zip((starts * 4).tolist(), (lengths * 4).tolist())
+    ]
+
+
+def iter_svg(width, height, paths, path_attrs='', background=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield an SVG document with one <path> per entry as string chunks
+
+    Args:
+        width: Document width in pixels
+        height: Document height in pixels
+        paths: Iterable of (path_data, fill_color) tuples
+        path_attrs: Extra attributes appended to every <path> (e.g. ' stroke="none"')
+        background: Optional fill color for a full-size background <rect>
+        chunk_size: Approximate size of each yielded chunk in characters
+
+    Yields:
+        str: Consecutive pieces of the document
+    """
+    head = SVG_HEADER.format(width=width, height=height)
+    if background is not None:
+        head += f'  <rect width="100%" height="100%" fill="{background}"/>\n'
+
+    buffer = [head]
+    buffered = len(head)
+    for path_data, color in paths:
+        element = f'  <path d="{path_data}" fill="{color}"{path_attrs}/>\n'
+        buffer.append(element)
+        buffered += len(element)
+        if buffered >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+
+    buffer.append(SVG_FOOTER)
+    yield ''.join(buffer)
+
+
+def iter_svg_groups(width, height, groups, path_attrs='', background=None, merge=True,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Yield a compact SVG document with one element per group of paths
+
+    Attributes shared by all paths are written once on an enclosing <g>,
+    and each fill color once per group.
+
+    Args:
+        width: Document width in pixels
+        height: Document height in pixels
+        groups: Iterable of (fill_color, list of path data) tuples
+        path_attrs: Attributes shared by all paths (e.g. ' stroke="none"')
+        background: Optional fill color of a full-size background <rect>
+        merge: Join each group into a single <path>; only valid if its
+            paths do not overlap (or use fill-rule evenodd on disjoint
+            compound paths). Otherwise every path keeps its own <path>
+            inside a <g fill>.
+        chunk_size: Approximate size of each yielded chunk in characters
+
+    Yields:
+        str: Consecutive pieces of the document
+    """
+    head = SVG_HEADER.format(width=width, height=height)
+    if background is not None:
+        head += f'<rect width="100%" height="100%" fill="{background}"/>\n'
+    buffer = [head]
+    buffered = len(head)
+    opened = not path_attrs
+    for color, path_data in groups:
+        if not opened:
+            # Shared attributes only once there is a path to apply them to
+            buffer.append(f'<g{path_attrs}>\n')
+            opened = True
+        if merge:
+            element = f'<path fill="{color}" d="{"".join(path_data)}"/>\n'
+        else:
+            element = f'<g fill="{color}">' + ''.join(f'<path d="{d}"/>' for d in path_data) + '</g>\n'
+        buffer.append(element)
+        buffered += len(element)
+        if buffered >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+
+    if path_attrs and opened:
+        buffer.append('</g>\n')
+    buffer.append(SVG_FOOTER)
+    yield ''.join(buffer)
+
+
+def iter_svgz(chunks, level=9):
+    """
+    Gzip SVG chunks on the fly (.svgz), one compressed piece per chunk
+
+    Args:
+        chunks: Iterable of str chunks (e.g. from iter_svg)
+        level: zlib compression level (1-9)
+
+    Yields:
+        bytes: Consecutive pieces of the gzip stream (some may be empty)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode('utf-8'))
+    yield compressor.flush()
+
+
+def iter_svg_embed(width, height, data, mime='image/png', block_size=BASE64_BLOCK_SIZE):
+    """
+    Yield an SVG document embedding encoded image bytes as a data: URI
+
+    The payload is base64-encoded block by block, so no second full-size
+    copy of it is built before writing.
+
+    Args:
+        width: Document width in pixels
+        height: Document height in pixels
+        data: Encoded image (bytes-like)
+        mime: MIME type of data, e.g. 'image/jpeg'
+        block_size: Encoded bytes per chunk (multiple of 3)
+
+    Yields:
+        str: Consecutive pieces of the document
+    """
+    yield EMBED_HEADER.format(width=width, height=height, mime=mime)
+    view = memoryview(data)
+    for start in range(0, len(view), block_size):
+        yield base64.b64encode(view[start:start + block_size]).decode('ascii')
+    yield EMBED_FOOTER
+
+
+def write_svg(chunks, sink):
+    """
+    Write SVG chunks to a sink as they are produced
+
+    Args:
+        chunks: Iterable of str chunks (e.g. from iter_svg), or bytes
+            chunks from iter_svgz for a binary sink
+        sink: File-like object with write(), a primed generator accepting
+            send(), or any callable taking one chunk
+
+    Returns:
+        int: Number of characters (bytes for bytes chunks) written
+    """
+    if hasattr(sink, 'write'):
+        emit = sink.write
+    elif hasattr(sink, 'send'):
+        emit = sink.send
+    else:
+        emit = sink
+
+    total = 0
+    for chunk in chunks:
+        emit(chunk)
+        total += len(chunk)
+    return total
+
+
+def join_svg(chunks):
+    """Assemble SVG chunks into a single str with one join"""
+    return ''.join(chunks)
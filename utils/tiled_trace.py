@@ -0,0 +1,327 @@
+"""
+Tiled threshold tracing for images too large to trace in one piece
+
+The image is thresholded, labelled and traced tile by tile. Shapes that
+cross a tile border are merged with a union-find over the seam pixels and
+traced again as one closed path on their own bounding box, so the result
+matches a whole-image ``cv2.RETR_EXTERNAL`` trace contour for contour.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .color_sampling import sample_contour_colors, color_to_hex
+from .speck_filter import cull_contours
+
+DEFAULT_TILE_SIZE = 2048
+
+def trace_tiled(image_array, threshold=128, simplify=2, invert=False, prepare=None,
+                tile_size=DEFAULT_TILE_SIZE, max_workers=None, auto_invert=True):
+    """
+    Trace the outer contours of a thresholded image tile by tile
+
+    Working memory is bounded by the tile size (times the number of
+    workers); only a shape that crosses tile borders is re-traced on its own
+    bounding box.
+
+    Args:
+        image_array: RGB (H, W, 3) or grayscale (H, W) image array, or any
+            array prepare() turns into one
+        threshold: Threshold value for binary conversion (0-255)
+        simplify: Simplification factor for contours
+        invert: Whether to invert the binary threshold (auto-enabled for
+            dark images, as in png_to_svg_trace)
+        prepare: Optional callable applied to every image region before
+            thresholding, e.g. alpha compositing
+        tile_size: Edge length of the square tiles in pixels
+        max_workers: Threads tracing tiles concurrently (default: CPU count)
+        auto_invert: Enable invert for dark images (mean below 127); off
+            when the caller has decided
+
+    Returns:
+        tuple: (approx_contours, colors, num_contours) in the same order as
+            a whole-image trace
+    """
+    tracer = _TiledTracer(image_array, threshold, simplify, invert, prepare, tile_size, auto_invert)
+    workers = max_workers or os.cpu_count() or 1
+    # OpenCV releases the GIL, so tiles trace concurrently in threads
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return tracer.run(executor)
+
+
+class _TiledTracer:
+    """State shared by the passes of one tiled trace"""
+
+    def __init__(self, image_array, threshold, simplify, invert, prepare, tile_size, auto_invert=True):
+        self.image_array = image_array
+        self.threshold = threshold
+        self.simplify = simplify
+        self.invert = invert
+        self.auto_invert = auto_invert
+        self.prepare = prepare
+        self.height, self.width = image_array.shape[:2]
+        self.tiles = [
+            (y, x, min(tile_size, self.height - y), min(tile_size, self.width - x))
+            for y in range(0, self.height, tile_size)
+            for x in range(0, self.width, tile_size)
+        ]
+        self.seeds = None
+        self.seed_order = None
+        self.seed_rows = None
+
+    def run(self, executor):
+        # Pass 1: global mean for the auto-invert decision
+        if not self.invert and self.auto_invert:
+            total = sum(executor.map(self._gray_sum, self.tiles))
+            self.invert = total / (self.height * self.width) < 127
+
+        # Pass 2: trace every tile and merge shapes across seams
+        union = _UnionFind()
+        seeds = []   # first pixel (y, x) of every candidate shape
+        paths = []   # (approx or None, color) per candidate
+        parts = []   # (global id, seed, bbox, approx, color) of shapes touching a seam
+        offset = 0
+        row_above = None  # bottom-row ids of the previous tile row
+        row = None
+        left = None
+
+        for (y0, x0, h, w), result in zip(self.tiles, executor.map(self._trace_tile, self.tiles)):
+            if x0 == 0:
+                if row is not None:
+                    if row_above is not None:
+                        _union_pairs(union, _seam_pairs(row_above, row[0]))
+                    row_above = row[1]
+                row = (np.zeros(self.width, np.int64), np.zeros(self.width, np.int64))
+                left = None
+
+            strips = {name: _to_global(ids, offset) for name, ids in result['strips'].items()}
+            row[0][x0:x0 + w] = strips['top']
+            row[1][x0:x0 + w] = strips['bottom']
+            if left is not None:
+                _union_pairs(union, _seam_pairs(left, strips['left']))
+            left = strips['right']
+
+            seeds.append(result['seeds'])
+            paths.extend(result['paths'])
+            for label, seed, bbox, approx, color in result['parts']:
+                parts.append((label + offset, seed, bbox, approx, color))
+            offset += result['count']
+
+        if row_above is not None:
+            _union_pairs(union, _seam_pairs(row_above, row[0]))
+
+        components = {}
+        for part in parts:
+            components.setdefault(union.find(part[0]), []).append(part)
+
+        spanning = []
+        singles = []
+        for group in components.values():
+            if len(group) == 1:
+                _, seed, _, approx, color = group[0]
+                singles.append(seed)
+                paths.append((approx, color))
+                continue
+            bx0 = min(part[2][0] for part in group)
+            by0 = min(part[2][1] for part in group)
+            bx1 = max(part[2][0] + part[2][2] for part in group)
+            by1 = max(part[2][1] + part[2][3] for part in group)
+            spanning.append((min(part[1] for part in group), (bx0, by0, bx1 - bx0, by1 - by0)))
+
+        seeds.append(np.array(singles + [seed for seed, _ in spanning], dtype=np.int64).reshape(-1, 2))
+        self.seeds = np.concatenate(seeds)
+        self.seed_order = np.lexsort((self.seeds[:, 1], self.seeds[:, 0]))
+        self.seed_rows = self.seeds[self.seed_order, 0]
+
+        # Pass 3: shapes crossing seams become one path traced on their bbox;
+        # every candidate inside one of their holes is not an outer contour
+        nested = np.zeros(len(self.seeds), dtype=bool)
+        for approx, color, inside in executor.map(self._trace_spanning, spanning):
+            paths.append((approx, color))
+            nested[inside] = True
+
+        # findContours lists contours in reverse raster order of their first pixel
+        order = self.seed_order[~nested[self.seed_order]][::-1]
+        kept = [paths[i] for i in order if paths[i][0] is not None]
+        return [approx for approx, _ in kept], [color for _, color in kept], len(order)
+
+    def _gray(self, x, y, w, h):
+        """Image region (prepared) and its grayscale version"""
+        region = self.image_array[y:y + h, x:x + w]
+        if self.prepare is not None:
+            region = self.prepare(region)
+        gray = cv2.cvtColor(region, cv2.COLOR_RGB2GRAY) if region.ndim == 3 else region
+        return region, gray
+
+    def _region(self, x, y, w, h):
+        """Image region (prepared) and its thresholded binary mask"""
+        region, gray = self._gray(x, y, w, h)
+        mode = cv2.THRESH_BINARY_INV if self.invert else cv2.THRESH_BINARY
+        _, binary = cv2.threshold(gray, self.threshold, 255, mode)
+        return region, binary
+
+    def _gray_sum(self, tile):
+        y, x, h, w = tile
+        # Exact integer sum, so the mean equals gray.mean() of the whole image
+        return int(self._gray(x, y, w, h)[1].sum(dtype=np.int64))
+
+    def _trace_tile(self, tile):
+        """
+        Trace the outer contours of one tile
+
+        Every outer contour of the whole image is either an outer contour of
+        its tile or belongs to a shape touching a seam, so RETR_EXTERNAL per
+        tile finds all candidates. Shapes touching a seam are labelled on
+        the tile border for merging; everything else is final unless it
+        turns out to sit in the hole of a merged shape.
+        """
+        y0, x0, h, w = tile
+        region, binary = self._region(x0, y0, w, h)
+        contours, _ = cv2.findContours(
+            binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0)
+        )
+        del binary
+
+        kept = cull_contours(contours, self.simplify * 2).tolist()
+        approxes = {i: cv2.approxPolyDP(contours[i], self.simplify, True) for i in kept}
+        colors = {}
+        if region.ndim == 3 and kept:
+            local = [contours[i] - (x0, y0) for i in kept]
+            mean_colors = sample_contour_colors(region, local, disjoint=True)
+            colors = {i: color_to_hex(color) for i, color in zip(kept, mean_colors)}
+        del region
+
+        # Bounding boxes and first points of all contours in one go
+        starts = np.cumsum([0] + [len(contour) for contour in contours[:-1]])
+        points = np.concatenate(contours).reshape(-1, 2) if contours else np.zeros((0, 2), np.int32)
+        lo = np.minimum.reduceat(points, starts, axis=0) if contours else points
+        hi = np.maximum.reduceat(points, starts, axis=0) if contours else points
+        first = points[starts].astype(np.int64) if contours else points.astype(np.int64)
+
+        # Shapes reaching a tile edge shared with another tile
+        on_seam = np.zeros(len(contours), dtype=bool)
+        if x0 > 0:
+            on_seam |= lo[:, 0] == x0
+        if y0 > 0:
+            on_seam |= lo[:, 1] == y0
+        if x0 + w < self.width:
+            on_seam |= hi[:, 0] == x0 + w - 1
+        if y0 + h < self.height:
+            on_seam |= hi[:, 1] == y0 + h - 1
+
+        # Filled outer contours label the border pixels of their shape
+        labels = np.zeros((h, w), dtype=np.int32)
+        paths = [(approxes.get(i), colors.get(i, "#000000")) for i in range(len(contours))]
+        parts = []
+        for i in np.flatnonzero(on_seam).tolist():
+            cv2.drawContours(labels, [contours[i]], -1, i + 1, -1, offset=(-x0, -y0))
+            (sx, sy), (bx0, by0), (bx1, by1) = first[i].tolist(), lo[i].tolist(), hi[i].tolist()
+            parts.append((i + 1, (sy, sx), (bx0, by0, bx1 - bx0 + 1, by1 - by0 + 1)) + paths[i])
+        interior = np.flatnonzero(~on_seam)
+
+        return {
+            'count': len(contours),
+            'seeds': first[interior, ::-1],
+            'paths': [paths[i] for i in interior.tolist()],
+            'parts': parts,
+            'strips': {
+                'top': labels[0].copy(),
+                'bottom': labels[-1].copy(),
+                'left': labels[:, 0].copy(),
+                'right': labels[:, -1].copy(),
+            },
+        }
+
+    def _trace_spanning(self, item):
+        """
+        Trace one shape that crosses tile borders on its bounding box
+
+        Returns:
+            tuple: (approx or None, color, indices of candidate shapes whose
+                first pixel lies in one of this shape's holes)
+        """
+        (sy, sx), (x, y, w, h) = item
+        region, binary = self._region(x, y, w, h)
+        mask = np.zeros((h + 2, w + 2), dtype=np.uint8)
+        cv2.floodFill(
+            binary, mask, (sx - x, sy - y), 0,
+            flags=8 | cv2.FLOODFILL_MASK_ONLY | (255 << 8)
+        )
+        del binary
+
+        # floodFill marks the mask border with 1; clear it and flood the
+        # outside (4-connected) so only the shape (255) and its holes (0) remain
+        mask[mask == 1] = 0
+        cv2.floodFill(mask, None, (0, 0), 128)
+
+        lo, hi = np.searchsorted(self.seed_rows, [y, y + h])
+        candidates = self.seed_order[lo:hi]
+        cx = self.seeds[candidates, 1]
+        candidates = candidates[(cx >= x) & (cx < x + w)]
+        in_hole = mask[self.seeds[candidates, 0] - y + 1, self.seeds[candidates, 1] - x + 1] == 0
+        inside = candidates[in_hole]
+
+        cv2.threshold(mask, 254, 255, cv2.THRESH_BINARY, dst=mask)
+        contours, _ = cv2.findContours(
+            mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x - 1, y - 1)
+        )
+        contour = contours[0]
+        if len(contour) <= self.simplify * 2:
+            return None, None, inside
+
+        color = "#000000"
+        if region.ndim == 3:
+            # Same as sample_contour_colors on the bbox, reusing the mask buffer
+            mask[:] = 0
+            cv2.drawContours(mask, [contour], -1, 255, -1, offset=(1 - x, 1 - y))
+            color = color_to_hex(cv2.mean(region, mask=mask[1:-1, 1:-1])[:3])
+        return cv2.approxPolyDP(contour, self.simplify, True), color, inside
+
+
+class _UnionFind:
+    """Union-find over component ids; ids never merged cost nothing"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        root = x
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while x != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def _to_global(labels, offset):
+    """Shift local labels to global ids, keeping 0 for background"""
+    labels = labels.astype(np.int64)
+    labels[labels > 0] += offset
+    return labels
+
+
+def _seam_pairs(a, b):
+    """
+    Unique id pairs of foreground pixels touching across a seam
+
+    Foreground is 8-connected in cv2.findContours, so diagonal neighbours
+    touch as well.
+    """
+    pairs = []
+    for p, q in ((a, b), (a[:-1], b[1:]), (a[1:], b[:-1])):
+        touching = (p > 0) & (q > 0)
+        pairs.append((p[touching] << 32) | q[touching])
+    pairs = np.unique(np.concatenate(pairs))
+    return np.stack([pairs >> 32, pairs & 0xFFFFFFFF], axis=1)
+
+
+def _union_pairs(union_find, pairs):
+    for a, b in pairs.tolist():
+        union_find.union(a, b)
@@ -0,0 +1,115 @@
+"""
+Memo of intermediate trace products for interactive re-tracing
+
+When only threshold or simplify change between two traces of the same image
+(a slider in the Streamlit app), most of the pipeline's work repeats. A
+TraceMemo keeps the products of the expensive stages, keyed by the image
+content and by the parameters each product depends on:
+
+    rgb       composited RGB image          background_color
+    gray      grayscale plane (and mean)    background_color
+    histogram sampled grayscale histogram   background_color
+    contours  raw contours                  + threshold, invert, retrieval, despeckle, kernel
+    colors    mean color per raw contour    + threshold, invert, retrieval, despeckle, kernel
+    labels    quantized labels and palette  background_color, n_colors, quantizer
+    layers    contours of every color layer + despeckle, kernel
+
+so a simplify change only re-runs Douglas-Peucker and emission and a
+threshold change starts at the binarization (an automatic threshold reuses
+the histogram). Tiled traces are not memoized.
+Memoized products are shared between traces and must not be modified.
+"""
+import sys
+import threading
+
+import numpy as np
+
+from .lru import ByteLRU, DigestMemo
+
+DEFAULT_TRACE_MEMO_BYTES = 512 * 1024 * 1024
+
+
+class TraceMemo:
+    """Thread-safe LRU of intermediate trace products, bounded by bytes"""
+
+    def __init__(self, max_bytes=DEFAULT_TRACE_MEMO_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = ByteLRU(max_bytes, _nbytes)
+        self._lock = threading.Lock()
+        self._digest = DigestMemo()
+
+    def image_key(self, image_array):
+        """
+        Content key of an image
+
+        The last image is remembered by identity, so re-tracing the same
+        array only hashes it once; do not modify an array in place between
+        traces.
+        """
+        return self._digest(image_array)
+
+    def get(self, key):
+        """Memoized value, or None"""
+        found, value = self._entries.get(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used ones over max_bytes"""
+        self._entries.put(key, value)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'memory_bytes': self._entries.nbytes,
+                'memory_max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        """Drop all products and reset counters"""
+        self._entries.clear()
+        self._digest.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+def _nbytes(value):
+    """Memory held by arrays, contour lists and small tuples"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+
+_default_memo = None
+
+
+def get_trace_memo():
+    """Process-wide memo used by pipelines without their own, or None (off)"""
+    return _default_memo
+
+
+def configure_trace_memo(max_bytes=DEFAULT_TRACE_MEMO_BYTES):
+    """
+    Enable (or resize) the process-wide memo; 0 turns it off
+
+    Off by default: batch conversions never revisit an image, and a memo
+    keeps products of recent images alive. Interactive front ends enable it.
+
+    Returns:
+        TraceMemo or None
+    """
+    global _default_memo
+    _default_memo = TraceMemo(max_bytes) if max_bytes else None
+    return _default_memo
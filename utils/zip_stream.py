@@ -0,0 +1,145 @@
+"""
+Streaming ZIP archive writer for batch results
+
+Entries are compressed while they are added and the archive bytes are handed
+to a file or a callback as soon as they exist, so a batch never holds more
+than one entry (and zlib's window) in memory and a download can start before
+the last image is converted. Archives written to a non-seekable sink use data
+descriptors (sizes after each entry), which every unzip tool reads.
+"""
+import time
+import zipfile
+
+# Bytes read per block when archiving files from disk
+FILE_BLOCK_SIZE = 1024 * 1024
+
+DEFAULT_COMPRESSLEVEL = 6
+
+
+class ZipStreamWriter:
+    """
+    Write a ZIP archive entry by entry to a file or a chunk callback
+
+    Usable as a context manager; the central directory is written by close().
+    """
+
+    def __init__(self, sink, compresslevel=DEFAULT_COMPRESSLEVEL):
+        """
+        Args:
+            sink: Binary file-like object with write(), or a callable taking
+                each bytes chunk of the archive
+            compresslevel: Deflate level 1-9, or 0 to store entries
+                uncompressed
+        """
+        if not 0 <= compresslevel <= 9:
+            raise ValueError(f"Invalid ZIP compression level: {compresslevel}")
+        if not hasattr(sink, 'write'):
+            sink = _CallbackSink(sink)
+        self.compression = zipfile.ZIP_DEFLATED if compresslevel else zipfile.ZIP_STORED
+        self.entries = 0
+        self._zip = zipfile.ZipFile(
+            sink, 'w', self.compression, compresslevel=compresslevel or None
+        )
+
+    def add(self, name, data):
+        """
+        Add one entry
+
+        Args:
+            name: Path of the entry inside the archive
+            data: str or bytes, or an iterable of str/bytes chunks (e.g. the
+                chunks of utils.svg_writer.iter_svg), written as they come
+        """
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self.compression
+        info.external_attr = 0o644 << 16
+        if isinstance(data, (str, bytes)):
+            data = (data,)
+        with self._zip.open(info, 'w') as entry:
+            for chunk in data:
+                entry.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        self.entries += 1
+
+    def add_file(self, path, name):
+        """Add a file from disk as entry name, reading it block by block"""
+        with open(path, 'rb') as f:
+            self.add(name, iter(lambda: f.read(FILE_BLOCK_SIZE), b''))
+
+    def add_result(self, result):
+        """
+        Add one batch result (filename, svg_content, success, error)
+
+        Successful conversions become "<stem>.svg", failures an
+        "<stem>_ERROR.txt" with the error message.
+        """
+        filename, svg_content, success, error = result
+        stem = filename.rsplit('.', 1)[0]
+        if success:
+            self.add(stem + '.svg', svg_content)
+        else:
+            self.add(stem + '_ERROR.txt', f"Conversion failed: {error}")
+
+    def close(self):
+        """Write the central directory; the sink itself is not closed"""
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_zip(results, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """
+    Yield a ZIP archive of batch results as bytes chunks
+
+    Results are consumed lazily (e.g. straight from iter_batch), and the
+    compressed bytes of each entry are yielded once it is complete.
+
+    Args:
+        results: Iterable of (filename, svg_content, success, error) tuples
+        compresslevel: Deflate level 1-9, or 0 to store
+
+    Yields:
+        bytes: Consecutive pieces of the archive
+    """
+    pending = []
+    with ZipStreamWriter(pending.append, compresslevel) as archive:
+        for result in results:
+            archive.add_result(result)
+            yield b''.join(pending)
+            pending.clear()
+    yield b''.join(pending)
+
+
+def write_zip(results, sink, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """
+    Stream a ZIP archive of batch results to a file or callback
+
+    Returns:
+        int: Number of entries written
+    """
+    with ZipStreamWriter(sink, compresslevel) as archive:
+        for result in results:
+            archive.add_result(result)
+        return archive.entries
+
+
+class _CallbackSink:
+    """Minimal non-seekable file object handing every write to a callback"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.position = 0
+
+    def write(self, data):
+        self.callback(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass